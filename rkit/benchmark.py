@@ -0,0 +1,667 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+"""
+CPU-runnable benchmark suite for rkit.
+
+Every benchmark runs on synthetic, seeded inputs. Predictor stages use small stand-in networks
+with random weights in place of the real checkpoints, so the numbers track the cost of rkit's own
+pre/post-processing and data movement rather than the published models. Results are plain dicts
+(JSON-serializable) and can be compared against a stored baseline:
+
+    suite = default_suite(seed=0)
+    results = suite.run(repeat=20)
+    regressions = compare(results, load_results('baseline.json'))
+"""
+
+import os
+import gc
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+import torch
+from PIL import Image as PILImg
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_scene(rng, height=480, width=640, num_objects=10):
+    """
+    Random tabletop-like scene: an RGB image with rectangular objects, their label map, boxes,
+    masks and a depth map with missing (zero) readings.
+
+    Args:
+        rng (numpy.random.Generator): Source of randomness.
+        height (int): Image height. Default is 480.
+        width (int): Image width. Default is 640.
+        num_objects (int): Number of objects. Default is 10.
+
+    Returns:
+        dict: 'image' ([H, W, 3] uint8), 'label' ([H, W] int32, 0 background), 'boxes' ([N, 4]
+            float32 xyxy), 'masks' ([N, H, W] bool) and 'depth' ([H, W] float32 metres).
+    """
+    image = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+    label = np.zeros((height, width), dtype=np.int32)
+    depth = rng.uniform(0.8, 1.2, (height, width)).astype(np.float32)
+    boxes = []
+    for k in range(num_objects):
+        bw, bh = rng.integers(width // 12, width // 4), rng.integers(height // 12, height // 4)
+        x0, y0 = rng.integers(0, width - bw), rng.integers(0, height - bh)
+        label[y0:y0 + bh, x0:x0 + bw] = k + 1
+        image[y0:y0 + bh, x0:x0 + bw] = rng.integers(64, 256, 3, dtype=np.uint8)
+        depth[y0:y0 + bh, x0:x0 + bw] -= rng.uniform(0.05, 0.3)
+        boxes.append([x0, y0, x0 + bw, y0 + bh])
+    depth[rng.random((height, width)) < 0.05] = 0
+    masks = np.stack([label == k + 1 for k in range(num_objects)]) if num_objects else np.zeros((0, height, width), bool)
+    return {"image": image, "label": label, "boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+            "masks": masks, "depth": depth}
+
+
+def _synchronize(device):
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def measure(fn, repeat=20, warmup=2, items=1, device="cpu"):
+    """
+    Time fn() and record its peak memory.
+
+    Latency is measured over `repeat` calls after `warmup` calls, with the device synchronized
+    around every call. Peak CPU memory is taken from tracemalloc (Python and numpy allocations)
+    in one extra call, so tracing does not distort the timings; peak GPU memory comes from the
+    CUDA caching allocator.
+
+    Args:
+        fn (callable): Zero-argument function to benchmark.
+        repeat (int): Timed calls. Default is 20.
+        warmup (int): Untimed calls before timing. Default is 2.
+        items (int): Items processed per call, for throughput. Default is 1.
+        device (str): Device to synchronize. Default is "cpu".
+
+    Returns:
+        dict: Latency percentiles and mean in ms, throughput in items/s, peak_cpu_mb, peak_gpu_mb.
+    """
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    for _ in range(repeat):
+        _synchronize(device)
+        start = time.perf_counter()
+        fn()
+        _synchronize(device)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = 1000.0 * np.array(latencies)
+
+    gc.collect()
+    on_gpu = str(device).startswith("cuda")
+    if on_gpu:
+        torch.cuda.reset_peak_memory_stats()
+    tracemalloc.start()
+    fn()
+    _, peak_cpu = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items": items,
+        "repeat": repeat,
+        "latency_ms_mean": float(latencies_ms.mean()),
+        "latency_ms_min": float(latencies_ms.min()),
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)),
+        "latency_ms_p90": float(np.percentile(latencies_ms, 90)),
+        "latency_ms_p99": float(np.percentile(latencies_ms, 99)),
+        "throughput_per_s": float(items * 1000.0 / latencies_ms.mean()),
+        "peak_cpu_mb": peak_cpu / 2**20,
+        "peak_gpu_mb": torch.cuda.max_memory_allocated() / 2**20 if on_gpu else None,
+    }
+
+
+class BenchmarkSuite(object):
+    """
+    A named collection of benchmarks.
+
+    Each benchmark is registered with a factory that builds its inputs and returns the zero-argument
+    function to time. Factories run lazily inside run(), so a benchmark whose optional dependencies
+    are missing (ImportError) is reported as skipped instead of breaking the whole suite. Any other
+    exception is reported as an error, which compare() treats as a regression.
+
+    Attributes:
+        device (str): Device the benchmarks run on.
+        seed (int): Seed for synthetic inputs.
+        benchmarks (dict): Name -> (group, factory, items).
+    """
+
+    def __init__(self, device="cpu", seed=0):
+        self.device = device
+        self.seed = seed
+        self.benchmarks = {}
+        self._temp_dirs = []
+
+    def temp_dir(self, prefix="rkit_bench_"):
+        """
+        Temporary directory for benchmark inputs, removed by cleanup().
+        """
+        path = tempfile.mkdtemp(prefix=prefix)
+        self._temp_dirs.append(path)
+        return path
+
+    def cleanup(self):
+        for path in self._temp_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+        self._temp_dirs = []
+
+    def add(self, name, group, factory, items=1):
+        """
+        Register a benchmark.
+
+        Args:
+            name (str): Unique benchmark name, e.g. 'utils.combine_masks'.
+            group (str): Group used for selection, e.g. 'utils'.
+            factory (callable): Called with a numpy Generator seeded from self.seed; returns the function to time.
+            items (int): Items processed per call. Default is 1.
+        """
+        self.benchmarks[name] = (group, factory, items)
+
+    def run(self, groups=None, names=None, repeat=20, warmup=2):
+        """
+        Run the selected benchmarks.
+
+        Args:
+            groups (list, optional): Only run benchmarks in these groups.
+            names (list, optional): Only run benchmarks whose name contains one of these strings.
+            repeat (int): Timed calls per benchmark. Default is 20.
+            warmup (int): Untimed calls per benchmark. Default is 2.
+
+        Returns:
+            dict: 'meta' (environment and settings) and 'results' (name -> measure() stats plus
+                'group', {'group', 'skipped': reason} for a missing optional dependency, or
+                {'group', 'error': reason} for any other failure).
+        """
+        torch.manual_seed(self.seed)
+        results = {}
+        for name, (group, factory, items) in self.benchmarks.items():
+            if groups and group not in groups:
+                continue
+            if names and not any(n in name for n in names):
+                continue
+            try:
+                fn = factory(np.random.default_rng(self.seed))
+                with torch.no_grad():
+                    stats = measure(fn, repeat=repeat, warmup=warmup, items=items, device=self.device)
+            except ImportError as e:
+                logger.warning(f"Skipping benchmark {name}: {e!r}")
+                results[name] = {"group": group, "skipped": repr(e)}
+                continue
+            except Exception as e:
+                logger.error(f"Benchmark {name} failed: {e!r}")
+                results[name] = {"group": group, "error": repr(e)}
+                continue
+            results[name] = dict(stats, group=group)
+            logger.info(f"{name:>40s}: p50 {stats['latency_ms_p50']:9.3f} ms  {stats['throughput_per_s']:9.1f} items/s  "
+                        f"peak {stats['peak_cpu_mb']:7.1f} MB")
+
+        meta = {
+            "device": self.device,
+            "seed": self.seed,
+            "repeat": repeat,
+            "warmup": warmup,
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "num_threads": torch.get_num_threads(),
+        }
+        return {"meta": meta, "results": results}
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=0.2, memory_tolerance=0.2, min_delta_ms=0.1, metric="latency_ms_p50"):
+    """
+    Compare benchmark results against a baseline.
+
+    Args:
+        results (dict): Output of BenchmarkSuite.run.
+        baseline (dict): A stored output of BenchmarkSuite.run.
+        tolerance (float): Allowed relative latency increase. Default is 0.2.
+        memory_tolerance (float): Allowed relative peak CPU memory increase. Default is 0.2.
+        min_delta_ms (float): Latency increases smaller than this are timer noise, never regressions. Default is 0.1.
+        metric (str): Latency statistic to compare. Default is 'latency_ms_p50'.
+
+    Returns:
+        dict: 'rows' (one per benchmark measured in both, with baseline, current and ratio),
+            'regressions' (names of rows over tolerance, plus benchmarks measured in the baseline
+            that are now skipped or failed), 'failed' (those skipped or failed benchmarks) and
+            'missing' (baseline benchmarks not run).
+    """
+    rows, regressions, failed = [], [], []
+    current, previous = results["results"], baseline["results"]
+    for name, stats in current.items():
+        base = previous.get(name)
+        if base is None or "skipped" in base or "error" in base:
+            continue
+        if "skipped" in stats or "error" in stats:
+            failed.append(name)
+            regressions.append(name)
+            continue
+        ratio = stats[metric] / max(base[metric], 1e-9)
+        memory_ratio = (stats["peak_cpu_mb"] + 1e-3) / (base["peak_cpu_mb"] + 1e-3)
+        slower = ratio > 1 + tolerance and stats[metric] - base[metric] > min_delta_ms
+        regressed = slower or memory_ratio > 1 + memory_tolerance
+        rows.append({"name": name, "baseline": base[metric], "current": stats[metric], "ratio": ratio,
+                     "memory_ratio": memory_ratio, "regressed": regressed})
+        if regressed:
+            regressions.append(name)
+    missing = [name for name in previous if name not in current]
+    return {"metric": metric, "rows": rows, "regressions": regressions, "failed": failed, "missing": missing}
+
+
+class StandInDepthModel(torch.nn.Module):
+    """
+    Tiny stand-in for the Depth Anything network: 14x14 patch embedding, one conv block and a
+    depth head, returning an object with predicted_depth at the input resolution like the HF model.
+    """
+
+    def __init__(self, width=32):
+        super(StandInDepthModel, self).__init__()
+        self.patch = torch.nn.Conv2d(3, width, kernel_size=14, stride=14)
+        self.block = torch.nn.Conv2d(width, width, kernel_size=3, padding=1)
+        self.head = torch.nn.Conv2d(width, 1, kernel_size=1)
+
+    def forward(self, pixel_values):
+        x = torch.relu(self.block(self.patch(pixel_values)))
+        depth = torch.nn.functional.interpolate(self.head(x), size=pixel_values.shape[-2:], mode="bilinear", align_corners=False)
+        return SimpleNamespace(predicted_depth=torch.relu(depth[:, 0]))
+
+
+class StandInClipModel(torch.nn.Module):
+    """
+    Tiny stand-in for a CLIP model exposing encode_image, visual.input_resolution and dtype.
+    """
+
+    def __init__(self, input_resolution=224, embed_dim=512, width=64):
+        super(StandInClipModel, self).__init__()
+        self.visual = torch.nn.Conv2d(3, width, kernel_size=16, stride=16)
+        self.visual.input_resolution = input_resolution
+        self.proj = torch.nn.Linear(width, embed_dim)
+
+    @property
+    def dtype(self):
+        return self.proj.weight.dtype
+
+    def encode_image(self, images):
+        return self.proj(self.visual(images.to(self.dtype)).mean(dim=(2, 3)))
+
+
+class StandInDetector(object):
+    """
+    Stand-in for GroundingDINOObjectPredictor returning fixed normalized cxcywh boxes.
+    """
+
+    def __init__(self, scene):
+        h, w = scene["label"].shape
+        boxes = torch.from_numpy(scene["boxes"])
+        cxcywh = torch.stack([(boxes[:, 0] + boxes[:, 2]) / 2 / w, (boxes[:, 1] + boxes[:, 3]) / 2 / h,
+                              (boxes[:, 2] - boxes[:, 0]) / w, (boxes[:, 3] - boxes[:, 1]) / h], dim=1)
+        self.result = (cxcywh, [f"object{k}" for k in range(len(boxes))], torch.linspace(0.9, 0.3, len(boxes)))
+
+    def predict(self, image_pil, det_text_prompt="objects"):
+        return self.result
+
+
+class StandInSegmenter(object):
+    """
+    Stand-in for SegmentAnythingPredictor.predict_torch: every box becomes its filled rectangle.
+    """
+
+    def __init__(self, device="cpu"):
+        self.device = device
+
+    def predict_torch(self, image_tensor, prompt_bboxes):
+        h, w = image_tensor.shape[-2:]
+        boxes = torch.as_tensor(prompt_bboxes, dtype=torch.float32, device=self.device)
+        ys = torch.arange(h, device=self.device).view(1, h, 1)
+        xs = torch.arange(w, device=self.device).view(1, 1, w)
+        masks = ((xs >= boxes[:, 0, None, None]) & (xs < boxes[:, 2, None, None]) &
+                 (ys >= boxes[:, 1, None, None]) & (ys < boxes[:, 3, None, None]))
+        return masks[:, None]
+
+
+def _bare_predictor(cls, device, **attrs):
+    """
+    Instance of a perception predictor class without running its __init__ (which loads checkpoints).
+    """
+    predictor = cls.__new__(cls)
+    predictor.logger = logging.getLogger(cls.__module__)
+    predictor.device = device
+    for key, value in attrs.items():
+        setattr(predictor, key, value)
+    return predictor
+
+
+def _clip_preprocess(resolution):
+    import torchvision.transforms as tvT
+    from rkit.perception import ZeroShotClipPredictor
+    return tvT.Compose([
+        tvT.Resize(resolution, interpolation=tvT.InterpolationMode.BICUBIC),
+        tvT.CenterCrop(resolution),
+        tvT.ToTensor(),
+        tvT.Normalize(ZeroShotClipPredictor.CLIP_MEAN, ZeroShotClipPredictor.CLIP_STD),
+    ])
+
+
+def _stand_in_clip(device, labels):
+    from rkit.perception import ZeroShotClipPredictor
+    model = StandInClipModel().to(device).eval()
+    cache = {label: torch.nn.functional.normalize(torch.randn(512, device=device), dim=0) for label in labels}
+    return _bare_predictor(ZeroShotClipPredictor, device, model=model, preprocess=_clip_preprocess(224),
+                           variant="stand-in", precision="fp32", max_batch_size=32, _text_feature_cache=cache)
+
+
+def _stand_in_depth(device, input_size=518):
+    from rkit.perception import DepthAnythingPredictor
+    return _bare_predictor(DepthAnythingPredictor, device, model=StandInDepthModel().to(device).eval(),
+                           precision="fp32", dtype=torch.float32, input_size=input_size)
+
+
+def add_utils_benchmarks(suite, height=480, width=640, num_objects=10):
+    """
+    rkit.utils functions on a synthetic scene.
+    """
+    def scene(rng):
+        return synthetic_scene(rng, height, width, num_objects)
+
+    def combine(rng):
+        from rkit.utils import combine_masks
+        masks = torch.from_numpy(scene(rng)["masks"])
+        return lambda: combine_masks(masks)
+
+    def filter_depth(rng):
+        from rkit.utils import combine_masks, filter_labels_depth
+        s = scene(rng)
+        labels, depth = combine_masks(torch.from_numpy(s["masks"])), torch.from_numpy(s["depth"])
+        return lambda: filter_labels_depth(labels, depth, 0.8)
+
+    def filter_boxes(rng):
+        from rkit.utils import filter_large_boxes
+        boxes = torch.from_numpy(scene(rng)["boxes"])
+        return lambda: filter_large_boxes(boxes, width, height, threshold=0.5)
+
+    def prune_boxes(rng):
+        # three jittered detections per object, as GroundingDINO returns across phrases in clutter
+        from rkit.box_pruning import BoxPruner
+        s = scene(rng)
+        boxes = np.concatenate([s["boxes"] + rng.uniform(-4, 4, s["boxes"].shape) for _ in range(3)])
+        boxes, scores = torch.from_numpy(boxes.astype(np.float32)), torch.from_numpy(rng.random(len(boxes)))
+        pruner, depth = BoxPruner(containment_threshold=0.9, min_depth_valid=0.5), torch.from_numpy(s["depth"])
+        return lambda: pruner.prune(boxes, scores, width, height, depth=depth)
+
+    def overlay(rng):
+        from rkit.utils import overlay_masks
+        s = scene(rng)
+        image_pil, masks = PILImg.fromarray(s["image"]), torch.from_numpy(s["masks"])[:, None]
+        return lambda: overlay_masks(image_pil, masks)
+
+    def annotate_boxes(rng):
+        from rkit.utils import annotate
+        s = scene(rng)
+        image_pil, boxes = PILImg.fromarray(s["image"]), s["boxes"]
+        scores, phrases = np.linspace(0.9, 0.3, len(boxes)), [f"object{k}" for k in range(len(boxes))]
+        return lambda: annotate(image_pil, boxes, scores, phrases)
+
+    def render_frame(rng):
+        # the renderer's target: boxes, labels and masks of 50 objects on a 1280x720 frame at 30 fps
+        from rkit.renderer import AnnotationRenderer
+        s = synthetic_scene(rng, 720, 1280, 50)
+        renderer, labels = AnnotationRenderer(), [f"object{k} 0.{k:02d}" for k in range(50)]
+        return lambda: renderer.render(s["image"], s["boxes"], labels, masks=s["masks"])
+
+    def colormap(rng):
+        from rkit.utils import apply_matplotlib_colormap
+        depth_pil = PILImg.fromarray(scene(rng)["depth"])
+        return lambda: apply_matplotlib_colormap(depth_pil)
+
+    def colorize_depth(rng):
+        from rkit.colormap import colorize
+        depth = scene(rng)["depth"]
+        return lambda: colorize(depth, 'inferno', percentiles=(2, 98))
+
+    def crop(batched=False, size=None):
+        def factory(rng):
+            from rkit.utils import crop_images
+            s = scene(rng)
+            return lambda: crop_images(s["image"], s["boxes"], size=size, batched=batched)
+        return factory
+
+    suite.add("utils.combine_masks", "utils", combine, items=num_objects)
+    suite.add("utils.filter_labels_depth", "utils", filter_depth, items=num_objects)
+    suite.add("utils.filter_large_boxes", "utils", filter_boxes, items=num_objects)
+    suite.add("box_pruning.prune", "utils", prune_boxes, items=3 * num_objects)
+    suite.add("utils.overlay_masks", "utils", overlay, items=num_objects)
+    suite.add("utils.annotate", "utils", annotate_boxes, items=num_objects)
+    suite.add("renderer.render_720p_50_objects", "utils", render_frame, items=50)
+    suite.add("utils.apply_matplotlib_colormap", "utils", colormap)
+    suite.add("colormap.colorize_percentiles", "utils", colorize_depth)
+    suite.add("utils.crop_images", "utils", crop(), items=num_objects)
+    suite.add("utils.crop_images_padded", "utils", crop(batched=True), items=num_objects)
+    suite.add("utils.crop_images_resized", "utils", crop(size=224), items=num_objects)
+
+
+def add_evaluation_benchmarks(suite, height=480, width=640, num_objects=10):
+    """
+    rkit.evaluation.multilabel_metrics and the munkres solver.
+    """
+    def metrics(num):
+        def factory(rng):
+            from rkit.evaluation import multilabel_metrics
+            gt = synthetic_scene(rng, height, width, num)["label"]
+            # prediction: the ground truth shifted by a few pixels with one object dropped
+            prediction = np.roll(gt, (3, -2), axis=(0, 1))
+            prediction[prediction == num] = 0
+            return lambda: multilabel_metrics(prediction, gt)
+        return factory
+
+    def contingency(num):
+        # overlap statistics of a frame with num objects; the table is one pass whatever num is
+        def factory(rng):
+            from rkit.evaluation import contingency_table
+            gt = synthetic_scene(rng, height, width, num)["label"]
+            prediction = np.roll(gt, (3, -2), axis=(0, 1))
+            return lambda: contingency_table(prediction, gt)
+        return factory
+
+    def boundary_map(rng):
+        from rkit.evaluation import seg2bmap
+        gt = synthetic_scene(rng, height, width, num_objects)["label"]
+        return lambda: seg2bmap(gt > 0)
+
+    def boundary_map_resampled(rng):
+        from rkit.evaluation import seg2bmap
+        gt = synthetic_scene(rng, height, width, num_objects)["label"]
+        return lambda: seg2bmap(gt > 0, width // 2, height // 2)
+
+    def munkres_solver(size):
+        def factory(rng):
+            from rkit.munkres import Munkres
+            cost = rng.random((size, size))
+            return lambda: Munkres().compute(cost)
+        return factory
+
+    suite.add("evaluation.multilabel_metrics", "evaluation", metrics(num_objects))
+    suite.add("evaluation.multilabel_metrics_60_objects", "evaluation", metrics(60), items=60)
+    suite.add("evaluation.seg2bmap", "evaluation", boundary_map)
+    suite.add("evaluation.seg2bmap_half_resolution", "evaluation", boundary_map_resampled)
+    for num in (10, 30, 60):
+        suite.add(f"evaluation.contingency_table_{num}_objects", "evaluation", contingency(num), items=num)
+    for size in (10, 50):
+        suite.add(f"munkres.compute_{size}x{size}", "munkres", munkres_solver(size))
+
+
+def add_predictor_benchmarks(suite, height=480, width=640, num_objects=10):
+    """
+    Pre-processing, forward and post-processing stages of the predictors, with stand-in networks.
+    Importing rkit.perception requires the model libraries (clip, groundingdino, mobile_sam, ...).
+    """
+    device = suite.device
+    labels = ["mug", "bowl", "bottle", "box", "can"]
+
+    def scene(rng):
+        return synthetic_scene(rng, height, width, num_objects)
+
+    def depth_preprocess(rng):
+        depth = _stand_in_depth(device)
+        image = scene(rng)["image"]
+        return lambda: depth.preprocess(image)
+
+    def depth_forward(rng):
+        depth = _stand_in_depth(device)
+        inputs = depth.preprocess(np.stack([scene(rng)["image"]] * 4))
+        return lambda: depth.model(pixel_values=inputs)
+
+    def depth_batch(rng):
+        depth = _stand_in_depth(device)
+        images = np.stack([scene(rng)["image"]] * 4)
+        return lambda: depth.predict_batch(images)
+
+    def clip_crop(rng):
+        clip_predictor = _stand_in_clip(device, labels)
+        s = scene(rng)
+        image_tensor = torch.from_numpy(s["image"]).permute(2, 0, 1).to(device)
+        boxes, masks = torch.from_numpy(s["boxes"]), torch.from_numpy(s["masks"])
+        return lambda: clip_predictor.crop_boxes(image_tensor, boxes, masks)
+
+    def clip_forward(rng):
+        clip_predictor = _stand_in_clip(device, labels)
+        s = scene(rng)
+        crops = clip_predictor.crop_boxes(torch.from_numpy(s["image"]).permute(2, 0, 1), torch.from_numpy(s["boxes"]))
+        return lambda: clip_predictor.model.encode_image(crops)
+
+    def clip_match(rng):
+        clip_predictor = _stand_in_clip(device, labels)
+        features = torch.nn.functional.normalize(torch.randn(num_objects, 512, device=device), dim=1)
+        return lambda: clip_predictor.match(features, labels)
+
+    def clip_encode_pil(rng):
+        clip_predictor = _stand_in_clip(device, labels)
+        s = scene(rng)
+        image_pil = PILImg.fromarray(s["image"])
+        crops = [image_pil.crop(tuple(box)) for box in s["boxes"].astype(int).tolist()]
+        return lambda: clip_predictor.encode_images(crops)
+
+    def gdino_postprocess(rng):
+        from rkit.perception import GroundingDINOObjectPredictor
+        gdino = _bare_predictor(GroundingDINOObjectPredictor, device)
+        bboxes = StandInDetector(scene(rng)).result[0]
+        return lambda: gdino.bbox_to_scaled_xyxy(bboxes, width, height)
+
+    def sam_forward(rng):
+        from mobile_sam import sam_model_registry, SamPredictor
+        from rkit.perception import SegmentAnythingPredictor
+        sam_model = sam_model_registry["vit_t"](checkpoint=None).to(device).eval()
+        sam = _bare_predictor(SegmentAnythingPredictor, device, sam=sam_model, predictor=SamPredictor(sam_model))
+        s = scene(rng)
+        image_tensor, boxes = torch.from_numpy(s["image"]).permute(2, 0, 1), torch.from_numpy(s["boxes"])
+        return lambda: sam.predict_torch(image_tensor, boxes)
+
+    def pipeline_stage(stage):
+        def factory(rng):
+            from rkit.pipeline import GroundedSegmentationPipeline
+            s = scene(rng)
+            pipeline = GroundedSegmentationPipeline(StandInDetector(s), StandInSegmenter(device),
+                                                    _stand_in_clip(device, labels))
+            image_pil = PILImg.fromarray(s["image"])
+            if stage == "detect":
+                return lambda: pipeline.detect(image_pil)
+            state = pipeline.detect(image_pil)
+            if stage == "segment":
+                return lambda: pipeline.segment(state)
+            state = pipeline.segment(state)
+            return lambda: pipeline.postprocess(dict(state, timings={}), clip_prompts=labels)
+        return factory
+
+    suite.add("depth.preprocess", "predictors", depth_preprocess)
+    suite.add("depth.forward_stand_in_b4", "predictors", depth_forward, items=4)
+    suite.add("depth.predict_batch_b4", "predictors", depth_batch, items=4)
+    suite.add("clip.crop_boxes", "predictors", clip_crop, items=num_objects)
+    suite.add("clip.forward_stand_in", "predictors", clip_forward, items=num_objects)
+    suite.add("clip.encode_images_pil", "predictors", clip_encode_pil, items=num_objects)
+    suite.add("clip.match", "predictors", clip_match, items=num_objects)
+    suite.add("gdino.bbox_to_scaled_xyxy", "predictors", gdino_postprocess, items=num_objects)
+    suite.add("sam.predict_torch_random_weights", "predictors", sam_forward, items=num_objects)
+    for stage in ("detect", "segment", "postprocess"):
+        suite.add(f"pipeline.{stage}", "predictors", pipeline_stage(stage))
+
+
+def _write_ascii_pcd(path, points):
+    """
+    Write an organized point cloud as an ASCII .pcd file.
+    """
+    h, w = points.shape[:2]
+    header = ("# .PCD v0.7 - Point Cloud Data file format\nVERSION 0.7\nFIELDS x y z\nSIZE 4 4 4\nTYPE F F F\n"
+              f"COUNT 1 1 1\nWIDTH {w}\nHEIGHT {h}\nVIEWPOINT 0 0 0 1 0 0 0\nPOINTS {w * h}\nDATA ascii\n")
+    with open(path, "w") as f:
+        f.write(header)
+        np.savetxt(f, points.reshape(-1, 3), fmt="%.4f")
+
+
+def add_dataset_benchmarks(suite, num_frames=4):
+    """
+    Dataset loaders (__getitem__) on small synthetic datasets written to a temporary directory.
+    """
+    def ocid(rng):
+        from rkit.datasets.ocid_object import OCIDObject
+        root = suite.temp_dir("rkit_bench_ocid_")
+        seq = os.path.join(root, "ARID20", "table", "top", "seq01")
+        for sub in ("rgb", "label", "pcd"):
+            os.makedirs(os.path.join(seq, sub))
+        for i in range(num_frames):
+            s = synthetic_scene(rng)
+            PILImg.fromarray(s["image"]).save(os.path.join(seq, "rgb", f"{i:03d}.png"))
+            PILImg.fromarray((s["label"] + 1).astype(np.uint8)).save(os.path.join(seq, "label", f"{i:03d}.png"))
+            ys, xs = np.mgrid[:480, :640].astype(np.float32)
+            _write_ascii_pcd(os.path.join(seq, "pcd", f"{i:03d}.pcd"), np.dstack([xs / 640, ys / 480, s["depth"]]))
+        dataset = OCIDObject("test", ocid_object_path=root)
+        return lambda: [dataset[i] for i in range(len(dataset))]
+
+    def osd(rng):
+        from rkit.datasets.osd_object import OSDObject
+        root = suite.temp_dir("rkit_bench_osd_")
+        for sub in ("image_color", "annotation"):
+            os.makedirs(os.path.join(root, sub))
+        for i in range(num_frames):
+            s = synthetic_scene(rng)
+            PILImg.fromarray(s["image"]).save(os.path.join(root, "image_color", f"{i:03d}.png"))
+            PILImg.fromarray(s["label"].astype(np.uint8)).save(os.path.join(root, "annotation", f"{i:03d}.png"))
+        dataset = OSDObject("test", osd_object_path=root)
+        return lambda: [dataset[i] for i in range(len(dataset))]
+
+    suite.add("datasets.ocid_object_getitem", "datasets", ocid, items=num_frames)
+    suite.add("datasets.osd_object_getitem", "datasets", osd, items=num_frames)
+
+
+def default_suite(device="cpu", seed=0, height=480, width=640, num_objects=10):
+    """
+    All rkit benchmarks: groups 'utils', 'evaluation', 'munkres', 'predictors' and 'datasets'.
+    """
+    suite = BenchmarkSuite(device=device, seed=seed)
+    add_utils_benchmarks(suite, height, width, num_objects)
+    add_evaluation_benchmarks(suite, height, width, num_objects)
+    add_predictor_benchmarks(suite, height, width, num_objects)
+    add_dataset_benchmarks(suite)
+    return suite
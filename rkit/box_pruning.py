@@ -0,0 +1,206 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import logging
+import numpy as np
+import torch
+from torchvision.ops import nms, box_area
+
+PRUNE_REASONS = ("area", "depth", "nms", "containment")
+
+
+def depth_valid_ratio(boxes, depth):
+    """
+    Fraction of pixels with positive depth inside every box, from one summed-area table.
+
+    Args:
+        boxes (torch.Tensor): [N, 4] xyxy boxes in pixels.
+        depth (torch.Tensor or numpy.ndarray): [H, W] depth map, 0 (or negative / NaN) where invalid.
+
+    Returns:
+        torch.Tensor: [N] ratios in [0, 1]; 0 for boxes without pixels.
+    """
+    height, width = depth.shape[-2:]
+    # compare before converting: uint16 depth from the camera has no torch comparison kernels
+    valid = torch.as_tensor(depth > 0, device=boxes.device).reshape(height, width)
+    table = torch.nn.functional.pad(valid.cumsum(1, dtype=torch.int32).cumsum(0), (1, 0, 1, 0))
+
+    limits = torch.tensor([width, height, width, height], device=boxes.device)
+    corners = torch.minimum(torch.cat([boxes[:, :2].floor(), boxes[:, 2:].ceil()], dim=1).clamp(min=0), limits).long()
+    x0, y0, x1, y1 = corners.unbind(dim=1)
+    count = table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+    pixels = (x1 - x0) * (y1 - y0)
+    return count.float() / pixels.clamp(min=1).float()
+
+
+def prune_boxes(boxes, scores, width, height, min_area=0.0, max_area=0.5, iou_threshold=0.7,
+                containment_threshold=None, depth=None, min_depth_valid=None):
+    """
+    Decide which detections are worth a mask decode, before running the segmenter.
+
+    Checks run in this order, each only on the boxes that survived the previous ones:
+    - area: box area below min_area, or at or above max_area, as fractions of the image area
+    - depth: fraction of pixels with valid depth inside the box below min_depth_valid
+    - nms: IoU above iou_threshold with a higher-scoring box, across all phrases
+    - containment: at least containment_threshold of the box's area inside a higher-scoring kept box
+
+    Args:
+        boxes (torch.Tensor): [N, 4] xyxy boxes in pixels.
+        scores (torch.Tensor): [N] detection confidences.
+        width (int): Image width.
+        height (int): Image height.
+        min_area (float): Minimum box area fraction. Default is 0.
+        max_area (float): Boxes with at least this area fraction are removed. Default is 0.5 (as filter_large_boxes).
+        iou_threshold (float, optional): Cross-phrase NMS threshold; None disables NMS. Default is 0.7.
+        containment_threshold (float, optional): Containment threshold; None (default) disables it.
+        depth (torch.Tensor or numpy.ndarray, optional): [H, W] depth map for the depth check.
+        min_depth_valid (float, optional): Minimum valid-depth fraction; None disables the check.
+
+    Returns:
+        torch.Tensor: [N] bool keep mask on the boxes' device.
+        dict: Boxes removed per reason (see PRUNE_REASONS).
+    """
+    boxes = torch.as_tensor(boxes, dtype=torch.float32).reshape(-1, 4)
+    scores = torch.as_tensor(scores, dtype=torch.float32, device=boxes.device).reshape(-1)
+    removed = []
+
+    # same comparison as filter_large_boxes: area < (w * h) * threshold
+    area = box_area(boxes)
+    keep = (area >= (width * height) * min_area) & (area < (width * height) * max_area)
+    removed.append(keep.numel() - keep.sum())
+
+    if depth is not None and min_depth_valid is not None:
+        survivors = keep.clone()
+        keep &= depth_valid_ratio(boxes, depth) >= min_depth_valid
+        removed.append(survivors.sum() - keep.sum())
+    else:
+        removed.append(torch.zeros((), dtype=torch.long, device=boxes.device))
+
+    candidates = torch.nonzero(keep).flatten()
+    if iou_threshold is not None and len(candidates) > 1:
+        survivors = nms(boxes[candidates], scores[candidates], iou_threshold)
+        keep = torch.zeros_like(keep)
+        keep[candidates[survivors]] = True
+        removed.append(len(candidates) - len(survivors) + torch.zeros((), dtype=torch.long, device=boxes.device))
+        candidates = candidates[survivors]
+    else:
+        removed.append(torch.zeros((), dtype=torch.long, device=boxes.device))
+
+    if containment_threshold is not None and len(candidates) > 1:
+        # candidates are in descending score order after NMS; sort them if NMS was skipped
+        candidates = candidates[scores[candidates].argsort(descending=True)]
+        kept = boxes[candidates]
+        top_left = torch.maximum(kept[:, None, :2], kept[None, :, :2])
+        bottom_right = torch.minimum(kept[:, None, 2:], kept[None, :, 2:])
+        inter = (bottom_right - top_left).clamp(min=0).prod(dim=2)
+        # contained[i, j]: share of box j inside box i, counted only for higher-scoring i
+        contained = (inter / box_area(kept).clamp(min=1e-6)[None, :]).triu(diagonal=1)
+        covers = (contained >= containment_threshold).cpu().numpy()
+        # greedy in score order, as NMS: only boxes that are still kept suppress the ones below them
+        suppressed = np.zeros(len(candidates), dtype=bool)
+        for i in range(len(candidates)):
+            if not suppressed[i]:
+                suppressed |= covers[i]
+        suppressed = torch.from_numpy(suppressed).to(boxes.device)
+        keep[candidates[suppressed]] = False
+        removed.append(suppressed.sum())
+    else:
+        removed.append(torch.zeros((), dtype=torch.long, device=boxes.device))
+
+    counts = torch.stack([torch.as_tensor(r, device=boxes.device).long() for r in removed]).tolist()
+    return keep, dict(zip(PRUNE_REASONS, counts))
+
+
+class BoxPruner(object):
+    """
+    Box-pruning stage run between the detector and the segmenter, so masks are only decoded
+    for boxes that would be kept. Counts every removed box (one saved mask decode) per reason
+    across calls.
+
+        pruner = BoxPruner(max_area=0.5, iou_threshold=0.7)
+        boxes, index = pruner(boxes, conf, w, h)            # returns like filter_large_boxes
+        boxes, masks = SAM.predict(img_pil, boxes)
+        print(pruner.report())
+
+    Attributes:
+        min_area (float): Minimum box area as a fraction of the image.
+        max_area (float): Maximum box area as a fraction of the image.
+        iou_threshold (float): Cross-phrase NMS threshold, or None.
+        containment_threshold (float): Containment suppression threshold, or None.
+        min_depth_valid (float): Minimum fraction of valid depth inside a box, or None.
+        stats (dict): Cumulative 'boxes', 'kept' and removed counts per reason.
+        logger: Logger instance for logging.
+    """
+
+    def __init__(self, min_area=0.0, max_area=0.5, iou_threshold=0.7, containment_threshold=None, min_depth_valid=None):
+        """
+        Initializes the BoxPruner class. See prune_boxes for the parameters.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.min_area = min_area
+        self.max_area = max_area
+        self.iou_threshold = iou_threshold
+        self.containment_threshold = containment_threshold
+        self.min_depth_valid = min_depth_valid
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Zero the cumulative counts in self.stats, e.g. between datasets.
+        """
+        self.stats = {"boxes": 0, "kept": 0, **{reason: 0 for reason in PRUNE_REASONS}}
+
+    def prune(self, boxes, scores, width, height, depth=None):
+        """
+        Keep mask for one image's detections; updates self.stats.
+
+        Returns:
+            torch.Tensor: [N] bool keep mask on the boxes' device.
+            dict: Removed boxes per reason for this call.
+        """
+        try:
+            keep, removed = prune_boxes(boxes, scores, width, height, min_area=self.min_area, max_area=self.max_area,
+                                        iou_threshold=self.iou_threshold,
+                                        containment_threshold=self.containment_threshold,
+                                        depth=depth, min_depth_valid=self.min_depth_valid)
+            self.stats["boxes"] += len(keep)
+            self.stats["kept"] += len(keep) - sum(removed.values())
+            for reason, count in removed.items():
+                self.stats[reason] += count
+            return keep, removed
+
+        except Exception as e:
+            self.logger.error(f"Error pruning boxes: {e}")
+            raise e
+
+    def __call__(self, boxes, scores, width, height, depth=None):
+        """
+        Prune one image's detections.
+
+        Args:
+            boxes (torch.Tensor): [N, 4] xyxy boxes in pixels.
+            scores (torch.Tensor): [N] detection confidences.
+            width (int): Image width.
+            height (int): Image height.
+            depth (optional): [H, W] depth map, used when min_depth_valid is set.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: Kept boxes and the bool keep mask on the CPU.
+        """
+        keep, _ = self.prune(boxes, scores, width, height, depth=depth)
+        return boxes[keep], keep.cpu()
+
+    @property
+    def decodes_saved(self):
+        return self.stats["boxes"] - self.stats["kept"]
+
+    def report(self):
+        """
+        One-line summary of the decodes saved so far.
+        """
+        s = self.stats
+        reasons = ", ".join(f"{reason} {s[reason]}" for reason in PRUNE_REASONS)
+        ratio = s["boxes"] / s["kept"] if s["kept"] else float("inf") if s["boxes"] else 1.0
+        return (f"box pruning: {s['boxes']} boxes, {s['kept']} decoded, {self.decodes_saved} decodes saved "
+                f"({reasons}); {ratio:.2f}x fewer decodes")
@@ -0,0 +1,182 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+"""
+Colormap lookup tables for depth visualization.
+
+A matplotlib colormap is sampled once into a uint8 table ([256, 4], or [65536, 4] for finer
+quantization) and cached per colormap and device. Colorizing a frame is then one quantize step
+and one table lookup, on CPU (numpy) or on the device of a torch tensor.
+
+    from rkit.colormap import colorize
+    rgb = colorize(depth, 'inferno', percentiles=(2, 98))       # [H, W, 3] uint8, same type as depth
+"""
+
+import functools
+import numpy as np
+import torch
+import matplotlib.pyplot as plt
+from PIL import Image as PILImg
+
+_DEVICE_LUTS = {}
+_TORCH_INTEGER_TYPES = (torch.uint8,) + ((torch.uint16,) if hasattr(torch, 'uint16') else ())
+
+
+@functools.lru_cache(maxsize=None)
+def colormap_lut(name='inferno', entries=256):
+    """
+    Sample a matplotlib colormap into a uint8 lookup table.
+
+    Entry i holds the color of the value (i + 0.5) / entries, so a 256-entry table reproduces
+    (cmap(x) * 255).astype(np.uint8) exactly.
+
+    Args:
+        name (str): Matplotlib colormap name. Default is 'inferno'.
+        entries (int): Table size, 256 or 65536. Default is 256.
+
+    Returns:
+        numpy.ndarray: Read-only RGBA table of shape [entries, 4], uint8.
+    """
+    cmap = plt.get_cmap(name)
+    lut = (cmap((np.arange(entries) + 0.5) / entries) * 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def device_lut(name='inferno', entries=256, device='cpu'):
+    """
+    colormap_lut as a torch tensor on device, cached per (name, entries, device).
+    """
+    key = (name, entries, str(device))
+    lut = _DEVICE_LUTS.get(key)
+    if lut is None:
+        lut = _DEVICE_LUTS[key] = torch.from_numpy(colormap_lut(name, entries).copy()).to(device)
+    return lut
+
+
+def _value_range(depth, vmin, vmax, percentiles):
+    """
+    Per-frame (lo, hi) of depth [..., H, W] with keepdims, as numpy arrays or tensors like depth.
+    Fixed vmin / vmax take precedence over percentiles, which take precedence over min / max.
+    """
+    if vmin is not None and vmax is not None:
+        if torch.is_tensor(depth):
+            return (torch.tensor(float(vmin), device=depth.device), torch.tensor(float(vmax), device=depth.device))
+        return np.float64(vmin), np.float64(vmax)
+
+    if torch.is_tensor(depth):
+        flat = depth.reshape(*depth.shape[:-2], -1).float()
+        if percentiles is not None:
+            q = torch.tensor(percentiles, dtype=torch.float32, device=depth.device) / 100.0
+            lo, hi = torch.quantile(flat, q, dim=-1)
+        else:
+            lo, hi = flat.amin(dim=-1), flat.amax(dim=-1)
+        lo, hi = lo[..., None, None], hi[..., None, None]
+        if vmin is not None:
+            lo = torch.full_like(lo, vmin)
+        if vmax is not None:
+            hi = torch.full_like(hi, vmax)
+        return lo, hi
+
+    if percentiles is not None:
+        lo, hi = np.percentile(depth, percentiles, axis=(-2, -1), keepdims=True)
+    else:
+        lo, hi = depth.min(axis=(-2, -1), keepdims=True), depth.max(axis=(-2, -1), keepdims=True)
+    lo = np.full_like(lo, vmin, dtype=np.float64) if vmin is not None else lo.astype(np.float64)
+    hi = np.full_like(hi, vmax, dtype=np.float64) if vmax is not None else hi.astype(np.float64)
+    return lo, hi
+
+
+def _quantize(values, lo, hi, levels):
+    """
+    floor((values - lo) / (hi - lo) * levels), clipped to [0, levels - 1]; NaN maps to 0.
+    numpy floats are computed in their own precision, matching matplotlib's normalization.
+    """
+    if torch.is_tensor(values):
+        scaled = (values.float() - lo) / (hi - lo).clamp(min=1e-12) * levels
+        return scaled.nan_to_num_(0).clamp_(0, levels - 1).long()
+    dtype = values.dtype if values.dtype.kind == 'f' else np.dtype(np.float64)
+    lo, hi = np.asarray(lo, dtype=dtype), np.asarray(hi, dtype=dtype)
+    scaled = (values - lo) / np.maximum(hi - lo, dtype.type(1e-12))
+    scaled *= levels
+    # fmax / fmin also replace NaN
+    np.fmax(scaled, 0, out=scaled)
+    np.fmin(scaled, levels - 1, out=scaled)
+    return scaled.astype(np.uint8 if levels <= 256 else np.uint16)
+
+
+def _lookup(lut, index):
+    """
+    lut[index] for a [L, C] table, as one gather.
+    """
+    if torch.is_tensor(index):
+        return lut.index_select(0, index.reshape(-1)).view(*index.shape, lut.shape[-1])
+    return np.take(lut, index, axis=0)
+
+
+def quantize(depth, vmin=None, vmax=None, percentiles=None, levels=256):
+    """
+    Quantize depth to integer levels over a fixed, percentile or min-max range.
+
+    Args:
+        depth (numpy.ndarray or torch.Tensor): Depth of shape [H, W] or [B, H, W]; ranges are per frame.
+        vmin (float, optional): Value mapped to level 0.
+        vmax (float, optional): Value mapped to the top level.
+        percentiles (tuple, optional): (low, high) percentiles used for the range where vmin / vmax are not given.
+        levels (int): 256 for uint8 or 65536 for uint16 output. Default is 256.
+
+    Returns:
+        Levels with depth's shape: uint8 / uint16 numpy array, or tensor on depth's device.
+    """
+    lo, hi = _value_range(depth, vmin, vmax, percentiles)
+    index = _quantize(depth, lo, hi, levels)
+    if torch.is_tensor(index):
+        return index.to(torch.uint8) if levels <= 256 else index.to(torch.int32)
+    return index
+
+
+def colorize(depth, name='inferno', vmin=None, vmax=None, percentiles=None, entries=256, channels=3):
+    """
+    Colorize depth with a cached colormap lookup table.
+
+    uint8 and uint16 inputs with one range are colored through a table over every representable
+    value, so each pixel is a single lookup; float inputs are quantized and looked up in one step.
+
+    Args:
+        depth (numpy.ndarray, torch.Tensor or PIL.Image): Depth of shape [H, W] or [B, H, W].
+        name (str): Matplotlib colormap name. Default is 'inferno'.
+        vmin, vmax, percentiles: Value range, see quantize. Defaults to the per-frame min and max.
+        entries (int): Colormap table size, 256 or 65536. Default is 256.
+        channels (int): 3 for RGB or 4 for RGBA. Default is 3.
+
+    Returns:
+        Colored depth of shape [..., H, W, channels], uint8: a numpy array, a tensor on depth's
+        device, or a PIL image, matching the input.
+    """
+    is_pil = isinstance(depth, PILImg.Image)
+    if is_pil:
+        depth = np.asarray(depth)
+
+    lo, hi = _value_range(depth, vmin, vmax, percentiles)
+    if torch.is_tensor(depth):
+        integer, single_range = depth.dtype in _TORCH_INTEGER_TYPES, lo.numel() == 1
+    else:
+        integer, single_range = depth.dtype in (np.uint8, np.uint16), np.size(lo) == 1
+
+    if torch.is_tensor(depth):
+        lut = device_lut(name, entries, depth.device)[:, :channels].contiguous()
+        if integer and single_range:
+            values = torch.arange(256 if depth.dtype == torch.uint8 else 65536, device=depth.device)
+            lut = _lookup(lut, _quantize(values, lo.reshape(()), hi.reshape(()), entries))
+            return _lookup(lut, depth.long())
+        return _lookup(lut, _quantize(depth, lo, hi, entries))
+
+    lut = colormap_lut(name, entries)[:, :channels]
+    if integer and single_range:
+        values = np.arange(256 if depth.dtype == np.uint8 else 65536)
+        lut = _lookup(lut, _quantize(values, np.ravel(lo)[0], np.ravel(hi)[0], entries))
+        colored = _lookup(lut, depth)
+    else:
+        colored = _lookup(lut, _quantize(depth, lo, hi, entries))
+    return PILImg.fromarray(colored) if is_pil else colored
@@ -0,0 +1,259 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import os
+import json
+import logging
+import numpy as np
+
+
+def _to_numpy(array):
+    """
+    Convert a torch tensor or array-like to a 2D float32 numpy array.
+    """
+    if hasattr(array, "detach"):
+        array = array.detach().float().cpu().numpy()
+    array = np.asarray(array, dtype=np.float32)
+    return array.reshape(1, -1) if array.ndim == 1 else array
+
+
+def _normalize(array):
+    """
+    L2-normalize the rows of a 2D array.
+    """
+    norm = np.linalg.norm(array, axis=1, keepdims=True)
+    return array / np.maximum(norm, 1e-12)
+
+
+def _topk(scores, k):
+    """
+    Row-wise top-k of a 2D score matrix, sorted by descending score.
+
+    Returns:
+    - Tuple[numpy.ndarray, numpy.ndarray]: Scores and column indices, both [Q, k].
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+class EmbeddingIndex(object):
+    """
+    Persistent gallery of labelled embeddings for instance recognition.
+
+    Embeddings are L2-normalized and stored in a memory-mapped float32 matrix
+    (<path>/embeddings.npy) whose capacity doubles as rows are added; labels and
+    the row count live in <path>/index.json. Queries are answered with a single
+    matrix product over the gallery, or over a few IVF partitions once build_ivf
+    has been called.
+
+    Attributes:
+        path (str): Directory holding the index files.
+        dim (int): Embedding dimension.
+        labels (list): Label of every stored row.
+        logger: Logger instance for logging.
+    """
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    META_FILE = "index.json"
+    IVF_FILE = "ivf.npz"
+
+    def __init__(self, path, dim=None, initial_capacity=1024):
+        """
+        Open the index at path, creating it if it does not exist.
+
+        Args:
+            path (str): Directory holding the index files.
+            dim (int, optional): Embedding dimension. Required when creating a new index.
+            initial_capacity (int): Number of rows preallocated for a new index. Default is 1024.
+
+        Raises:
+            ValueError: If a new index is created without dim, or dim does not match an existing index.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self._centroids = None
+        self._assignments = None
+
+        meta_file = os.path.join(path, self.META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if dim is not None and dim != meta["dim"]:
+                raise ValueError(f"Index at {path} has dim {meta['dim']}, got dim {dim}")
+            self.dim = meta["dim"]
+            self.labels = meta["labels"]
+            self._matrix = np.lib.format.open_memmap(os.path.join(path, self.EMBEDDINGS_FILE), mode="r+")
+            ivf_file = os.path.join(path, self.IVF_FILE)
+            if os.path.exists(ivf_file):
+                ivf = np.load(ivf_file)
+                self._centroids, self._assignments = ivf["centroids"], ivf["assignments"]
+        else:
+            if dim is None:
+                raise ValueError("dim is required to create a new embedding index")
+            os.makedirs(path, exist_ok=True)
+            self.dim = dim
+            self.labels = []
+            self._matrix = np.lib.format.open_memmap(os.path.join(path, self.EMBEDDINGS_FILE), mode="w+",
+                                                     dtype=np.float32, shape=(initial_capacity, dim))
+            self._save_meta()
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def embeddings(self):
+        """
+        numpy.ndarray: Read-only view of the stored [N, dim] normalized embeddings.
+        """
+        view = self._matrix[:len(self)]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def has_ivf(self):
+        return self._centroids is not None
+
+    def _save_meta(self):
+        with open(os.path.join(self.path, self.META_FILE), "w") as f:
+            json.dump({"dim": self.dim, "labels": self.labels}, f)
+
+    def _grow(self, min_capacity):
+        """
+        Reallocate the memory-mapped matrix to at least min_capacity rows.
+        """
+        capacity = self._matrix.shape[0]
+        while capacity < min_capacity:
+            capacity *= 2
+        tmp_file = os.path.join(self.path, self.EMBEDDINGS_FILE + ".tmp")
+        grown = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        grown[:len(self)] = self._matrix[:len(self)]
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp_file, os.path.join(self.path, self.EMBEDDINGS_FILE))
+        self._matrix = np.lib.format.open_memmap(os.path.join(self.path, self.EMBEDDINGS_FILE), mode="r+")
+
+    def add(self, embeddings, labels):
+        """
+        Append embeddings with their labels and persist them.
+
+        Args:
+            embeddings (numpy.ndarray or torch.Tensor): [N, dim] embeddings (normalized on insert).
+            labels (list): N labels (any JSON-serializable value).
+
+        Returns:
+            numpy.ndarray: Row ids of the added embeddings.
+
+        Raises:
+            ValueError: If shapes and labels do not match.
+        """
+        embeddings = _normalize(_to_numpy(embeddings))
+        labels = list(labels)
+        if embeddings.shape[1] != self.dim or embeddings.shape[0] != len(labels):
+            raise ValueError(f"Expected [{len(labels)}, {self.dim}] embeddings, got {list(embeddings.shape)}")
+
+        start = len(self)
+        end = start + len(labels)
+        if end > self._matrix.shape[0]:
+            self._grow(end)
+        self._matrix[start:end] = embeddings
+        self._matrix.flush()
+        self.labels.extend(labels)
+        self._save_meta()
+
+        if self.has_ivf:
+            new_assignments = np.argmax(embeddings @ self._centroids.T, axis=1)
+            self._assignments = np.concatenate([self._assignments, new_assignments])
+            self._save_ivf()
+        return np.arange(start, end)
+
+    def build_ivf(self, num_lists, iterations=10, seed=0):
+        """
+        Partition the gallery with spherical k-means so queries only scan the nearest partitions.
+
+        Args:
+            num_lists (int): Number of partitions; capped at the number of embeddings.
+            iterations (int): Number of k-means iterations. Default is 10.
+            seed (int): Seed for centroid initialization. Default is 0.
+
+        Raises:
+            ValueError: If the index is empty or num_lists is less than 1.
+        """
+        if len(self) == 0:
+            raise ValueError(f"Cannot build an IVF on the empty index at {self.path}; add embeddings first")
+        if num_lists < 1:
+            raise ValueError(f"num_lists must be at least 1, got {num_lists}")
+
+        data = self.embeddings
+        num_lists = min(num_lists, len(data))
+        rng = np.random.default_rng(seed)
+        centroids = np.array(data[rng.choice(len(data), num_lists, replace=False)])
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, data)
+            empty = ~np.bincount(assignments, minlength=num_lists).astype(bool)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        self._centroids = centroids
+        self._assignments = np.argmax(data @ centroids.T, axis=1)
+        self._save_ivf()
+
+    def _save_ivf(self):
+        np.savez(os.path.join(self.path, self.IVF_FILE), centroids=self._centroids, assignments=self._assignments)
+
+    def search(self, queries, k=1, nprobe=None):
+        """
+        Batched top-k cosine similarity search.
+
+        Args:
+            queries (numpy.ndarray or torch.Tensor): [Q, dim] query embeddings.
+            k (int): Number of neighbours per query. Default is 1.
+            nprobe (int, optional): Number of IVF partitions to scan per query. Scans the whole
+                gallery when None or when no IVF has been built.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: Cosine scores and row ids, both [Q, k].
+                Rows with fewer than k candidates are padded with score -inf and id -1.
+        """
+        queries = _normalize(_to_numpy(queries))
+        if len(self) == 0:
+            return np.full((len(queries), k), -np.inf, dtype=np.float32), np.full((len(queries), k), -1)
+
+        if not self.has_ivf or nprobe is None:
+            scores, ids = _topk(queries @ self.embeddings.T, k)
+        else:
+            data = self.embeddings
+            _, probes = _topk(queries @ self._centroids.T, nprobe)
+            scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+            ids = np.full((len(queries), k), -1)
+            # queries that probe the same partitions share one candidate set and one matmul
+            probe_sets, inverse = np.unique(np.sort(probes, axis=1), axis=0, return_inverse=True)
+            for group, probe_set in enumerate(probe_sets):
+                rows = np.flatnonzero(inverse.reshape(-1) == group)
+                candidates = np.flatnonzero(np.isin(self._assignments, probe_set))
+                if len(candidates) == 0:
+                    continue
+                group_scores, group_ids = _topk(queries[rows] @ data[candidates].T, k)
+                scores[rows, :group_scores.shape[1]] = group_scores
+                ids[rows, :group_ids.shape[1]] = candidates[group_ids]
+
+        if scores.shape[1] < k:
+            pad = k - scores.shape[1]
+            scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+        return scores, ids
+
+    def lookup_labels(self, ids):
+        """
+        Map row ids (any shape) returned by search to their labels; -1 maps to None.
+        """
+        ids = np.asarray(ids)
+        return np.array([self.labels[i] if i >= 0 else None for i in ids.reshape(-1)], dtype=object).reshape(ids.shape)
@@ -2,6 +2,7 @@
 # This work is licensed under the NVIDIA Source Code License - Non-commercial. Full
 # text can be found in LICENSE.md
 
+import functools
 import numpy as np
 import cv2
 
@@ -21,6 +22,7 @@ def seg2bmap(seg,width=None,height=None):
         seg     : Segments labeled from 1..k.
         width     : Width of desired bmap  <= seg.shape[1]
         height  :   Height of desired bmap <= seg.shape[0]
+                    (same aspect ratio; boundary pixels are mapped to the smaller grid)
     Returns:
         bmap (ndarray): Binary boundary map.
      David Martin <dmartin@eecs.berkeley.edu>
@@ -40,8 +42,8 @@ def seg2bmap(seg,width=None,height=None):
     ar1 = float(width) / float(height)
     ar2 = float(w) / float(h)
 
-    assert not (width>w | height>h | abs(ar1-ar2)>0.01),\
-            'Can''t convert %dx%d seg to %dx%d bmap.'%(w,h,width,height)
+    assert not (width>w or height>h or abs(ar1-ar2)>0.01),\
+            'Can\'t convert %dx%d seg to %dx%d bmap.'%(w,h,width,height)
 
     e  = np.zeros_like(seg)
     s  = np.zeros_like(seg)
@@ -61,13 +63,10 @@ def seg2bmap(seg,width=None,height=None):
     if w == width and h == height:
         bmap = b
     else:
-        bmap = np.zeros((height,width))
-        for x in range(w):
-            for y in range(h):
-                if b[y,x]:
-                    j = 1+floor((y-1)+height / h)
-                    i = 1+floor((x-1)+width  / h)
-                    bmap[j,i] = 1;
+        # pixel (y, x) maps to (floor(y*height/h), floor(x*width/w)), scattered in one step
+        ys, xs = np.nonzero(b)
+        bmap = np.zeros((height,width), dtype=bool)
+        bmap[ys*height // h, xs*width // w] = True
 
     return bmap
 
@@ -84,18 +83,15 @@ def boundary_overlap(predicted_mask, gt_mask, bound_th=0.003):
     """
     assert np.atleast_3d(predicted_mask).shape[2] == 1
 
-    bound_pix = bound_th if bound_th >= 1 else \
-            np.ceil(bound_th*np.linalg.norm(predicted_mask.shape))
+    bound_pix = _bound_pix(predicted_mask.shape, bound_th)
 
     # Get the pixel boundaries of both masks
     fg_boundary = seg2bmap(predicted_mask);
     gt_boundary = seg2bmap(gt_mask);
 
-    from skimage.morphology import disk
-
     # Dilate segmentation boundaries
-    gt_dil = cv2.dilate(gt_boundary.astype(np.uint8), disk(bound_pix), iterations=1)
-    fg_dil = cv2.dilate(fg_boundary.astype(np.uint8), disk(bound_pix), iterations=1)
+    gt_dil = cv2.dilate(gt_boundary.astype(np.uint8), _disk(bound_pix), iterations=1)
+    fg_dil = cv2.dilate(fg_boundary.astype(np.uint8), _disk(bound_pix), iterations=1)
 
     # Get the intersection (true positives). Calculate true positives differently for
     #   precision and recall since we have to dilated the boundaries
@@ -105,6 +101,102 @@ def boundary_overlap(predicted_mask, gt_mask, bound_th=0.003):
     # Return precision_tps, recall_tps (tps = true positives)
     return np.sum(fg_match), np.sum(gt_match)
 
+def _bound_pix(shape, bound_th):
+    """
+    Boundary tolerance in pixels: bound_th itself, or a fraction of the image diagonal.
+    """
+    return bound_th if bound_th >= 1 else np.ceil(bound_th*np.linalg.norm(shape))
+
+@functools.lru_cache(maxsize=None)
+def _disk(radius):
+    """
+    Cached disk structuring element (skimage.morphology.disk) for cv2.dilate.
+    """
+    from skimage.morphology import disk
+    element = np.ascontiguousarray(disk(radius), dtype=np.uint8)
+    element.flags.writeable = False
+    return element
+
+def _label_boundaries(labels, values, bound_pix):
+    """
+    Boundary map and dilated boundary of every label, each cropped to the only region where it
+    can be non-zero. Identical to seg2bmap and the cv2.dilate of boundary_overlap on the full
+    image, restricted to that region.
+
+    Arguments:
+        labels    (ndarray): [H x W] label map.
+        values    (ndarray): Labels to process.
+        bound_pix (float): Dilation radius in pixels.
+    Returns:
+        list of (boundary, boundary_box, dilated, dilated_box), boxes as (y0, y1, x0, x1),
+        with boundary and dilated as boolean crops of those boxes.
+    """
+    h, w = labels.shape[:2]
+    element = _disk(bound_pix)
+    radius = element.shape[0] // 2
+    boundaries = []
+    for value in values:
+        mask = (labels == value)
+        x, y, bw, bh = cv2.boundingRect(mask.view(np.uint8))
+
+        # boundaries sit on the mask or one pixel towards the origin from it; one extra empty
+        #   row / column past the mask keeps seg2bmap's image-edge handling out of the crop
+        box = (max(y - 1, 0), min(y + bh + 1, h), max(x - 1, 0), min(x + bw + 1, w))
+        boundary = seg2bmap(mask[box[0]:box[1], box[2]:box[3]])
+
+        dil_box = (max(box[0] - radius, 0), min(box[1] + radius, h), max(box[2] - radius, 0), min(box[3] + radius, w))
+        padded = np.zeros((dil_box[1] - dil_box[0], dil_box[3] - dil_box[2]), dtype=np.uint8)
+        padded[box[0] - dil_box[0]:box[1] - dil_box[0], box[2] - dil_box[2]:box[3] - dil_box[2]] = boundary
+        dilated = cv2.dilate(padded, element, iterations=1).view(bool)
+
+        boundaries.append((boundary, box, dilated, dil_box))
+    return boundaries
+
+def _masked_count(a, a_box, b, b_box):
+    """
+    np.sum(np.logical_and(a, b)) of two cropped boolean maps, over the overlap of their boxes.
+    """
+    y0, y1 = max(a_box[0], b_box[0]), min(a_box[1], b_box[1])
+    x0, x1 = max(a_box[2], b_box[2]), min(a_box[3], b_box[3])
+    if y0 >= y1 or x0 >= x1:
+        return 0
+    return np.count_nonzero(a[y0 - a_box[0]:y1 - a_box[0], x0 - a_box[2]:x1 - a_box[2]]
+                            & b[y0 - b_box[0]:y1 - b_box[0], x0 - b_box[2]:x1 - b_box[2]])
+
+def _small_labels(labels):
+    """
+    Whether a label map holds non-negative integers small enough to bincount directly.
+    """
+    return (labels.dtype.kind in 'ui' and labels.size > 0 and labels.min() >= 0
+            and labels.max() < max(labels.size, 1 << 16))
+
+def contingency_table(prediction, gt):
+    """ Joint histogram of (GT label, predicted label) pairs over all pixels.
+
+        @param prediction: a [H x W] numpy.ndarray with predicted masks
+        @param gt: a [H x W] numpy.ndarray with ground truth masks
+
+        @return: labels_gt, labels_pred (sorted unique labels, background included) and a
+                 [len(labels_gt) x len(labels_pred)] int64 table of pixel counts. Row sums are
+                 the GT label areas, column sums the predicted label areas.
+    """
+    gt, prediction = gt.ravel(), prediction.ravel()
+
+    if _small_labels(gt) and _small_labels(prediction):
+        # one bincount over label values, then keep the labels that occur
+        num_gt, num_pred = int(gt.max()) + 1, int(prediction.max()) + 1
+        if num_gt * num_pred <= max(gt.size, 1 << 20):
+            table = np.bincount(gt.astype(np.intp) * num_pred + prediction.astype(np.intp), minlength=num_gt * num_pred)
+            table = table.reshape(num_gt, num_pred)
+            rows, cols = np.flatnonzero(table.sum(axis=1)), np.flatnonzero(table.sum(axis=0))
+            return rows.astype(gt.dtype), cols.astype(prediction.dtype), table[np.ix_(rows, cols)].astype(np.int64)
+
+    labels_gt, index_gt = np.unique(gt, return_inverse=True)
+    labels_pred, index_pred = np.unique(prediction, return_inverse=True)
+    num_pred = labels_pred.shape[0]
+    table = np.bincount(index_gt.ravel() * num_pred + index_pred.ravel(), minlength=labels_gt.shape[0] * num_pred)
+    return labels_gt, labels_pred, table.reshape(labels_gt.shape[0], num_pred).astype(np.int64)
+
 # This function is modeled off of P/R/F measure as described by Dave et al. (arXiv19)
 def multilabel_metrics(prediction, gt, obj_detect_threshold=0.75):
     """ Compute Overlap and Boundary Precision, Recall, F-measure
@@ -123,13 +215,20 @@ def multilabel_metrics(prediction, gt, obj_detect_threshold=0.75):
 
     ### Compute F-measure, True Positive matrices ###
 
+    # Joint histogram of (GT, prediction) labels: pair overlaps and label areas in one pass
+    labels_gt, labels_pred, table = contingency_table(prediction, gt)
+
     # Get unique OBJECT labels from GT and prediction
-    labels_gt = np.unique(gt)
-    labels_gt = labels_gt[~np.isin(labels_gt, [BACKGROUND_LABEL])]
+    keep_gt = ~np.isin(labels_gt, [BACKGROUND_LABEL])
+    keep_pred = ~np.isin(labels_pred, [BACKGROUND_LABEL])
+    gt_areas = table.sum(axis=1)[keep_gt]
+    pred_areas = table.sum(axis=0)[keep_pred]
+    table = table[keep_gt][:, keep_pred]
+
+    labels_gt = labels_gt[keep_gt]
     num_labels_gt = labels_gt.shape[0]
 
-    labels_pred = np.unique(prediction)
-    labels_pred = labels_pred[~np.isin(labels_pred, [BACKGROUND_LABEL])]
+    labels_pred = labels_pred[keep_pred]
     num_labels_pred = labels_pred.shape[0]
 
     # F-measure, True Positives, Boundary stuff
@@ -176,44 +275,38 @@ def multilabel_metrics(prediction, gt, obj_detect_threshold=0.75):
                 'obj_detected_075_percentage' : 1.,
                 }
 
-    # For every pair of GT label vs. predicted label, calculate stuff
-    for i, gt_i in enumerate(labels_gt):
-
-        gt_i_mask = (gt == gt_i)
-
-        for j, pred_j in enumerate(labels_pred):
-            
-            pred_j_mask = (prediction == pred_j)
-            
-            ### Overlap Stuff ###
-
-            # true positive
-            A = np.logical_and(pred_j_mask, gt_i_mask)
-            tp = np.int64(np.count_nonzero(A)) # Cast this to numpy.int64 so 0/0 = nan
-            true_positives[i,j] = tp 
-            
-            # precision
-            prec = tp/np.count_nonzero(pred_j_mask)
-            
-            # recall
-            rec = tp/np.count_nonzero(gt_i_mask)
-            
-            # F-measure
-            if prec + rec > 0:
-                F[i,j] = (2 * prec * rec) / (prec + rec)
-
-            ### Boundary Stuff ###
-            boundary_stuff[i,j] = boundary_overlap(pred_j_mask, gt_i_mask)
+    ### Overlap Stuff ###
+
+    # true positives of every (GT, prediction) pair
+    true_positives[:] = table
+
+    # precision, recall and F-measure of every pair
+    prec = table / pred_areas[np.newaxis, :]
+    rec = table / gt_areas[:, np.newaxis]
+    matched = prec + rec > 0
+    F[matched] = (2 * prec[matched] * rec[matched]) / (prec[matched] + rec[matched])
+
+    ### Boundary Stuff ###
+
+    # Boundary maps and dilated boundaries of every label, computed once
+    bound_pix = _bound_pix(prediction.shape, 0.003)
+    gt_boundaries = _label_boundaries(gt, labels_gt, bound_pix)
+    pred_boundaries = _label_boundaries(prediction, labels_pred, bound_pix)
+
+    # For every pair of GT label vs. predicted label: precision and recall true positives,
+    #   counted only where the boundary of one meets the dilated boundary of the other
+    for i, (gt_boundary, gt_box, gt_dil, gt_dil_box) in enumerate(gt_boundaries):
+        for j, (fg_boundary, fg_box, fg_dil, fg_dil_box) in enumerate(pred_boundaries):
+            boundary_stuff[i,j] = (_masked_count(fg_boundary, fg_box, gt_dil, gt_dil_box),
+                                   _masked_count(gt_boundary, gt_box, fg_dil, fg_dil_box))
 
     ### More Boundary Stuff ###
     boundary_prec_denom = 0. # precision_tps + precision_fps
-    for pred_j in labels_pred:
-        pred_mask = (prediction == pred_j)
-        boundary_prec_denom += np.sum(seg2bmap(pred_mask))
+    for fg_boundary, _, _, _ in pred_boundaries:
+        boundary_prec_denom += np.sum(fg_boundary)
     boundary_rec_denom = 0. # recall_tps + recall_fns
-    for gt_i in labels_gt:
-        gt_mask = (gt == gt_i)
-        boundary_rec_denom += np.sum(seg2bmap(gt_mask))
+    for gt_boundary, _, _, _ in gt_boundaries:
+        boundary_rec_denom += np.sum(gt_boundary)
 
     ### Compute the Hungarian assignment ###
     F[np.isnan(F)] = 0
@@ -0,0 +1,276 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import os
+import sys
+import logging
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .evaluation import multilabel_metrics
+
+# per-modality image directories of the datasets; the sequence is the directory above them
+_IMAGE_DIRS = ("rgb", "depth", "label", "pcd", "image_color", "annotation", "disparity")
+
+
+def sequence_name(filename):
+    """
+    Sequence of a dataset frame from its relative filename, e.g.
+    'ARID20/table/top/seq05/rgb/result_x.png' -> 'ARID20/table/top/seq05'.
+    """
+    if isinstance(filename, (list, tuple)):
+        # a DataLoader batch of one
+        filename = filename[0]
+    directory = os.path.dirname(filename)
+    if os.path.basename(directory) in _IMAGE_DIRS:
+        directory = os.path.dirname(directory)
+    return directory or "."
+
+
+class MetricsAccumulator(object):
+    """
+    Streaming mean of per-frame multilabel_metrics dicts, overall, per sequence and per number of
+    ground-truth objects. Only running sums are kept, never the per-frame dicts.
+
+    Sums are added in the order frames are added, so mean() equals summing a list of the
+    per-frame dicts and dividing by their number.
+
+    Attributes:
+        num (int): Frames added.
+        sums (dict): Metric name -> sum over all frames.
+        by_sequence (dict): Sequence -> [sums, num].
+        by_object_count (dict): Number of GT objects ('obj_gt') -> [sums, num].
+    """
+
+    def __init__(self):
+        self.num = 0
+        self.sums = {}
+        self.by_sequence = collections.OrderedDict()
+        self.by_object_count = {}
+
+    @staticmethod
+    def _add(sums, metrics):
+        for k in metrics.keys():
+            sums[k] = sums.get(k, 0) + metrics[k]
+
+    @staticmethod
+    def _mean(sums, num):
+        return {k: sums[k] / num for k in sums.keys()}
+
+    def add(self, metrics, sequence=None):
+        """
+        Add one frame's metrics.
+
+        Args:
+            metrics (dict): multilabel_metrics output.
+            sequence (str, optional): Sequence the frame belongs to.
+        """
+        self.num += 1
+        self._add(self.sums, metrics)
+        if sequence is not None:
+            group = self.by_sequence.setdefault(sequence, [{}, 0])
+            self._add(group[0], metrics)
+            group[1] += 1
+        group = self.by_object_count.setdefault(int(metrics.get("obj_gt", 0)), [{}, 0])
+        self._add(group[0], metrics)
+        group[1] += 1
+
+    def mean(self):
+        """
+        Mean of every metric over all frames; empty before any frame is added.
+        """
+        return self._mean(self.sums, self.num) if self.num else {}
+
+    def mean_by_sequence(self):
+        """
+        Sequence -> mean metrics, in the order sequences were first seen.
+        """
+        return collections.OrderedDict((seq, self._mean(sums, num)) for seq, (sums, num) in self.by_sequence.items())
+
+    def mean_by_object_count(self):
+        """
+        Number of GT objects -> mean metrics, by increasing object count.
+        """
+        return {count: self._mean(*self.by_object_count[count]) for count in sorted(self.by_object_count)}
+
+    def report(self, keys=("Objects F-measure", "Boundary F-measure", "obj_detected_075_percentage")):
+        """
+        Per-sequence and per-object-count breakdown of a few metrics as text.
+        """
+        header = f"{'':>32s} {'frames':>7s} " + " ".join(f"{k[:18]:>18s}" for k in keys)
+        lines = [header]
+
+        def row(name, sums, num):
+            mean = self._mean(sums, num)
+            lines.append(f"{str(name)[-32:]:>32s} {num:7d} " + " ".join(f"{mean.get(k, float('nan')):18.4f}" for k in keys))
+
+        for seq, (sums, num) in self.by_sequence.items():
+            row(seq, sums, num)
+        for count in sorted(self.by_object_count):
+            row(f"{count} objects", *self.by_object_count[count])
+        if self.num:
+            row("all", self.sums, self.num)
+        return "\n".join(lines)
+
+
+class EvaluationRunner(object):
+    """
+    Computes multilabel_metrics in a process pool while the caller keeps running inference.
+
+    Frames are submitted as (prediction, gt) label maps; finished results are streamed into a
+    MetricsAccumulator in submission order as soon as they (and every earlier frame) are done,
+    so the averages are exactly those of the serial loop. At most max_pending frames are in
+    flight; submit blocks on the oldest one beyond that.
+
+        with EvaluationRunner(num_workers=4) as runner:
+            for sample in loader:
+                prediction = ...                       # inference on the main process
+                runner.submit(prediction, gt, sequence=sequence_name(sample['filename']))
+        print(runner.accumulator.mean())
+
+    Attributes:
+        accumulator (MetricsAccumulator): Streamed per-frame results.
+        num_workers (int): Worker processes; 0 computes metrics inline.
+        max_pending (int): Maximum frames in flight.
+        callback (callable): Called as callback(index, metrics) for every finished frame, in order.
+        errors (list): (index, sequence, exception) of every frame whose evaluation failed.
+        logger: Logger instance for logging.
+    """
+
+    def __init__(self, num_workers=None, max_pending=None, obj_detect_threshold=0.75, callback=None,
+                 start_method="spawn"):
+        """
+        Initializes the EvaluationRunner class.
+
+        Args:
+            num_workers (int, optional): Worker processes. Defaults to os.cpu_count() - 1 (at least 1);
+                0 evaluates inline on the calling process.
+            max_pending (int, optional): Maximum frames in flight. Defaults to 4 * num_workers.
+            obj_detect_threshold (float): Passed to multilabel_metrics. Default is 0.75.
+            callback (callable, optional): callback(index, metrics) per finished frame, in order.
+            start_method (str): Worker start method. Default is "spawn", which is safe when the
+                parent process has initialized CUDA. Spawned workers re-import the calling script,
+                so keep its predictor imports and setup under `if __name__ == '__main__'`; workers
+                only need rkit.evaluation.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.num_workers = max((os.cpu_count() or 2) - 1, 1) if num_workers is None else num_workers
+        self.max_pending = max_pending or 4 * max(self.num_workers, 1)
+        self.obj_detect_threshold = obj_detect_threshold
+        self.callback = callback
+        self.accumulator = MetricsAccumulator()
+        self._pool = (ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context(start_method))
+                      if self.num_workers > 0 else None)
+        self.errors = []
+        # (frame index, future, sequence), oldest first
+        self._pending = collections.deque()
+        self._submitted = 0
+
+    def _collect(self, index, future, sequence):
+        try:
+            metrics = future.result()
+        except Exception as e:
+            self.errors.append((index, sequence, e))
+            self.logger.error(f"Error evaluating frame {index}: {e}")
+            raise e
+        self.accumulator.add(metrics, sequence)
+        if self.callback is not None:
+            self.callback(index, metrics)
+
+    def _drain(self, block=False, keep=0):
+        """
+        Stream finished frames, in order, into the accumulator. With block, wait until at most
+        keep frames are pending.
+        """
+        while self._pending and (len(self._pending) > keep if block else self._pending[0][1].done()):
+            self._collect(*self._pending.popleft())
+
+    def submit(self, prediction, gt, sequence=None):
+        """
+        Queue one frame for evaluation.
+
+        Args:
+            prediction (numpy.ndarray): [H, W] predicted label map.
+            gt (numpy.ndarray): [H, W] ground-truth label map.
+            sequence (str, optional): Sequence of the frame, for the per-sequence breakdown.
+
+        Returns:
+            int: Index of the frame.
+        """
+        index = self._submitted
+        if self._pool is None:
+            future = _Done(multilabel_metrics, prediction, gt, self.obj_detect_threshold)
+        else:
+            try:
+                future = self._pool.submit(multilabel_metrics, prediction, gt, self.obj_detect_threshold)
+            except Exception as e:
+                self.logger.error(f"Error submitting frame {index}: {e}")
+                raise e
+        self._pending.append((index, future, sequence))
+        self._submitted += 1
+
+        # raises the error of an earlier frame that failed, logged with its own index
+        self._drain(block=len(self._pending) > self.max_pending, keep=self.max_pending)
+        return index
+
+    def finish(self):
+        """
+        Wait for every submitted frame and shut the pool down.
+
+        Returns:
+            MetricsAccumulator: The accumulated results.
+        """
+        try:
+            self._drain(block=True)
+            return self.accumulator
+        finally:
+            if self._pool is not None:
+                self._shutdown(wait=True)
+
+    def _shutdown(self, wait):
+        """
+        Shut the pool down, cancelling frames that have not started.
+        """
+        if sys.version_info >= (3, 9):
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+        else:
+            # no cancel_futures before Python 3.9
+            for _, future, _ in self._pending:
+                future.cancel()
+            self._pool.shutdown(wait=wait)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        elif self._pool is not None:
+            self._shutdown(wait=False)
+        return False
+
+
+class _Done(object):
+    """
+    fn(*args) computed inline, with the part of the Future interface the runner uses.
+    """
+    def __init__(self, fn, *args):
+        self._value = self._error = None
+        try:
+            self._value = fn(*args)
+        except Exception as e:
+            self._error = e
+
+    def done(self):
+        return True
+
+    def cancel(self):
+        return False
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
@@ -0,0 +1,218 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import os
+import json
+import hashlib
+import logging
+import torch
+import numpy as np
+from PIL import Image as PILImg
+
+
+def image_hash(image):
+    """
+    Content hash of an image. A PIL image and its numpy array hash to the same key.
+
+    Parameters:
+    - image: A file path, PIL.Image, numpy array or torch tensor.
+
+    Returns:
+    - str: Hex digest identifying the image content.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+    if isinstance(image, PILImg.Image):
+        image = np.asarray(image)
+    if torch.is_tensor(image):
+        image = image.detach().cpu().numpy()
+    image = np.ascontiguousarray(image)
+    h.update(f"{image.dtype}{image.shape}".encode())
+    h.update(image.data)
+    return h.hexdigest()
+
+
+class FeatureStore(object):
+    """
+    On-disk store of dense (upsampled) features for one backbone and input size.
+
+    Features are stored as float16 in fixed-size, memory-mapped shards
+    <root>/<backbone_alias>_<input_size>/shard_XXXXX.npy of shape [shard_size, C, H, W].
+    index.json maps image hashes to (shard, row), so a store can be reopened and
+    extended across runs. Reads return views into the memory map without copying.
+
+    Attributes:
+        path (str): Directory holding this store's shards and index.
+        backbone_alias (str): FeatUp backbone alias.
+        input_size (int): FeatUp input size.
+        shard_size (int): Number of images per shard.
+        feature_shape (tuple): (C, H, W) of stored features, None until the first write.
+        logger: Logger instance for logging.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root, backbone_alias, input_size, shard_size=256):
+        """
+        Open or create the store for (backbone_alias, input_size) under root.
+
+        Parameters:
+        - root (str): Root directory for all feature stores.
+        - backbone_alias (str): FeatUp backbone alias, e.g. 'dinov2'.
+        - input_size (int): FeatUp input size.
+        - shard_size (int): Images per shard for a new store. Default is 256.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.backbone_alias = backbone_alias
+        self.input_size = input_size
+        self.path = os.path.join(root, f"{backbone_alias}_{input_size}")
+        self._shards = {}
+
+        index_file = os.path.join(self.path, self.INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                meta = json.load(f)
+            self.shard_size = meta["shard_size"]
+            self.feature_shape = tuple(meta["feature_shape"]) if meta["feature_shape"] else None
+            self._index = {k: tuple(v) for k, v in meta["index"].items()}
+            self._count = meta["count"]
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self.shard_size = shard_size
+            self.feature_shape = None
+            self._index = {}
+            self._count = 0
+            self._save_index()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def keys(self):
+        return self._index.keys()
+
+    def missing(self, keys):
+        """
+        Return the keys that are not stored yet, in order.
+        """
+        return [k for k in keys if k not in self._index]
+
+    def _save_index(self):
+        tmp_file = os.path.join(self.path, self.INDEX_FILE + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "backbone_alias": self.backbone_alias,
+                "input_size": self.input_size,
+                "shard_size": self.shard_size,
+                "feature_shape": list(self.feature_shape) if self.feature_shape else None,
+                "count": self._count,
+                "index": self._index,
+            }, f)
+        os.replace(tmp_file, os.path.join(self.path, self.INDEX_FILE))
+
+    def _shard(self, shard_id, create=False):
+        """
+        Memory map of one shard, opened lazily and kept open.
+        """
+        if shard_id not in self._shards:
+            shard_file = os.path.join(self.path, f"shard_{shard_id:05d}.npy")
+            if create and not os.path.exists(shard_file):
+                self._shards[shard_id] = np.lib.format.open_memmap(
+                    shard_file, mode="w+", dtype=np.float16, shape=(self.shard_size, *self.feature_shape))
+            else:
+                self._shards[shard_id] = np.load(shard_file, mmap_mode="r+")
+        return self._shards[shard_id]
+
+    def put(self, keys, features):
+        """
+        Write features for a batch of images. Keys already in the store are skipped.
+
+        Parameters:
+        - keys (list of str): Image hashes, one per feature map.
+        - features (numpy.ndarray or torch.Tensor): [B, C, H, W] features.
+
+        Raises:
+        - ValueError: If the feature shape does not match the store.
+        """
+        if torch.is_tensor(features):
+            features = features.detach().to("cpu").half().numpy()
+        features = np.asarray(features, dtype=np.float16)
+        if self.feature_shape is None:
+            self.feature_shape = tuple(features.shape[1:])
+        if tuple(features.shape[1:]) != self.feature_shape:
+            raise ValueError(f"Feature shape {features.shape[1:]} does not match store shape {self.feature_shape}")
+
+        touched = set()
+        for key, feature in zip(keys, features):
+            if key in self._index:
+                continue
+            shard_id, row = divmod(self._count, self.shard_size)
+            self._shard(shard_id, create=True)[row] = feature
+            self._index[key] = (shard_id, row)
+            self._count += 1
+            touched.add(shard_id)
+        for shard_id in touched:
+            self._shards[shard_id].flush()
+        self._save_index()
+
+    def get(self, key, region=None):
+        """
+        Zero-copy view of the stored features of one image.
+
+        Parameters:
+        - key (str): Image hash.
+        - region (tuple, optional): (y0, y1, x0, x1) in feature-map pixels.
+
+        Returns:
+        - numpy.ndarray: float16 view of shape [C, H, W] or [C, y1 - y0, x1 - x0].
+
+        Raises:
+        - KeyError: If the image is not in the store.
+        """
+        shard_id, row = self._index[key]
+        features = self._shard(shard_id)[row]
+        if region is not None:
+            y0, y1, x0, x1 = region
+            features = features[:, y0:y1, x0:x1]
+        return features
+
+    def get_batch(self, keys, region=None):
+        """
+        Stack the stored features of several images into a new [B, C, H, W] float16 array.
+        """
+        return np.stack([self.get(k, region) for k in keys])
+
+    def populate(self, featup, images, batch_size=8):
+        """
+        Compute and store upsampled features for the images that are not stored yet.
+
+        Parameters:
+        - featup (FeatUp): Upsampler whose backbone_alias and input_size match the store.
+        - images (list of PIL.Image): Input images.
+        - batch_size (int): Images per FeatUp call. Default is 8.
+
+        Returns:
+        - list of str: Hash key of every input image, in order.
+
+        Raises:
+        - ValueError: If featup does not match the store's backbone or input size.
+        """
+        if featup.backbone_alias != self.backbone_alias or featup.input_size != self.input_size:
+            raise ValueError(f"FeatUp ({featup.backbone_alias}, {featup.input_size}) does not match store "
+                             f"({self.backbone_alias}, {self.input_size})")
+        keys = [image_hash(img) for img in images]
+        todo = [(k, img) for k, img in dict(zip(keys, images)).items() if k not in self._index]
+        self.logger.info(f"Feature store {self.path}: {len(todo)} of {len(keys)} images to extract")
+        for start in range(0, len(todo), batch_size):
+            chunk = todo[start:start + batch_size]
+            image_tensor = torch.stack([featup.img_transform(img.convert("RGB")) for _, img in chunk])
+            _, _, upsampled_features = featup.upsample(image_tensor)
+            self.put([k for k, _ in chunk], upsampled_features)
+        return keys
@@ -15,22 +15,27 @@ from PIL import Image as PILImg
 import torchvision.transforms as tvT
 from featup.util import norm, unnorm
 from featup.plotting import plot_feats
-from torchvision.ops import box_convert
+from torchvision.ops import box_convert, roi_align
 from huggingface_hub import hf_hub_download
 from groundingdino.models import build_model
 import groundingdino.datasets.transforms as T
 from groundingdino.util.slconfig import SLConfig
-from groundingdino.util.inference import predict
-from groundingdino.util.utils import clean_state_dict
+from groundingdino.util.inference import predict, preprocess_caption
+from groundingdino.util.utils import clean_state_dict, get_phrases_from_posmap
 # from segment_anything import SamPredictor, SamAutomaticMaskGenerator, sam_model_registry
 from mobile_sam import sam_model_registry, SamAutomaticMaskGenerator, SamPredictor
-from transformers import AutoImageProcessor, AutoModelForDepthEstimation
+from transformers import AutoModelForDepthEstimation
 from sam2.build_sam import build_sam2_video_predictor, build_sam2
 from sam2.sam2_image_predictor import SAM2ImagePredictor
 
 from matplotlib import (patches, pyplot as plt)
 import matplotlib.cm as cm
 
+from .embedding_index import EmbeddingIndex
+from .tracing import span
+from .colormap import quantize, colorize
+from .renderer import AnnotationRenderer
+
 
 os.system("python setup.py build develop --user")
 os.system("pip install packaging==21.3")
@@ -39,6 +44,9 @@ warnings.filterwarnings("ignore")
 # resolve pyqt5 and cv2 issue
 os.environ.pop("QT_QPA_PLATFORM_PLUGIN_PATH")
 
+# precision names accepted by the predictors
+TORCH_DTYPES = {'fp32': torch.float32, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+
 class Logger(object):
     """
     This is a logger class.
@@ -154,25 +162,45 @@ class FeatUp(FeatureUpSampler):
     """
     A class for upsampling features using a pre-trained backbone model.
 
+    The backbone runs once per image; its low-resolution features are passed straight to the
+    JBU upsampler. With max_upsample_bytes set, upsampling is split into batch chunks and, when
+    a single image would still exceed the ceiling, into spatial tiles with a halo of backbone
+    cells. Tiled output is approximate: each JBU stage adaptively pools its guidance image,
+    and the pooling bins of a tile differ from those of the full image, so values near tile
+    seams can deviate from the untiled result. The halo reduces but does not remove this.
+
     Attributes:
         input_size (int): Input size of the images.
         backbone_alias (str): Alias of the pre-trained backbone model.
         upsampler (torch.nn.Module): Feature upsampling module.
+        max_upsample_bytes (int): Approximate memory ceiling for one upsampling call, None for no limit.
+        output_device (str): Device on which upsampled features are gathered.
         logger (logging.Logger): Logger object for logging.
     """
+    UPSAMPLE_FACTOR = 16  # JBU stack: four 2x stages
+    UPSAMPLE_MEMORY_FACTOR = 64  # rough peak/output ratio of the JBU stack (7x7 unfolded range kernels)
 
-    def __init__(self, backbone_alias, input_size, visualize_output=False):
+    def __init__(self, backbone_alias, input_size, visualize_output=False, max_upsample_bytes=None,
+                 tile_halo=4, output_device=None):
         """
         Initializes the FeatUp class.
 
         Args:
             backbone_alias (str): Alias of the pre-trained backbone model.
             input_size (int): Input size of the images.
+            visualize_output (bool): Plot input image with backbone and upsampled features. Default is False.
+            max_upsample_bytes (int, optional): Approximate memory ceiling for one upsampling call.
+            tile_halo (int): Backbone cells of context added around each spatial tile. Default is 4.
+            output_device (str, optional): Device for the upsampled features, e.g. 'cpu' to keep large
+                outputs off the GPU. Defaults to self.device.
         """
         super(FeatUp, self).__init__()
         self.input_size = input_size
         self.backbone_alias = backbone_alias
         self.visualize_output = visualize_output
+        self.max_upsample_bytes = max_upsample_bytes
+        self.tile_halo = tile_halo
+        self.output_device = output_device or self.device
         self.img_transform = tvT.Compose([
             tvT.Resize(self.input_size),
             tvT.CenterCrop((self.input_size, self.input_size)),
@@ -185,6 +213,73 @@ class FeatUp(FeatureUpSampler):
             self.logger.error(f"Error loading FeatUp model: {e}")
             raise e
 
+    def _upsample_bytes(self, features, num_images, cells_h, cells_w):
+        """
+        Estimated peak memory of upsampling num_images images over a cells_h x cells_w feature grid.
+        """
+        return (num_images * features.shape[1] * cells_h * cells_w * self.UPSAMPLE_FACTOR ** 2
+                * features.element_size() * self.UPSAMPLE_MEMORY_FACTOR)
+
+    def _upsample_tiled(self, features, guidance, tile):
+        """
+        Upsample features tile by tile, each tile extended by self.tile_halo cells of context.
+        Approximates the untiled output; see the class docstring.
+        """
+        _, _, h, w = features.shape
+        scale, halo = self.UPSAMPLE_FACTOR, self.tile_halo
+        px_h, px_w = guidance.shape[-2] / h, guidance.shape[-1] / w
+        out = None
+        for y0 in range(0, h, tile):
+            for x0 in range(0, w, tile):
+                y1, x1 = min(y0 + tile, h), min(x0 + tile, w)
+                hy0, hx0 = max(0, y0 - halo), max(0, x0 - halo)
+                hy1, hx1 = min(h, y1 + halo), min(w, x1 + halo)
+                up = self.upsampler.upsampler(
+                    features[:, :, hy0:hy1, hx0:hx1],
+                    guidance[:, :, round(hy0 * px_h):round(hy1 * px_h), round(hx0 * px_w):round(hx1 * px_w)],
+                )
+                if out is None:
+                    out = up.new_empty((*up.shape[:2], h * scale, w * scale), device=self.output_device)
+                out[:, :, y0 * scale:y1 * scale, x0 * scale:x1 * scale] = \
+                    up[:, :, (y0 - hy0) * scale:(y1 - hy0) * scale, (x0 - hx0) * scale:(x1 - hx0) * scale]
+        return out
+
+    def upsample_features(self, backbone_features, image_tensor):
+        """
+        Upsample precomputed backbone features, guided by the input images, within max_upsample_bytes.
+
+        Args:
+            backbone_features (torch.Tensor): [B, C, h, w] low-resolution backbone features.
+            image_tensor (torch.Tensor): [B, 3, H, W] normalized guidance images.
+
+        Returns:
+            torch.Tensor: [B, C, 16h, 16w] upsampled features on self.output_device.
+        """
+        batch_size, _, h, w = backbone_features.shape
+        if self.max_upsample_bytes is None:
+            return self.upsampler.upsampler(backbone_features, image_tensor).to(self.output_device)
+
+        per_image = self._upsample_bytes(backbone_features, 1, h, w)
+        chunk = max(1, int(self.max_upsample_bytes // per_image))
+        if per_image <= self.max_upsample_bytes:
+            tile = max(h, w)
+        else:
+            # largest square tile (plus halo) that fits under the ceiling
+            tile = max(h, w)
+            while tile > 1 and self._upsample_bytes(backbone_features, 1, tile + 2 * self.tile_halo,
+                                                    tile + 2 * self.tile_halo) > self.max_upsample_bytes:
+                tile //= 2
+
+        outputs = []
+        for start in range(0, batch_size, chunk):
+            features = backbone_features[start:start + chunk]
+            guidance = image_tensor[start:start + chunk]
+            if tile >= max(h, w):
+                outputs.append(self.upsampler.upsampler(features, guidance).to(self.output_device))
+            else:
+                outputs.append(self._upsample_tiled(features, guidance, tile))
+        return torch.cat(outputs)
+
     def upsample(self, image_tensor):
         """
         Upsamples the features of encoded input image tensor.
@@ -196,9 +291,13 @@ class FeatUp(FeatureUpSampler):
             Tuple: A tuple containing the original image tensor, backbone features, and upsampled features.
         """
         try:
-            image_tensor = image_tensor.to(self.device)
-            upsampled_features = self.upsampler(image_tensor) # upsampled features using backbone features; high resolution
-            backbone_features = self.upsampler.model(image_tensor) # backbone features; low resolution
+            with span("featup.upload"):
+                image_tensor = image_tensor.to(self.device)
+            with torch.no_grad():
+                with span("featup.backbone"):
+                    backbone_features = self.upsampler.model(image_tensor) # backbone features; low resolution
+                with span("featup.upsample"):
+                    upsampled_features = self.upsample_features(backbone_features, image_tensor) # high resolution
             orig_image = unnorm(image_tensor)
             batch_size = orig_image.shape[0]
             if self.visualize_output:
@@ -216,53 +315,262 @@ class DepthAnythingPredictor(DepthPredictor):
     """
     A predictor class for depth estimation using a pre-trained model.
 
+    Images are resized and normalized as torch tensors on self.device (matching the
+    HuggingFace image processor: aspect-preserving bicubic resize to a multiple of 14 with
+    the short side near input_size, ImageNet normalization), so batches never leave the device.
+
     Attributes:
-        image_processor: Pre-trained image processor.
         model: Pre-trained depth estimation model.
+        input_size (int): Target model input size.
+        precision (str): Model weight precision, one of 'fp32', 'fp16', 'bf16'.
         logger: Logger instance for logging errors.
     """
-    def __init__(self):
+    IMAGE_MEAN = (0.485, 0.456, 0.406)
+    IMAGE_STD = (0.229, 0.224, 0.225)
+    PATCH_MULTIPLE = 14
+
+    def __init__(self, model_id="LiheYoung/depth-anything-small-hf", precision='fp32', input_size=518):
         """
         Initializes the DepthAnythingPredictor class.
+
+        Args:
+            model_id (str): HuggingFace model id. Default is "LiheYoung/depth-anything-small-hf".
+            precision (str): 'fp32', 'fp16' or 'bf16'. Default is 'fp32'.
+            input_size (int): Target model input size. Default is 518.
+
+        Raises:
+            ValueError: If the precision is not supported.
         """
-        super(DepthPredictor, self).__init__() 
-        self.image_processor = AutoImageProcessor.from_pretrained("LiheYoung/depth-anything-small-hf")
-        self.model = AutoModelForDepthEstimation.from_pretrained("LiheYoung/depth-anything-small-hf")
-        self.logger = logging.getLogger(__name__)
+        super(DepthAnythingPredictor, self).__init__()
+        if precision not in TORCH_DTYPES:
+            raise ValueError(f"Unsupported precision '{precision}', expected one of {tuple(TORCH_DTYPES)}")
+        self.precision = precision
+        self.dtype = TORCH_DTYPES[precision]
+        self.input_size = input_size
+        self.model = AutoModelForDepthEstimation.from_pretrained(model_id).to(self.device, dtype=self.dtype)
+        self.model.eval()
+
+    def _model_input_size(self, h, w):
+        """
+        Output size of the HuggingFace DPT resize (keep_aspect_ratio, ensure_multiple_of=14).
+        """
+        scale_h, scale_w = self.input_size / h, self.input_size / w
+        # scale as little as possible
+        scale = scale_w if abs(1 - scale_w) < abs(1 - scale_h) else scale_h
+        return (max(self.PATCH_MULTIPLE, round(scale * h / self.PATCH_MULTIPLE) * self.PATCH_MULTIPLE),
+                max(self.PATCH_MULTIPLE, round(scale * w / self.PATCH_MULTIPLE) * self.PATCH_MULTIPLE))
+
+    def to_tensor(self, images):
+        """
+        Stack input images into a [B, 3, H, W] tensor on self.device.
+
+        Args:
+            images: A PIL image, a list of PIL images, a numpy array [H, W, 3] or [B, H, W, 3],
+                or a torch tensor [3, H, W] or [B, 3, H, W]. Integer inputs are treated as 0-255.
+
+        Returns:
+            torch.Tensor: Float tensor in [0, 1] of shape [B, 3, H, W].
+        """
+        if isinstance(images, PILImg.Image):
+            images = [images]
+        if isinstance(images, (list, tuple)):
+            images = np.stack([np.asarray(img.convert('RGB')) for img in images])
+        if isinstance(images, np.ndarray):
+            images = torch.from_numpy(images[None] if images.ndim == 3 else images).permute(0, 3, 1, 2)
+        images = images[None] if images.dim() == 3 else images
+        images = images.to(self.device, non_blocking=True)
+        return images.float() / 255.0 if not images.is_floating_point() else images.float()
+
+    def preprocess(self, images):
+        """
+        Resize and normalize images for the model on self.device.
+
+        Args:
+            images: See to_tensor.
+
+        Returns:
+            torch.Tensor: Model input of shape [B, 3, h, w] in the model dtype.
+        """
+        images = self.to_tensor(images)
+        size = self._model_input_size(*images.shape[-2:])
+        images = torch.nn.functional.interpolate(images, size=size, mode="bicubic", align_corners=False, antialias=True)
+        mean = torch.tensor(self.IMAGE_MEAN, device=self.device).view(1, 3, 1, 1)
+        std = torch.tensor(self.IMAGE_STD, device=self.device).view(1, 3, 1, 1)
+        return ((images.clamp(0, 1) - mean) / std).to(self.dtype)
+
+    def predict_batch(self, images, output_size=None):
+        """
+        Predicts raw depth for a batch of same-sized images.
+
+        Args:
+            images: See to_tensor.
+            output_size (tuple, optional): (height, width) of the returned depth. Defaults to the
+                input resolution; pass the model input size to skip upsampling entirely.
+
+        Returns:
+            torch.Tensor: Predicted depth of shape [B, H, W], float32 on self.device.
+        """
+        try:
+            with span("depth.preprocess"):
+                images = self.to_tensor(images)
+                output_size = output_size or tuple(images.shape[-2:])
+                inputs = self.preprocess(images)
+
+            with span("depth.forward"), torch.no_grad():
+                predicted_depth = self.model(pixel_values=inputs).predicted_depth
+
+            with span("depth.postprocess"):
+                predicted_depth = predicted_depth.float().unsqueeze(1)
+                if tuple(predicted_depth.shape[-2:]) != tuple(output_size):
+                    predicted_depth = torch.nn.functional.interpolate(
+                        predicted_depth,
+                        size=tuple(output_size),
+                        mode="bicubic",
+                        align_corners=False,
+                    )
+            return predicted_depth[:, 0]
+
+        except Exception as e:
+            self.logger.error(f"Error predicting depth batch: {e}")
+            raise e
+
+    def _change_thumbnail(self, frame):
+        """
+        Small grayscale copy of a [1, 3, H, W] frame used to measure frame-to-frame change.
+        """
+        return torch.nn.functional.adaptive_avg_pool2d(frame.mean(dim=1, keepdim=True), (48, 64))
 
-    def predict(self, img_pil):
+    def predict_sequence(self, frames, output_path, num_frames=None, batch_size=8, change_threshold=None,
+                         output_size=None, output_dtype='float16', depth_scale=1000.0):
+        """
+        Predicts depth for a stream of frames into a memory-mapped .npy array.
+
+        Frames are batched through the model; only batch_size frames are held in memory at once.
+        When change_threshold is set, a frame whose mean absolute difference (on a 48x64 grayscale
+        thumbnail, intensities in [0, 1]) to the last inferred frame is below the threshold reuses
+        that frame's depth instead of running the model.
+
+        Args:
+            frames (iterable): PIL images, numpy [H, W, 3] arrays or [3, H, W] tensors of equal size.
+            output_path (str): Path of the .npy file to write.
+            num_frames (int, optional): Number of frames; defaults to len(frames).
+            batch_size (int): Frames per forward pass. Default is 8.
+            change_threshold (float, optional): Reuse threshold; None runs the model on every frame.
+            output_size (tuple, optional): (height, width) of the stored depth. Defaults to the frame size.
+            output_dtype (str): 'float16' stores raw depth, 'uint16' stores round(depth * depth_scale).
+            depth_scale (float): Scale applied for uint16 output. Default is 1000.
+
+        Returns:
+            Tuple[numpy.memmap, dict]: Read-only [T, H, W] depth array and frame statistics
+                ('frames', 'inferred', 'reused').
+
+        Raises:
+            ValueError: If the number of frames is unknown or output_dtype is unsupported.
+        """
+        if output_dtype not in ('float16', 'uint16'):
+            raise ValueError(f"Unsupported output_dtype '{output_dtype}', expected 'float16' or 'uint16'")
+        if num_frames is None:
+            if not hasattr(frames, '__len__'):
+                raise ValueError("num_frames is required when frames has no len()")
+            num_frames = len(frames)
+
+        out = None
+        pending = []     # (frame index, [1, 3, H, W] tensor) waiting for inference
+        deferred = []    # (frame index, keyframe index) whose keyframe is still pending
+        written = set()  # keyframes already written to out
+        keyframe_idx, keyframe_thumb = None, None
+        stats = {'frames': 0, 'inferred': 0, 'reused': 0}
+
+        def flush():
+            batch = torch.cat([frame for _, frame in pending])
+            depth = self.predict_batch(batch, output_size=output_size)
+            if output_dtype == 'uint16':
+                depth = (depth * depth_scale).round().clamp(0, 65535).to(torch.int32)
+            depth = depth.cpu().numpy().astype(output_dtype)
+            for (idx, _), d in zip(pending, depth):
+                out[idx] = d
+                written.add(idx)
+            for idx, key in deferred:
+                out[idx] = out[key]
+            stats['inferred'] += len(pending)
+            pending.clear()
+            deferred.clear()
+
+        try:
+            for idx, frame in enumerate(frames):
+                if idx >= num_frames:
+                    break
+                frame = self.to_tensor(frame)
+                if out is None:
+                    h, w = output_size or frame.shape[-2:]
+                    out = np.lib.format.open_memmap(output_path, mode='w+', dtype=output_dtype, shape=(num_frames, h, w))
+
+                if change_threshold is not None:
+                    thumb = self._change_thumbnail(frame)
+                    if keyframe_thumb is not None and (thumb - keyframe_thumb).abs().mean().item() < change_threshold:
+                        if keyframe_idx in written:
+                            out[idx] = out[keyframe_idx]
+                        else:
+                            deferred.append((idx, keyframe_idx))
+                        stats['reused'] += 1
+                        stats['frames'] += 1
+                        continue
+                    keyframe_idx, keyframe_thumb = idx, thumb
+
+                pending.append((idx, frame))
+                stats['frames'] += 1
+                if len(pending) == batch_size:
+                    flush()
+                    written = {keyframe_idx}
+
+            if pending:
+                flush()
+            if out is None:
+                raise ValueError("No frames to process")
+            out.flush()
+            del out
+            self.logger.info(f"Depth sequence: {stats['frames']} frames, {stats['inferred']} inferred, {stats['reused']} reused")
+            return np.load(output_path, mmap_mode='r')[:stats['frames']], stats
+
+        except Exception as e:
+            self.logger.error(f"Error predicting depth sequence: {e}")
+            raise e
+
+    def predict(self, img_pil, output_size=None, raw=False, colormap=None, percentiles=None):
         """
         Predicts depth from an input image.
 
+        The visualization is quantized (and optionally colorized through a cached lookup table,
+        see rkit.colormap) on self.device, so only uint8 pixels are transferred for it.
+
         Args:
-            PIL Image: Input image.
+            img_pil (PIL Image): Input image.
+            output_size (tuple, optional): (height, width) of the returned depth. Defaults to the image size.
+            raw (bool): If True, skip the uint8 PIL visualization and return None in its place.
+            colormap (str, optional): Matplotlib colormap name for an RGB visualization; grayscale when None.
+            percentiles (tuple, optional): (low, high) percentiles of the visualized range. Defaults to [0, max].
 
         Returns:
-            PIL Image: Predicted depth map as a PIL image.
+            PIL Image: Predicted depth map as a PIL image (None when raw is True).
             numpy.ndarray: Predicted depth values as a numpy array.
         """
         try:
             image = img_pil.convert('RGB')
+            output_size = output_size or image.size[::-1]
+            output = self.predict_batch(image, output_size=output_size)[0]
+
+            depth_pil = None
+            if not raw:
+                # visualize the prediction
+                vmin = None if percentiles else 0.0
+                if colormap is None:
+                    formatted = quantize(output, vmin=vmin, percentiles=percentiles)
+                else:
+                    formatted = colorize(output, colormap, vmin=vmin, percentiles=percentiles)
+                depth_pil = PILImg.fromarray(formatted.cpu().numpy())
 
-            # prepare image for the model
-            inputs = self.image_processor(images=image, return_tensors="pt")
-
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                predicted_depth = outputs.predicted_depth
-
-            # interpolate to original size
-            prediction = torch.nn.functional.interpolate(
-                predicted_depth.unsqueeze(1),
-                size=image.size[::-1],
-                mode="bicubic",
-                align_corners=False,
-            )
-
-            # visualize the prediction
-            output = prediction.squeeze().cpu().numpy()
-            formatted = (output * 255 / np.max(output)).astype("uint8")
-            depth_pil = PILImg.fromarray(formatted)
+            with span("depth.transfer"):
+                output = output.cpu().numpy()
             return depth_pil, output
 
         except Exception as e:
@@ -407,13 +715,53 @@ class GroundingDINOObjectPredictor(ObjectPredictor):
         - Exception: If an error occurs during model prediction.
         """
         try:
-            _, image_tensor = self.image_transform_grounding(image_pil)
-            bboxes, conf, phrases = predict(self.model, image_tensor, det_text_prompt, box_threshold=0.25, text_threshold=0.25, device=self.device)
+            with span("gdino.preprocess"):
+                _, image_tensor = self.image_transform_grounding(image_pil)
+            with span("gdino.forward"):
+                bboxes, conf, phrases = predict(self.model, image_tensor, det_text_prompt, box_threshold=0.25, text_threshold=0.25, device=self.device)
             return bboxes, phrases, conf        
         except Exception as e:
             self.logger.error(f"Error during model prediction: {e}")
             raise e
 
+    def predict_batch(self, images_pil, det_text_prompt="objects", box_threshold=0.25, text_threshold=0.25):
+        """
+        Get predictions for several images and one text prompt in a single forward pass.
+
+        The model pads the images to a common size and masks the padding, as in GroundingDINO
+        training, so results match predict() up to the effect of padding on the backbone.
+
+        Parameters:
+        - images_pil (list of PIL.Image): Input images, of any sizes.
+        - det_text_prompt (str): Text prompt for object detection
+        - box_threshold (float): Minimum box confidence. Default is 0.25, as in predict.
+        - text_threshold (float): Minimum token confidence for a phrase. Default is 0.25, as in predict.
+
+        Returns:
+        - list: (bboxes, phrases, conf) per image, as returned by predict.
+        """
+        try:
+            with span("gdino.preprocess", images=len(images_pil)):
+                image_tensors = [self.image_transform_grounding(image_pil)[1].to(self.device) for image_pil in images_pil]
+            caption = preprocess_caption(det_text_prompt)
+            self.model.to(self.device)
+            with span("gdino.forward", images=len(image_tensors)), torch.no_grad():
+                outputs = self.model(image_tensors, captions=[caption] * len(image_tensors))
+
+            # same post-processing as groundingdino.util.inference.predict, per image
+            tokenized = self.model.tokenizer(caption)
+            results = []
+            for logits, bboxes in zip(outputs["pred_logits"].cpu().sigmoid(), outputs["pred_boxes"].cpu()):
+                keep = logits.max(dim=1)[0] > box_threshold
+                logits, bboxes = logits[keep], bboxes[keep]
+                phrases = [get_phrases_from_posmap(logit > text_threshold, tokenized, self.model.tokenizer).replace('.', '')
+                           for logit in logits]
+                results.append((bboxes, phrases, logits.max(dim=1)[0]))
+            return results
+        except Exception as e:
+            self.logger.error(f"Error during batched model prediction: {e}")
+            raise e
+
 
 class SegmentAnythingPredictor(ObjectPredictor):
     """
@@ -462,13 +810,15 @@ class SegmentAnythingPredictor(ObjectPredictor):
                 # Convert prompt bounding boxes to torch tensor
                 input_boxes = torch.tensor(prompt_bboxes, device=self.device)
                 transformed_boxes = self.predictor.transform.apply_boxes_torch(input_boxes, image.shape[:2])
-                self.predictor.set_image(image)
-                masks, _, _ = self.predictor.predict_torch(
-                    point_coords=None,
-                    point_labels=None,
-                    boxes=transformed_boxes,
-                    multimask_output=False,
-                )
+                with span("sam.encode"):
+                    self.predictor.set_image(image)
+                with span("sam.decode", boxes=len(input_boxes)):
+                    masks, _, _ = self.predictor.predict_torch(
+                        point_coords=None,
+                        point_labels=None,
+                        boxes=transformed_boxes,
+                        multimask_output=False,
+                    )
             else:
                 input_boxes = None
                 masks = self.mask_generator.generate(image)
@@ -479,38 +829,306 @@ class SegmentAnythingPredictor(ObjectPredictor):
             print(f"ValueError: {ve}")
             return None, None
 
+    def predict_torch(self, image_tensor, prompt_bboxes):
+        """
+        Predict segmentation masks for box prompts without leaving the device.
+
+        Parameters:
+        - image_tensor (torch.Tensor): [3, H, W] RGB image, uint8 in [0, 255], on any device.
+        - prompt_bboxes (torch.Tensor): [N, 4] boxes in pixel xyxy format, on any device.
+
+        Returns:
+        - torch.Tensor: [N, 1, H, W] boolean masks on self.device.
+        """
+        try:
+            original_size = tuple(image_tensor.shape[-2:])
+            with span("sam.preprocess"):
+                image_tensor = image_tensor.to(self.device)
+                input_image = self.predictor.transform.apply_image_torch(image_tensor[None].float())
+            with span("sam.encode"):
+                self.predictor.set_torch_image(input_image, original_size)
+
+            return self._decode_boxes(prompt_bboxes, original_size)
+
+        except Exception as e:
+            self.logger.error(f"Error during SAM tensor prediction: {e}")
+            raise e
+
+    def predict_torch_batch(self, image_tensors, prompt_bboxes):
+        """
+        Batched predict_torch: the image encoder runs once on all images, then the boxes of each
+        image are decoded against its embedding.
+
+        Parameters:
+        - image_tensors (list of torch.Tensor): [3, H, W] RGB images, uint8 in [0, 255]; sizes may differ.
+        - prompt_bboxes (list of torch.Tensor): [N_i, 4] boxes in pixel xyxy format, one per image.
+
+        Returns:
+        - list of torch.Tensor: [N_i, 1, H_i, W_i] boolean masks per image on self.device.
+        """
+        try:
+            original_sizes, input_sizes, inputs = [], [], []
+            with span("sam.preprocess", images=len(image_tensors)):
+                for image_tensor in image_tensors:
+                    input_image = self.predictor.transform.apply_image_torch(image_tensor.to(self.device)[None].float())
+                    original_sizes.append(tuple(image_tensor.shape[-2:]))
+                    input_sizes.append(tuple(input_image.shape[-2:]))
+                    # normalized and padded to the encoder's square input, as in set_torch_image
+                    inputs.append(self.predictor.model.preprocess(input_image))
+            with span("sam.encode", images=len(inputs)), torch.no_grad():
+                features = self.predictor.model.image_encoder(torch.cat(inputs))
+
+            masks = []
+            for i, boxes in enumerate(prompt_bboxes):
+                # the state set_torch_image would leave for image i
+                self.predictor.reset_image()
+                self.predictor.features = features[i:i + 1]
+                self.predictor.original_size = original_sizes[i]
+                self.predictor.input_size = input_sizes[i]
+                self.predictor.is_image_set = True
+                masks.append(self._decode_boxes(boxes, original_sizes[i]))
+            return masks
+
+        except Exception as e:
+            self.logger.error(f"Error during batched SAM tensor prediction: {e}")
+            raise e
+
+    def _decode_boxes(self, prompt_bboxes, original_size):
+        """
+        Decode box prompts against the image embedding currently set on self.predictor.
+        """
+        if len(prompt_bboxes) == 0:
+            return torch.zeros((0, 1, *original_size), dtype=torch.bool, device=self.device)
+
+        boxes = torch.as_tensor(prompt_bboxes, dtype=torch.float32).to(self.device)
+        transformed_boxes = self.predictor.transform.apply_boxes_torch(boxes, original_size)
+        with span("sam.decode", boxes=len(boxes)):
+            masks, _, _ = self.predictor.predict_torch(
+                point_coords=None,
+                point_labels=None,
+                boxes=transformed_boxes,
+                multimask_output=False,
+            )
+        return masks
+
+
 
 class ZeroShotClipPredictor(CommonContextObject):
-    def __init__(self):
+    """
+    Zero-shot classifier using OpenAI CLIP.
+
+    Text prompts are encoded once and kept in a cache of normalized embeddings, so classifying
+    many frames against a fixed label set only pays for the image encoder.
+
+    Attributes:
+    - model (torch.nn.Module): The CLIP model.
+    - preprocess (callable): CLIP PIL preprocessing transform.
+    - max_batch_size (int): Maximum number of images passed to encode_image at once.
+    - variant (str): CLIP backbone name, e.g. 'RN50', 'ViT-B/32', 'ViT-B/16', 'ViT-L/14', 'ViT-L/14@336px'.
+    - precision (str): Model weight precision, one of 'fp32', 'fp16', 'bf16'.
+    """
+    VARIANTS = ('RN50', 'ViT-B/32', 'ViT-B/16', 'ViT-L/14', 'ViT-L/14@336px')
+    CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+    CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+    def __init__(self, max_batch_size=32, variant='ViT-L/14@336px', precision=None):
+        """
+        Initialize the ZeroShotClipPredictor object.
+
+        Parameters:
+        - max_batch_size (int): Maximum number of images encoded in one forward pass. Default is 32.
+        - variant (str): CLIP backbone to load. Default is 'ViT-L/14@336px'.
+        - precision (str, optional): 'fp32', 'fp16' or 'bf16'. Default keeps CLIP's own choice
+          (fp16 on cuda, fp32 on cpu).
+
+        Raises:
+        - ValueError: If the variant or precision is not supported.
+        """
         super(ZeroShotClipPredictor, self).__init__()
-        
+        if variant not in self.VARIANTS:
+            raise ValueError(f"Unsupported CLIP variant '{variant}', expected one of {self.VARIANTS}")
+        if precision is not None and precision not in TORCH_DTYPES:
+            raise ValueError(f"Unsupported precision '{precision}', expected one of {tuple(TORCH_DTYPES)}")
+
+        self.variant = variant
+        self.max_batch_size = max_batch_size
+        self._text_feature_cache = {}  # prompt string -> normalized text embedding [D]
+
         # Load the CLIP model
-        self.model, self.preprocess = clip.load('ViT-L/14@336px', self.device)
+        self.model, self.preprocess = clip.load(self.variant, self.device)
+        if precision is not None:
+            self.model = self.model.to(TORCH_DTYPES[precision])
+        self.precision = precision or {v: k for k, v in TORCH_DTYPES.items()}[self.model.dtype]
         self.model.eval()
 
+    def clear_text_cache(self):
+        """
+        Drop all cached text embeddings.
+        """
+        self._text_feature_cache.clear()
+
+    def encode_text_prompts(self, text_prompts):
+        """
+        Encode text prompts into normalized embeddings, reusing cached embeddings where possible.
+
+        Each entry of text_prompts is either a single prompt string or a list of prompt strings
+        (a prompt ensemble, e.g. ["a photo of a mug", "a mug on a table"]). The embedding of an
+        ensemble is the renormalized mean of its members' normalized embeddings.
+
+        Parameters:
+        - text_prompts (list): List of str or list of list of str.
+
+        Returns:
+        - torch.Tensor: Normalized text features of shape [len(text_prompts), D].
+        """
+        try:
+            ensembles = [[prompt] if isinstance(prompt, str) else list(prompt) for prompt in text_prompts]
+
+            # Encode every prompt string not seen before in a single batch
+            missing = list(dict.fromkeys(p for ensemble in ensembles for p in ensemble if p not in self._text_feature_cache))
+            if missing:
+                with span("clip.encode_text", prompts=len(missing)), torch.no_grad():
+                    text_inputs = clip.tokenize(missing).to(self.device)
+                    text_features = self.model.encode_text(text_inputs).float()
+                    text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+                for prompt, feature in zip(missing, text_features):
+                    self._text_feature_cache[prompt] = feature
+
+            text_features = []
+            for ensemble in ensembles:
+                feature = torch.stack([self._text_feature_cache[p] for p in ensemble]).mean(dim=0)
+                text_features.append(feature / feature.norm())
+            return torch.stack(text_features)
+
+        except RuntimeError as re:
+            self.logger.error(f"RuntimeError in encode_text_prompts: {re}")
+            raise re
+
+    def encode_images(self, images, max_batch_size=None):
+        """
+        Encode images into normalized embeddings, in chunks of at most max_batch_size images.
+
+        Parameters:
+        - images (list of PIL.Image): A list of PIL.Image representing images.
+        - max_batch_size (int, optional): Overrides self.max_batch_size for this call.
+
+        Returns:
+        - torch.Tensor: Normalized image features of shape [len(images), D].
+        """
+        try:
+            max_batch_size = max_batch_size or self.max_batch_size
+            img_features = []
+            with torch.no_grad():
+                for start in range(0, len(images), max_batch_size):
+                    chunk = images[start:start + max_batch_size]
+                    with span("clip.preprocess", images=len(chunk)):
+                        _images = torch.stack([self.preprocess(img) for img in chunk]).to(self.device)
+                    with span("clip.encode_image", images=len(chunk)):
+                        img_features.append(self.model.encode_image(_images).float())
+            img_features = torch.cat(img_features)
+            return img_features / img_features.norm(dim=-1, keepdim=True)
+
+        except RuntimeError as re:
+            self.logger.error(f"RuntimeError in encode_images: {re}")
+            raise re
+
+    def crop_boxes(self, image_tensor, boxes, masks=None):
+        """
+        Crop, resize and normalize image regions for the CLIP image encoder in one batched op.
+
+        Each box is shrunk to a centered square (the same region CLIP's resize + center crop
+        would keep) and resampled with roi_align to the model input resolution on self.device.
+
+        Parameters:
+        - image_tensor (torch.Tensor): [3, H, W] RGB image, uint8 in [0, 255] or float in [0, 1].
+        - boxes (torch.Tensor): [N, 4] boxes in pixel xyxy format.
+        - masks (torch.Tensor, optional): [N, H, W] or [N, 1, H, W] object masks. Pixels outside
+          an object's mask are filled with the CLIP mean color (zero after normalization).
+
+        Returns:
+        - torch.Tensor: [N, 3, R, R] normalized crops, where R is the CLIP input resolution.
+        """
+        try:
+            resolution = self.model.visual.input_resolution
+            image = image_tensor.to(self.device)
+            image = image.float() / 255.0 if not image.is_floating_point() else image.float()
+            boxes = torch.as_tensor(boxes, dtype=torch.float32, device=self.device).reshape(-1, 4)
+
+            # Square crop around the box center, side = shorter box side
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            half = (boxes[:, 2:] - boxes[:, :2]).min(dim=1, keepdim=True).values.clamp(min=1) / 2
+            square_boxes = torch.cat([centers - half, centers + half], dim=1)
+
+            crops = roi_align(image[None], [square_boxes], output_size=resolution, aligned=True)
+
+            mean = torch.tensor(self.CLIP_MEAN, device=self.device).view(1, 3, 1, 1)
+            std = torch.tensor(self.CLIP_STD, device=self.device).view(1, 3, 1, 1)
+            if masks is not None:
+                masks = masks.to(self.device).reshape(len(boxes), 1, *masks.shape[-2:]).float()
+                rois = torch.cat([torch.arange(len(boxes), device=self.device, dtype=torch.float32)[:, None], square_boxes], dim=1)
+                mask_crops = roi_align(masks, rois, output_size=resolution, aligned=True)
+                crops = crops * mask_crops + mean * (1 - mask_crops)
+
+            return (crops - mean) / std
+
+        except RuntimeError as re:
+            self.logger.error(f"RuntimeError in crop_boxes: {re}")
+            raise re
+
+    def classify_boxes(self, image_tensor, boxes, text_prompts, masks=None, max_batch_size=None):
+        """
+        Run zero-shot prediction on detected boxes without per-object CPU cropping.
+
+        Parameters:
+        - image_tensor (torch.Tensor): [3, H, W] RGB image, uint8 in [0, 255] or float in [0, 1].
+        - boxes (torch.Tensor): [N, 4] boxes in pixel xyxy format.
+        - text_prompts (list or EmbeddingIndex): Text prompts (str), prompt ensembles (list of str),
+          or a gallery of labelled image embeddings.
+        - masks (torch.Tensor, optional): [N, H, W] or [N, 1, H, W] masks used to blank the background.
+        - max_batch_size (int, optional): Overrides self.max_batch_size for this call.
+
+        Returns:
+        - Tuple: Tuple containing prediction confidence and indices.
+        """
+        try:
+            max_batch_size = max_batch_size or self.max_batch_size
+            if len(boxes) == 0:
+                return (torch.zeros(0, device=self.device), torch.zeros(0, dtype=torch.long, device=self.device))
+
+            img_features = []
+            with torch.no_grad():
+                for start in range(0, len(boxes), max_batch_size):
+                    chunk_masks = masks[start:start + max_batch_size] if masks is not None else None
+                    with span("clip.crop_boxes"):
+                        crops = self.crop_boxes(image_tensor, boxes[start:start + max_batch_size], chunk_masks)
+                    with span("clip.encode_image", images=len(crops)):
+                        img_features.append(self.model.encode_image(crops).float())
+            img_features = torch.cat(img_features)
+            img_features = img_features / img_features.norm(dim=-1, keepdim=True)
+            return self.match(img_features, text_prompts)
+
+        except Exception as e:
+            self.logger.error(f"Error during box classification: {e}")
+            raise e
+
     def get_features(self, images, text_prompts):
         """
         Extract features from a list of images and text prompts.
 
         Parameters:
         - images (list of PIL.Image): A list of PIL.Image representing images.
-        - text_prompts (list of str): List of text prompts.
+        - text_prompts (list): List of text prompts (str) or prompt ensembles (list of str).
 
         Returns:
-        - Tuple of numpy.ndarray: Concatenated image features and text features as numpy arrays.
+        - Tuple of torch.Tensor: Normalized image features and text features.
 
         Raises:
         - ValueError: If images is not a tensor or a list of tensors.
         - RuntimeError: If an error occurs during feature extraction.
         """
         try:
-
-            with torch.no_grad():
-                text_inputs = torch.cat([clip.tokenize(prompt) for prompt in text_prompts]).to(self.device)
-                _images = torch.stack([self.preprocess(img) for img in images]).to(self.device)
-                img_features = self.model.encode_image(_images)
-                text_features = self.model.encode_text(text_inputs)
-            
+            img_features = self.encode_images(images)
+            text_features = self.encode_text_prompts(text_prompts)
             return img_features, text_features
 
         except ValueError as ve:
@@ -520,30 +1138,75 @@ class ZeroShotClipPredictor(CommonContextObject):
             self.logger.error(f"RuntimeError in get_image_features: {re}")
             raise re
 
-    def predict(self, image_array, text_prompts):
+    def similarity(self, images, text_prompts):
         """
-        Run zero-shot prediction using CLIP model.
+        Compute the image-text similarity matrix using cached text features.
 
         Parameters:
-        - image_array (List[torch.tensor]): List of tensor images.
-        - text_prompts (list): List of text prompts for prediction.
+        - images (list of PIL.Image): A list of PIL.Image representing images.
+        - text_prompts (list): List of text prompts (str) or prompt ensembles (list of str).
 
         Returns:
-        - Tuple: Tuple containing prediction confidence and indices.
+        - torch.Tensor: Softmax-normalized similarity of shape [len(images), len(text_prompts)].
         """
-        try:
-            # Perform prediction
-            image_features, text_features = self.get_features(image_array, text_prompts)
+        image_features, text_features = self.get_features(images, text_prompts)
+        return (100.0 * image_features @ text_features.T).softmax(dim=-1)
 
-            # Normalize features
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
+    def add_to_index(self, index, images, labels):
+        """
+        Encode gallery images and add them to an embedding index.
+
+        Parameters:
+        - index (EmbeddingIndex): The gallery to extend.
+        - images (list of PIL.Image): Gallery images, e.g. crops of known object instances.
+        - labels (list): Instance label for each image.
+
+        Returns:
+        - numpy.ndarray: Row ids of the added embeddings.
+        """
+        return index.add(self.encode_images(images), labels)
+
+    def match(self, img_features, text_prompts, nprobe=None):
+        """
+        Match normalized image features against text prompts or an embedding index.
 
-            # Calculate similarity
-            similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
+        Parameters:
+        - img_features (torch.Tensor): [N, D] normalized image features.
+        - text_prompts (list or EmbeddingIndex): Text prompts (str), prompt ensembles (list of str),
+          or a gallery of labelled image embeddings.
+        - nprobe (int, optional): IVF partitions scanned per query when matching against an index.
+
+        Returns:
+        - Tuple: Prediction confidence and indices. For text prompts the confidence is the softmax
+          over prompts and indices point into text_prompts; for an index the confidence is the
+          cosine similarity of the nearest gallery row and indices are its row ids.
+        """
+        if isinstance(text_prompts, EmbeddingIndex):
+            with span("clip.index_search"):
+                scores, ids = text_prompts.search(img_features, k=1, nprobe=nprobe)
+            return (torch.from_numpy(scores).flatten(), torch.from_numpy(ids).flatten())
+
+        text_features = self.encode_text_prompts(text_prompts)
+        with span("clip.match"):
+            similarity = (100.0 * img_features @ text_features.T).softmax(dim=-1)
             pconf, indices = similarity.topk(1)
+        return (pconf.flatten(), indices.flatten())
+
+    def predict(self, image_array, text_prompts, nprobe=None):
+        """
+        Run zero-shot prediction using CLIP model.
+
+        Parameters:
+        - image_array (List[PIL.Image]): List of images.
+        - text_prompts (list or EmbeddingIndex): List of text prompts (str) or prompt ensembles
+          (list of str), or an EmbeddingIndex for instance recognition against a gallery.
+        - nprobe (int, optional): IVF partitions scanned per query when text_prompts is an index.
 
-            return (pconf.flatten(), indices.flatten())
+        Returns:
+        - Tuple: Tuple containing prediction confidence and indices.
+        """
+        try:
+            return self.match(self.encode_images(image_array), text_prompts, nprobe=nprobe)
 
         except Exception as e:
             # Log error and raise exception
@@ -564,6 +1227,7 @@ class SAM2Predictor(ObjectPredictor):
         self.logger = logging.getLogger(__name__)        
         self.img_predictor, self.video_predictor = self._load_predictor()
         self.text_prompt = text_prompt
+        self.renderer = AnnotationRenderer()
 
 
     def init_hydra_and_model_setup(self):
@@ -891,20 +1555,24 @@ class SAM2Predictor(ObjectPredictor):
     def show_mask(self, mask, ax, obj_id=None, random_color=False):
         """
         Displays the segmentation mask on the given axes.
+
+        Colors come from the predictor's AnnotationRenderer palette (tab10). When ax is an
+        [H, W, 3] uint8 frame instead of matplotlib axes, the mask is blended into the frame
+        in place by the renderer, without matplotlib.
         
         Parameters:
         - mask: The segmentation mask.
-        - ax: The axes on which to display the mask.
+        - ax: The axes on which to display the mask, or an RGB frame buffer.
         - obj_id: Optional object ID to color code the mask.
         - random_color: If True, assigns a random color to the mask.
         """
         try:
-            if random_color:
-                color = np.concatenate([np.random.random(3), np.array([0.6])], axis=0)
-            else:
-                cmap = plt.get_cmap("tab10")
-                color = np.array([*cmap(obj_id or 0)[:3], 0.6])
+            color_id = np.random.randint(len(self.renderer.palette)) if random_color else (obj_id or 0)
+            if isinstance(ax, np.ndarray):
+                self.renderer.draw_masks(ax, [mask], color_ids=[color_id])
+                return
 
+            color = np.array([*(c / 255.0 for c in self.renderer.color(color_id)), 0.6])
             mask_image = mask.reshape(mask.shape[-2], mask.shape[-1], 1) * color.reshape(1, 1, -1)
             ax.imshow(mask_image)
         except ValueError as e:
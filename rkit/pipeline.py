@@ -0,0 +1,433 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import time
+import queue
+import logging
+import threading
+import contextlib
+import numpy as np
+import torch
+from torchvision.ops import box_convert
+
+from .utils import combine_masks
+from .box_pruning import BoxPruner
+from .embedding_index import EmbeddingIndex
+from .tracing import span
+
+
+class GroundedSegmentationPipeline(object):
+    """
+    Text-prompted instance segmentation: (optional depth estimation) -> GroundingDINO -> box
+    filtering -> SAM -> label map -> optional CLIP relabelling.
+
+    The image is uploaded to the device once; boxes, masks and the label map stay there until
+    the final transfer of the result. Boxes are pruned (area, cross-phrase NMS, containment,
+    optional depth validity) before SAM so no mask is decoded only to be thrown away. Every
+    call records per-stage wall-clock timings (with the device synchronized around each stage)
+    in self.timings.
+
+    Attributes:
+        gdino (GroundingDINOObjectPredictor): Box detector.
+        sam (SegmentAnythingPredictor): Box-prompted mask decoder.
+        clip (ZeroShotClipPredictor): Optional classifier used to relabel detections.
+        depth_predictor (DepthAnythingPredictor): Optional depth estimator run as the 'depth' stage.
+        device (str): Device shared by the predictors.
+        max_box_area (float): Boxes larger than this fraction of the image are discarded.
+        pruner (BoxPruner): Box-pruning stage run before SAM; pruner.report() sums the decodes saved.
+        timings (dict): Stage name -> seconds for the last call.
+        logger: Logger instance for logging.
+    """
+
+    STAGES = ("depth", "upload", "detect", "filter", "segment", "compose", "relabel", "transfer")
+    UNKNOWN_LABEL = "unknown"  # CLIP relabelling without a match, e.g. an empty embedding index
+
+    def __init__(self, gdino, sam, clip=None, max_box_area=0.5, pruner=None, depth_predictor=None):
+        """
+        Initializes the GroundedSegmentationPipeline class.
+
+        Args:
+            gdino (GroundingDINOObjectPredictor): Box detector.
+            sam (SegmentAnythingPredictor): Box-prompted mask decoder.
+            clip (ZeroShotClipPredictor, optional): Classifier for relabelling detections.
+            max_box_area (float): Maximum box area as a fraction of the image area. Default is 0.5.
+            pruner (BoxPruner, optional): Box-pruning stage. Defaults to BoxPruner(max_area=max_box_area),
+                which also applies cross-phrase NMS at IoU 0.7; pass BoxPruner(max_area=max_box_area,
+                iou_threshold=None) for the area filter alone.
+            depth_predictor (DepthAnythingPredictor, optional): Depth estimator run as a 'depth' stage
+                before detection; its prediction feeds the pruner's depth-validity check when no
+                depth map is passed in.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.gdino = gdino
+        self.sam = sam
+        self.clip = clip
+        self.depth_predictor = depth_predictor
+        self.device = sam.device
+        self.max_box_area = max_box_area
+        self.pruner = pruner if pruner is not None else BoxPruner(max_area=max_box_area)
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def _stage(self, name, timings):
+        """
+        Time one pipeline stage into timings, synchronizing the current CUDA stream so asynchronous
+        kernels are attributed correctly (without stalling other stages' streams). The stage is
+        also recorded as a 'pipeline.<name>' span when tracing is enabled.
+        """
+        if self.device == "cuda":
+            torch.cuda.current_stream().synchronize()
+        start = time.perf_counter()
+        with span(f"pipeline.{name}"):
+            yield
+            if self.device == "cuda":
+                torch.cuda.current_stream().synchronize()
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+    def timing_report(self, timings=None):
+        """
+        Format stage timings.
+
+        Args:
+            timings (dict, optional): Stage timings, e.g. result['timings']. Defaults to the last predict call.
+
+        Returns:
+            str: One line per stage with milliseconds and share of the total.
+        """
+        timings = self.timings if timings is None else timings
+        total = sum(timings.values()) or 1.0
+        lines = [f"{name:>10s}: {timings[name] * 1000:8.2f} ms ({100 * timings[name] / total:5.1f}%)"
+                 for name in self.STAGES if name in timings]
+        lines.append(f"{'total':>10s}: {total * 1000:8.2f} ms")
+        return "\n".join(lines)
+
+    def estimate_depth(self, image_pil):
+        """
+        Optional first stage: predict depth with self.depth_predictor, kept on the device.
+
+        Returns:
+            dict: {'image_pil', 'depth' ([H, W] tensor), 'timings'} passed to detect.
+        """
+        timings = {}
+        image_pil = image_pil.convert("RGB")
+        with self._stage("depth", timings):
+            depth = self.depth_predictor.predict_batch(image_pil, output_size=image_pil.size[::-1])[0]
+        return {"image_pil": image_pil, "depth": depth, "timings": timings}
+
+    def detect(self, image_pil, text_prompt="objects", depth=None, timings=None):
+        """
+        Upload the image, detect boxes and prune them.
+
+        Args:
+            image_pil (PIL.Image): Input RGB image.
+            text_prompt (str): GroundingDINO text prompt. Default is "objects".
+            depth (optional): [H, W] depth map for the pruner's depth-validity check.
+            timings (dict, optional): Timings of earlier stages to add to, e.g. from estimate_depth.
+
+        Returns:
+            dict: Intermediate state passed to segment.
+        """
+        timings = {} if timings is None else timings
+        image_pil = image_pil.convert("RGB")
+        w, h = image_pil.size
+
+        with self._stage("upload", timings):
+            image_tensor = torch.from_numpy(np.array(image_pil)).permute(2, 0, 1).to(self.device, non_blocking=True)
+
+        with self._stage("detect", timings):
+            bboxes, phrases, conf = self.gdino.predict(image_pil, text_prompt)
+            scale = torch.tensor([w, h, w, h], dtype=torch.float32, device=self.device)
+            boxes = box_convert(bboxes.to(self.device) * scale, in_fmt="cxcywh", out_fmt="xyxy")
+            conf = conf.to(self.device)
+
+        with self._stage("filter", timings):
+            keep_mask, pruned = self.pruner.prune(boxes, conf, w, h, depth=depth)
+            keep = torch.nonzero(keep_mask).flatten()
+            boxes, conf = boxes[keep], conf[keep]
+
+        return {"image_tensor": image_tensor, "boxes": boxes, "conf": conf, "phrases": phrases,
+                "keep": keep, "pruned": pruned, "timings": timings}
+
+    def segment(self, state):
+        """
+        Second stage: decode one SAM mask per kept box.
+        """
+        with self._stage("segment", state["timings"]):
+            state["masks"] = self.sam.predict_torch(state["image_tensor"], state["boxes"])[:, 0]
+        return state
+
+    def postprocess(self, state, clip_prompts=None, return_masks=False):
+        """
+        Last stage: compose the label map, optionally relabel with CLIP, and transfer to numpy.
+
+        Returns:
+            dict: See predict.
+        """
+        timings, boxes, masks = state["timings"], state["boxes"], state["masks"]
+
+        with self._stage("compose", timings):
+            label_map = combine_masks(masks)
+
+        label_indices = label_scores = None
+        if clip_prompts is not None and self.clip is not None and len(boxes) > 0:
+            with self._stage("relabel", timings):
+                label_scores, label_indices = self.clip.classify_boxes(state["image_tensor"], boxes, clip_prompts, masks=masks)
+
+        with self._stage("transfer", timings):
+            keep = state["keep"].cpu().numpy()
+            result = {
+                "boxes": boxes.cpu().numpy(),
+                "scores": state["conf"].cpu().numpy(),
+                "phrases": [state["phrases"][i] for i in keep],
+                "label_map": label_map.to(torch.int32).cpu().numpy(),
+                "pruned": state["pruned"],
+                "timings": timings,
+            }
+            if label_indices is not None:
+                result["labels"] = self._lookup_labels(clip_prompts, label_indices.cpu().numpy())
+                result["label_scores"] = label_scores.cpu().numpy()
+            if return_masks:
+                result["masks"] = masks.cpu().numpy()
+        return result
+
+    def _lookup_labels(self, clip_prompts, indices):
+        """
+        Labels of CLIP match indices: prompts by position, or embedding-index row labels. Matches
+        without a label (id -1) get UNKNOWN_LABEL.
+        """
+        if isinstance(clip_prompts, EmbeddingIndex):
+            labels = clip_prompts.lookup_labels(indices).tolist()
+        else:
+            labels = [clip_prompts[i] if i >= 0 else None for i in indices.tolist()]
+        return [self.UNKNOWN_LABEL if label is None else label for label in labels]
+
+    def stages(self, text_prompt="objects", clip_prompts=None, return_masks=False):
+        """
+        The pipeline as (name, callable) stages for PipelinedExecutor.
+
+        Returns:
+            list: [("depth", ...) when a depth predictor is configured, ("detect", ...),
+                ("segment", ...), ("postprocess", ...)].
+        """
+        if self.depth_predictor is None:
+            stages = [("detect", lambda image_pil: self.detect(image_pil, text_prompt))]
+        else:
+            stages = [
+                ("depth", self.estimate_depth),
+                ("detect", lambda state: self.detect(state["image_pil"], text_prompt, depth=state["depth"],
+                                                     timings=state["timings"])),
+            ]
+        return stages + [
+            ("segment", self.segment),
+            ("postprocess", lambda state: self.postprocess(state, clip_prompts, return_masks)),
+        ]
+
+    def predict(self, image_pil, text_prompt="objects", clip_prompts=None, return_masks=False, depth=None):
+        """
+        Run the pipeline on one image.
+
+        Args:
+            image_pil (PIL.Image): Input RGB image.
+            text_prompt (str): GroundingDINO text prompt. Default is "objects".
+            clip_prompts (list or EmbeddingIndex, optional): Labels for CLIP relabelling (requires
+                clip). The relabelled class name of every detection is returned under 'labels';
+                detections without a match get UNKNOWN_LABEL.
+            return_masks (bool): Also return the [N, H, W] boolean masks. Default is False.
+            depth (optional): [H, W] depth map for the pruner's depth-validity check. Predicted by
+                depth_predictor when not given and a depth predictor is configured.
+
+        Returns:
+            dict: 'boxes' ([N, 4] xyxy pixels, numpy), 'scores' (numpy), 'phrases' (list),
+                'label_map' ([H, W] numpy, 0 background, 1..N objects), 'pruned' (boxes removed
+                before SAM per reason), 'timings' (dict), and optionally 'labels', 'label_scores'
+                and 'masks'. label_map is built by combine_masks, which labels in reverse box
+                order: boxes[i] has id N - i, and where masks overlap the earlier box wins.
+        """
+        try:
+            timings = None
+            if depth is None and self.depth_predictor is not None:
+                state = self.estimate_depth(image_pil)
+                depth, timings = state["depth"], state["timings"]
+            state = self.segment(self.detect(image_pil, text_prompt, depth=depth, timings=timings))
+            result = self.postprocess(state, clip_prompts, return_masks)
+            self.timings = result["timings"]
+            return result
+
+        except Exception as e:
+            self.logger.error(f"Error in grounded segmentation pipeline: {e}")
+            raise e
+
+    __call__ = predict
+
+
+def _record_stream(item, stream):
+    """
+    Mark every CUDA tensor in item (nested in dicts, lists and tuples) as used on stream, so the
+    caching allocator does not reuse its memory on the producing stream while stream still reads it.
+    """
+    if torch.is_tensor(item):
+        if item.is_cuda:
+            item.record_stream(stream)
+    elif isinstance(item, dict):
+        for value in item.values():
+            _record_stream(value, stream)
+    elif isinstance(item, (list, tuple)):
+        for value in item:
+            _record_stream(value, stream)
+
+
+class _StageError(object):
+    """
+    Wraps an exception raised by a stage so it travels down the pipeline in order.
+    """
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+class PipelinedExecutor(object):
+    """
+    Runs a sequence of stages over a stream of inputs with one worker thread per stage.
+
+    Stages are connected by bounded FIFO queues, so item t+1 can be in stage 1 while item t is
+    in stage 2, outputs come out in input order, and a slow stage applies backpressure to the
+    ones before it. On CUDA each stage runs on its own stream and synchronizes that stream
+    before handing its output on; tensors crossing stages are recorded on the consuming stream
+    (Tensor.record_stream) so their memory is not reused while still in use. Throughput
+    approaches that of the slowest stage.
+
+    Attributes:
+        stages (list): (name, callable) pairs; each callable maps the previous stage's output to its own.
+        queue_size (int): Capacity of each inter-stage queue.
+        use_cuda_streams (bool): Run each stage on a dedicated CUDA stream.
+        busy_time (dict): Stage name -> seconds spent inside the stage callable.
+        logger: Logger instance for logging.
+    """
+
+    _DONE = object()
+
+    def __init__(self, stages, queue_size=2, use_cuda_streams=True):
+        """
+        Initializes the PipelinedExecutor class.
+
+        Args:
+            stages (list): (name, callable) pairs, or bare callables (named stage0, stage1, ...).
+            queue_size (int): Capacity of each inter-stage queue. Default is 2.
+            use_cuda_streams (bool): Run each stage on its own CUDA stream when CUDA is available. Default is True.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.stages = [stage if isinstance(stage, tuple) else (f"stage{i}", stage) for i, stage in enumerate(stages)]
+        self.queue_size = queue_size
+        self.use_cuda_streams = use_cuda_streams and torch.cuda.is_available()
+        self.busy_time = {name: 0.0 for name, _ in self.stages}
+
+    @staticmethod
+    def _put(q, item, stop):
+        """
+        Blocking put that gives up once stop is set; returns False if the item was not queued.
+        """
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _get(q, stop):
+        """
+        Blocking get that returns _DONE once stop is set.
+        """
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        return PipelinedExecutor._DONE
+
+    def _worker(self, name, fn, in_queue, out_queue, stop):
+        stream = torch.cuda.Stream() if self.use_cuda_streams else None
+        while True:
+            item = self._get(in_queue, stop)
+            if item is self._DONE:
+                self._put(out_queue, self._DONE, stop)
+                return
+            if not isinstance(item, _StageError):
+                start = time.perf_counter()
+                try:
+                    if stream is not None:
+                        with torch.cuda.stream(stream), span(f"executor.{name}"):
+                            # the previous stage's tensors are now read (and freed) on this stream
+                            _record_stream(item, stream)
+                            item = fn(item)
+                            stream.synchronize()
+                    else:
+                        with span(f"executor.{name}"):
+                            item = fn(item)
+                except Exception as e:
+                    item = _StageError(name, e)
+                self.busy_time[name] += time.perf_counter() - start
+            if not self._put(out_queue, item, stop):
+                return
+
+    def _feed(self, inputs, in_queue, stop):
+        try:
+            for item in inputs:
+                if not self._put(in_queue, item, stop):
+                    return
+        except Exception as e:
+            # e.g. a frame generator hitting an unreadable file: raised by map() after the earlier items
+            if not self._put(in_queue, _StageError("input", e), stop):
+                return
+        self._put(in_queue, self._DONE, stop)
+
+    def map(self, inputs):
+        """
+        Run all stages over inputs.
+
+        Args:
+            inputs (iterable): Inputs of the first stage, e.g. frames.
+
+        Yields:
+            Outputs of the last stage, in input order.
+
+        Raises:
+            Exception: The first exception raised by any stage or by the inputs iterator, re-raised when
+                its item is reached.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        threads = [threading.Thread(target=self._feed, args=(inputs, queues[0], stop), name="rkit-feed", daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._worker, args=(name, fn, queues[i], queues[i + 1], stop),
+                                            name=f"rkit-{name}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is self._DONE:
+                    break
+                if isinstance(item, _StageError):
+                    self.logger.error(f"Error in pipeline stage '{item.stage}': {item.error}")
+                    raise item.error
+                if self.use_cuda_streams:
+                    _record_stream(item, torch.cuda.current_stream())
+                yield item
+        finally:
+            # also reached when the consumer stops early; workers exit at their next queue operation
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def throughput_report(self):
+        """
+        Format the time spent in each stage; the largest value bounds pipelined throughput.
+
+        Returns:
+            str: One line per stage.
+        """
+        return "\n".join(f"{name:>12s}: {seconds:8.3f} s busy" for name, seconds in self.busy_time.items())
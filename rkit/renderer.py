@@ -0,0 +1,294 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import logging
+import threading
+import cv2
+import numpy as np
+import torch
+from PIL import Image as PILImg
+
+from .utils import clip_boxes
+
+# matplotlib's tab10, the colors SAM2Predictor.show_mask has always used
+DEFAULT_PALETTE = (
+    (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+    (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34), (23, 190, 207),
+)
+
+# DH-YOLO classes with DHYOLODetector.plot_bboxes' colors: red doors, yellow handles
+DHYOLO_CLASSES = ("door", "handle")
+DHYOLO_PALETTE = ((255, 0, 0), (255, 255, 0))
+
+_local = threading.local()
+
+
+class AnnotationRenderer(object):
+    """
+    Reusable renderer for boxes, labels and mask overlays on RGB frames.
+
+    Colors, label text colors and label text metrics are computed once and cached, and frames
+    are drawn in place into a frame buffer that is reused across calls, so rendering a stream
+    allocates nothing per frame. Masks are painted and blended only inside their boxes when
+    boxes are given.
+
+        renderer = AnnotationRenderer()
+        frame = renderer.render(image, boxes, labels, masks=masks)   # [H, W, 3] uint8, reused buffer
+
+    A renderer is not thread-safe; use one per thread (see default_renderer).
+
+    Attributes:
+        palette (numpy.ndarray): [K, 3] uint8 RGB colors; object i gets palette[color_ids[i] % K].
+        thickness (int): Box line thickness.
+        font_face (int): OpenCV Hershey font.
+        font_scale (float): Label font scale.
+        text_thickness (int): Label stroke thickness.
+        text_padding (int): Padding around label text in pixels.
+        mask_alpha (float): Mask opacity.
+        logger: Logger instance for logging errors.
+    """
+    MAX_CACHED_LABELS = 4096
+
+    def __init__(self, palette=None, thickness=2, font_face=cv2.FONT_HERSHEY_SIMPLEX, font_scale=0.5,
+                 text_thickness=1, text_padding=3, mask_alpha=0.6):
+        """
+        Parameters:
+        - palette (list, optional): RGB colors. Defaults to DEFAULT_PALETTE (tab10).
+        - thickness (int): Box line thickness. Default is 2.
+        - font_face (int): OpenCV Hershey font. Default is cv2.FONT_HERSHEY_SIMPLEX.
+        - font_scale (float): Label font scale. Default is 0.5.
+        - text_thickness (int): Label stroke thickness. Default is 1.
+        - text_padding (int): Padding around label text. Default is 3.
+        - mask_alpha (float): Mask opacity. Default is 0.6.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.palette = np.asarray(palette if palette is not None else DEFAULT_PALETTE, dtype=np.uint8).reshape(-1, 3)
+        self.thickness = thickness
+        self.font_face = font_face
+        self.font_scale = font_scale
+        self.text_thickness = text_thickness
+        self.text_padding = text_padding
+        self.mask_alpha = mask_alpha
+
+        self._colors = [tuple(int(v) for v in color) for color in self.palette]
+        # black text on light colors, white on dark ones
+        luma = self.palette.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        self._text_colors = [(0, 0, 0) if y > 150 else (255, 255, 255) for y in luma]
+        self._text_sizes = {}
+        self._frame = None
+        self._solid = None
+        self._labels = None
+
+    def color(self, color_id):
+        """
+        RGB tuple of a color id.
+        """
+        return self._colors[int(color_id) % len(self._colors)]
+
+    def text_size(self, text):
+        """
+        Cached (width, height, baseline) of a label in pixels.
+        """
+        size = self._text_sizes.get(text)
+        if size is None:
+            if len(self._text_sizes) >= self.MAX_CACHED_LABELS:
+                self._text_sizes.clear()
+            (width, height), baseline = cv2.getTextSize(text, self.font_face, self.font_scale, self.text_thickness)
+            size = self._text_sizes[text] = (width, height, baseline)
+        return size
+
+    def frame_buffer(self, image):
+        """
+        Copy an image into the reused frame buffer.
+
+        Parameters:
+        - image: PIL image, [H, W, 3] uint8 array, or [3, H, W] uint8 tensor.
+
+        Returns:
+        - numpy.ndarray: The [H, W, 3] uint8 frame buffer, valid until the next call.
+        """
+        if isinstance(image, PILImg.Image):
+            image = np.asarray(image.convert('RGB'))
+        elif torch.is_tensor(image):
+            image = image.permute(1, 2, 0).cpu().numpy()
+        if self._frame is None or self._frame.shape != image.shape:
+            self._frame = np.empty(image.shape, dtype=np.uint8)
+        np.copyto(self._frame, image)
+        return self._frame
+
+    def _scratch(self, height, width, num_labels):
+        """
+        Zeroed label buffer and the solid-color buffer for a frame size, reallocated only when it changes.
+        """
+        dtype = np.uint8 if num_labels < 256 else np.int32
+        if self._labels is None or self._labels.shape != (height, width) or self._labels.dtype != dtype:
+            self._labels = np.empty((height, width), dtype=dtype)
+        if self._solid is None or self._solid.shape[:2] != (height, width):
+            self._solid = np.empty((height, width, 3), dtype=np.uint8)
+        self._labels.fill(0)
+        return self._labels, self._solid
+
+    def draw_masks(self, frame, masks, boxes=None, color_ids=None, alpha=None):
+        """
+        Blend masks over a frame in place; later masks are drawn on top.
+
+        Parameters:
+        - frame (numpy.ndarray): [H, W, 3] uint8 frame, modified in place.
+        - masks: [N, H, W] / [N, 1, H, W] array or tensor, or a list of masks. With boxes, masks may
+          also be crops of their box's size.
+        - boxes (array-like, optional): [N, 4] xyxy boxes enclosing the masks. Limits painting and
+          blending to the boxes, which is much faster for many objects.
+        - color_ids (array-like, optional): Palette index per mask. Defaults to 0..N-1.
+        - alpha (float, optional): Mask opacity. Defaults to self.mask_alpha.
+        """
+        if torch.is_tensor(masks):
+            masks = masks.detach().cpu().numpy()
+        masks = [m.detach().cpu().numpy() if torch.is_tensor(m) else np.asarray(m) for m in masks]
+        if len(masks) == 0:
+            return frame
+        masks = [m.reshape(m.shape[-2:]) for m in masks]
+        masks = [m if m.dtype == bool else m > 0.5 for m in masks]
+
+        alpha = self.mask_alpha if alpha is None else alpha
+        height, width = frame.shape[:2]
+        color_ids = np.arange(len(masks)) if color_ids is None else np.asarray(color_ids).reshape(-1)
+        labels, solid = self._scratch(height, width, len(masks))
+
+        if boxes is None:
+            for k, mask in enumerate(masks):
+                np.copyto(labels, k + 1, where=mask)
+            lut = np.zeros((len(masks) + 1, 3), dtype=np.uint8)
+            lut[1:] = self.palette[color_ids % len(self.palette)]
+            np.take(lut, labels, axis=0, out=solid)
+            blended = cv2.addWeighted(frame, 1 - alpha, solid, alpha, 0)
+            cv2.copyTo(blended, (labels > 0).view(np.uint8), frame)
+            return frame
+
+        boxes = np.asarray(boxes.cpu() if torch.is_tensor(boxes) else boxes, dtype=np.float64).reshape(-1, 4)
+        regions, valid = clip_boxes(boxes, width, height)
+        regions = regions.tolist()
+        for k, (mask, (x0, y0, x1, y1)) in enumerate(zip(masks, regions)):
+            if not valid[k]:
+                continue
+            if mask.shape == (height, width):
+                mask = mask[y0:y1, x0:x1]
+            else:
+                # a crop of the box: offset it by how much the box was clipped
+                bx0, by0 = int(np.floor(boxes[k, 0])), int(np.floor(boxes[k, 1]))
+                mask = mask[y0 - by0:y1 - by0, x0 - bx0:x1 - bx0]
+            region = labels[y0:y0 + mask.shape[0], x0:x0 + mask.shape[1]]
+            np.copyto(region, k + 1, where=mask)
+
+        # every pixel is blended once, inside the box of the mask that won it
+        for k, (x0, y0, x1, y1) in enumerate(regions):
+            if not valid[k]:
+                continue
+            owned = (labels[y0:y1, x0:x1] == k + 1).view(np.uint8)
+            if not owned.any():
+                continue
+            cv2.rectangle(solid, (x0, y0), (x1 - 1, y1 - 1), self.color(color_ids[k]), cv2.FILLED)
+            region = frame[y0:y1, x0:x1]
+            cv2.copyTo(cv2.addWeighted(region, 1 - alpha, solid[y0:y1, x0:x1], alpha, 0), owned, region)
+        return frame
+
+    def draw_boxes(self, frame, boxes, labels=None, color_ids=None):
+        """
+        Draw boxes and their labels on a frame in place.
+
+        Labels sit on a filled tab above the box's top-left corner, or just inside the box
+        when there is no room above it.
+
+        Parameters:
+        - frame (numpy.ndarray): [H, W, 3] uint8 frame, modified in place.
+        - boxes (array-like): [N, 4] xyxy boxes in pixels.
+        - labels (list, optional): Text per box.
+        - color_ids (array-like, optional): Palette index per box. Defaults to 0..N-1.
+        """
+        boxes = np.asarray(boxes.cpu() if torch.is_tensor(boxes) else boxes, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == 0:
+            return frame
+        color_ids = range(len(boxes)) if color_ids is None else np.asarray(color_ids).reshape(-1).tolist()
+        pad = self.text_padding
+
+        for k, ((x0, y0, x1, y1), color_id) in enumerate(zip(boxes.round().astype(int).tolist(), color_ids)):
+            color = self.color(color_id)
+            cv2.rectangle(frame, (x0, y0), (x1, y1), color, self.thickness)
+            if labels is None or not labels[k]:
+                continue
+
+            text = labels[k]
+            text_w, text_h, baseline = self.text_size(text)
+            tab_h = text_h + baseline + 2 * pad
+            top = y0 - tab_h if y0 - tab_h >= 0 else y0
+            cv2.rectangle(frame, (x0, top), (x0 + text_w + 2 * pad, top + tab_h), color, cv2.FILLED)
+            cv2.putText(frame, text, (x0 + pad, top + pad + text_h), self.font_face, self.font_scale,
+                        self._text_colors[int(color_id) % len(self._text_colors)], self.text_thickness, cv2.LINE_AA)
+        return frame
+
+    def render(self, image, boxes=None, labels=None, masks=None, color_ids=None, mask_boxes=None):
+        """
+        Draw masks, then boxes and labels, over a copy of image in the reused frame buffer.
+
+        Parameters:
+        - image: PIL image, [H, W, 3] uint8 array, or [3, H, W] uint8 tensor.
+        - boxes (array-like, optional): [N, 4] xyxy boxes.
+        - labels (list, optional): Text per box.
+        - masks (optional): Masks, see draw_masks. Blended inside boxes when boxes are given.
+        - color_ids (array-like, optional): Palette index per object, shared by masks and boxes.
+        - mask_boxes (array-like, optional): Boxes enclosing the masks when masks are given without boxes.
+
+        Returns:
+        - numpy.ndarray: [H, W, 3] uint8 frame buffer, valid until the next render; copy it to keep it.
+        """
+        try:
+            frame = self.frame_buffer(image)
+            if masks is not None:
+                self.draw_masks(frame, masks, boxes=mask_boxes if mask_boxes is not None else boxes, color_ids=color_ids)
+            if boxes is not None:
+                self.draw_boxes(frame, boxes, labels, color_ids=color_ids)
+            return frame
+
+        except Exception as e:
+            self.logger.error(f"Error rendering annotations: {e}")
+            raise e
+
+
+def default_renderer():
+    """
+    Per-thread AnnotationRenderer with the default style.
+    """
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None:
+        renderer = _local.renderer = AnnotationRenderer()
+    return renderer
+
+
+def render_dhyolo(detector, renderer=None):
+    """
+    Draw a DHYOLODetector's last predictions with an AnnotationRenderer.
+
+    A faster stand-in for detector.plot_bboxes() (same colors and font, cached label metrics,
+    without the watermark). It lives here so the vendored iteach_toolkit, which setup.py
+    overwrites on install, stays unmodified and independent of rkit.
+
+    Parameters:
+    - detector (DHYOLODetector): Detector after predict(); uses detector.image and detector.preds.
+    - renderer (AnnotationRenderer, optional): Defaults to a per-thread renderer in the DH-YOLO style.
+
+    Returns:
+    - numpy.ndarray: [H, W, 3] uint8 copy of detector.image with boxes and labels.
+    """
+    if renderer is None:
+        renderer = getattr(_local, "dhyolo_renderer", None)
+        if renderer is None:
+            renderer = _local.dhyolo_renderer = AnnotationRenderer(
+                palette=DHYOLO_PALETTE, font_face=cv2.FONT_HERSHEY_DUPLEX, text_padding=1)
+
+    preds = detector.preds
+    if preds is None or len(preds) == 0:
+        return np.array(detector.image, dtype=np.uint8, copy=True)
+    preds = preds.detach().cpu().numpy() if torch.is_tensor(preds) else np.asarray(preds)
+    classes = preds[:, 5].astype(int)
+    labels = [f'{DHYOLO_CLASSES[cls]} ({conf:.2f})' for cls, conf in zip(classes.tolist(), preds[:, 4].tolist())]
+    return renderer.render(detector.image, preds[:, :4], labels, color_ids=classes).copy()
@@ -0,0 +1,311 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import io
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import torch
+import numpy as np
+from PIL import Image as PILImg
+
+from .feature_store import image_hash
+
+
+def _fingerprint(value):
+    """
+    JSON-serializable stand-in for a predictor argument. Images, arrays and tensors are
+    replaced by their content hash.
+    """
+    if isinstance(value, (PILImg.Image, np.ndarray)) or torch.is_tensor(value):
+        return "content:" + image_hash(value)
+    if isinstance(value, (list, tuple)):
+        return [_fingerprint(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _fingerprint(v) for k, v in sorted(value.items())}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def _encode(value, arrays):
+    """
+    Split a predictor output into a JSON skeleton and a list of numpy arrays.
+    Tensors remember their device; boolean arrays (masks) are bit-packed.
+    """
+    if torch.is_tensor(value):
+        node = _encode(value.detach().cpu().numpy(), arrays)
+        node["device"] = str(value.device)
+        return node
+    if isinstance(value, PILImg.Image):
+        node = _encode(np.asarray(value), arrays)
+        node["pil_mode"] = value.mode
+        return node
+    if isinstance(value, np.ndarray):
+        node = {"__array__": len(arrays), "shape": list(value.shape), "dtype": str(value.dtype)}
+        arrays.append(np.packbits(value) if value.dtype == bool else value)
+        return node
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, arrays) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, dict):
+        return {"__dict__": {k: _encode(v, arrays) for k, v in value.items()}}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode(node, arrays):
+    """
+    Inverse of _encode.
+    """
+    if isinstance(node, list):
+        return [_decode(v, arrays) for v in node]
+    if not isinstance(node, dict):
+        return node
+    if "__tuple__" in node:
+        return tuple(_decode(v, arrays) for v in node["__tuple__"])
+    if "__dict__" in node:
+        return {k: _decode(v, arrays) for k, v in node["__dict__"].items()}
+
+    shape = tuple(node["shape"])
+    array = arrays[node["__array__"]]
+    if node["dtype"] == "bool":
+        array = np.unpackbits(array, count=int(np.prod(shape))).astype(bool)
+    array = array.reshape(shape)
+    if "pil_mode" in node:
+        return PILImg.fromarray(array, mode=node["pil_mode"])
+    if "device" in node:
+        device = node["device"]
+        if device.startswith("cuda") and not torch.cuda.is_available():
+            device = "cpu"
+        return torch.from_numpy(array.copy()).to(device)
+    return array
+
+
+def pack_result(value):
+    """
+    Serialize a predictor output (nested tuples/lists/dicts of tensors, arrays, PIL images,
+    strings and numbers) to (skeleton JSON, compressed array blob).
+    """
+    arrays = []
+    skeleton = json.dumps(_encode(value, arrays))
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, *arrays)
+    return skeleton, buffer.getvalue()
+
+
+def unpack_result(skeleton, blob):
+    """
+    Inverse of pack_result.
+    """
+    with np.load(io.BytesIO(blob)) as data:
+        arrays = [data[f"arr_{i}"] for i in range(len(data.files))]
+    return _decode(json.loads(skeleton), arrays)
+
+
+class ResultCache(object):
+    """
+    Persistent, content-addressed cache of predictor outputs in a SQLite database.
+
+    Entries are keyed by a hash of (predictor name, model version, input content and
+    parameters), so a result is reused only when the image, prompt and model are unchanged.
+    Outputs are stored compressed, with masks bit-packed. When the stored size exceeds
+    max_bytes the least recently used entries are evicted.
+
+    Attributes:
+        path (str): SQLite database file.
+        max_bytes (int): Size limit of the stored results.
+        logger: Logger instance for logging.
+    """
+
+    def __init__(self, path, max_bytes=2 << 30):
+        """
+        Open or create the cache database.
+
+        Parameters:
+        - path (str): SQLite database file.
+        - max_bytes (int): Size limit of the stored results. Default is 2 GiB.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, predictor TEXT, model_version TEXT, "
+                         "skeleton TEXT, data BLOB, size INTEGER, created REAL, accessed REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(predictor, model_version, inputs, params=None):
+        """
+        Cache key for one predictor call.
+
+        Parameters:
+        - predictor (str): Predictor name.
+        - model_version (str): Model identity, e.g. checkpoint or variant.
+        - inputs: Image(s) or other array inputs; hashed by content.
+        - params (dict, optional): Remaining call parameters, e.g. the text prompt.
+
+        Returns:
+        - str: Hex digest.
+        """
+        fingerprint = json.dumps([predictor, model_version, _fingerprint(inputs), _fingerprint(params or {})])
+        return hashlib.blake2b(fingerprint.encode(), digest_size=20).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Returns:
+        - The stored output, or None on a miss.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT skeleton, data FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self._stats["hits"] += 1
+        return unpack_result(*row)
+
+    def put(self, key, value, predictor="", model_version=""):
+        """
+        Store a result, evicting least recently used entries if the cache grows past max_bytes.
+        """
+        skeleton, blob = pack_result(value)
+        size = len(skeleton) + len(blob)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, predictor, model_version, skeleton, blob, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+            self._stats["puts"] += 1
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_bytes. Call with self._lock held.
+        """
+        while self._bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM results ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._bytes -= size
+                self._stats["evictions"] += 1
+
+    def clear(self, predictor=None):
+        """
+        Remove all entries, or only those of one predictor.
+        """
+        with self._lock:
+            if predictor is None:
+                self._db.execute("DELETE FROM results")
+            else:
+                self._db.execute("DELETE FROM results WHERE predictor = ?", (predictor,))
+            self._db.commit()
+            self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def stats(self):
+        """
+        Cache statistics.
+
+        Returns:
+        - dict: hits, misses, hit_rate, puts and evictions of this session, plus the stored
+          entries and bytes per predictor and in total.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            rows = self._db.execute("SELECT predictor, COUNT(*), SUM(size) FROM results GROUP BY predictor").fetchall()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = sum(r[1] for r in rows)
+        stats["bytes"] = sum(r[2] for r in rows)
+        stats["predictors"] = {r[0]: {"entries": r[1], "bytes": r[2]} for r in rows}
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def default_model_version(predictor):
+    """
+    Default model identity of a predictor: its class name and the attributes that select weights.
+    """
+    attrs = ("variant", "model_id", "backbone_alias", "input_size", "precision", "model_path")
+    parts = [type(predictor).__name__] + [f"{a}={getattr(predictor, a)}" for a in attrs if hasattr(predictor, a)]
+    return ",".join(parts)
+
+
+def _is_failure(result):
+    """
+    Whether a predict() result is the None or (None, None, ...) some predictors return on error.
+    """
+    if isinstance(result, (tuple, list)):
+        return len(result) > 0 and all(r is None for r in result)
+    return result is None
+
+
+class CachedPredictor(object):
+    """
+    Wraps a predictor so predict() is answered from a ResultCache when the same input, parameters
+    and model were seen before. Every other attribute is forwarded to the wrapped predictor.
+
+        gdino = CachedPredictor(GroundingDINOObjectPredictor(), ResultCache('results.sqlite'))
+        bboxes, phrases, conf = gdino.predict(image_pil, 'objects')  # runs the network once
+
+    Attributes:
+        predictor: Wrapped predictor.
+        cache (ResultCache): Result store.
+        name (str): Predictor name in cache keys and statistics.
+        model_version (str): Model identity in cache keys.
+    """
+
+    def __init__(self, predictor, cache, name=None, model_version=None):
+        """
+        Parameters:
+        - predictor: Any object with a predict method.
+        - cache (ResultCache): Result store.
+        - name (str, optional): Defaults to the predictor's class name.
+        - model_version (str, optional): Defaults to default_model_version(predictor). Change it when the
+          weights change without a change in class or variant.
+        """
+        self.predictor = predictor
+        self.cache = cache
+        self.name = name or type(predictor).__name__
+        self.model_version = model_version or default_model_version(predictor)
+
+    def __getattr__(self, attr):
+        return getattr(self.predictor, attr)
+
+    def predict(self, inputs, *args, **kwargs):
+        """
+        Cached predictor.predict(inputs, *args, **kwargs). Failed results (None or all-None tuples,
+        e.g. SegmentAnythingPredictor's (None, None)) are returned but not cached.
+        """
+        key = self.cache.make_key(self.name, self.model_version, inputs, {"args": args, "kwargs": kwargs})
+        result = self.cache.get(key)
+        if result is None:
+            result = self.predictor.predict(inputs, *args, **kwargs)
+            if not _is_failure(result):
+                self.cache.put(key, result, self.name, self.model_version)
+        return result
@@ -0,0 +1,609 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+"""
+Local inference server for the rkit predictors with dynamic batching.
+
+Requests for the same model that arrive within max_wait_ms of each other are merged into one
+batch (up to max_batch_size) and handed to the model together. Requests are queued in a
+'realtime' or 'bulk' lane; realtime requests are batched first, and a request with a deadline
+that is still queued when the deadline passes is dropped with status 504.
+
+    python -m rkit.server --models gdino sam clip depth --port 8080
+    python -m rkit.server --models clip --unix_socket /tmp/rkit.sock
+
+Endpoints:
+    POST /v1/<model>   JSON body {"image": <base64 PNG/JPEG bytes>, "lane": "realtime" | "bulk",
+                       "deadline_ms": <optional>, ...model parameters}
+    GET  /metrics      queue depth, batch sizes and per-lane latency histograms per model
+    GET  /health
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import bisect
+import logging
+import argparse
+import tempfile
+import threading
+import collections
+import socketserver
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error as urlerror, request as urlrequest
+
+import numpy as np
+import torch
+from PIL import Image as PILImg
+
+
+def encode_image(image_pil, format="PNG"):
+    """
+    Encode a PIL image as base64 text for a request body.
+    """
+    buffer = io.BytesIO()
+    image_pil.save(buffer, format=format)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def decode_image(data):
+    """
+    Decode a base64 PNG/JPEG string into an RGB PIL image.
+    """
+    return PILImg.open(io.BytesIO(base64.b64decode(data))).convert("RGB")
+
+
+def encode_array(array):
+    """
+    Encode a numpy array as a JSON-friendly dict. Boolean arrays are bit-packed.
+    """
+    array = np.ascontiguousarray(array)
+    if array.dtype == bool:
+        return {"shape": list(array.shape), "dtype": "bool", "data": base64.b64encode(np.packbits(array)).decode("ascii")}
+    return {"shape": list(array.shape), "dtype": str(array.dtype), "data": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def decode_array(encoded):
+    """
+    Inverse of encode_array.
+    """
+    raw = base64.b64decode(encoded["data"])
+    shape = tuple(encoded["shape"])
+    if encoded["dtype"] == "bool":
+        return np.unpackbits(np.frombuffer(raw, dtype=np.uint8), count=int(np.prod(shape))).astype(bool).reshape(shape)
+    return np.frombuffer(raw, dtype=encoded["dtype"]).reshape(shape)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Set on the future of a request whose deadline passed before it was run.
+    """
+
+
+LANES = ("realtime", "bulk")
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class _Request(object):
+    """
+    A queued request: its payload, result future, lane, arrival time and optional deadline.
+    """
+    __slots__ = ("payload", "future", "lane", "arrival", "deadline")
+
+    def __init__(self, payload, lane, deadline_ms):
+        self.payload = payload
+        self.future = Future()
+        self.lane = lane
+        self.arrival = time.perf_counter()
+        self.deadline = None if deadline_ms is None else self.arrival + deadline_ms / 1000.0
+
+    def expired(self, now):
+        return self.deadline is not None and now >= self.deadline
+
+
+class DynamicBatcher(object):
+    """
+    Merges concurrent requests for one model into batches, serving priority lanes in order.
+
+    A worker thread waits for a request, then keeps collecting until max_batch_size requests are
+    taken or max_wait_ms has passed since the first one, and calls handler once on the batch.
+    Requests are taken from the 'realtime' lane before the 'bulk' lane, so interactive queries
+    overtake queued bulk work at the next batch boundary. A request whose deadline passes while
+    it is queued is dropped without running and its future raises DeadlineExceeded.
+
+    Attributes:
+        name (str): Model name, used in metrics and logs.
+        handler (callable): Maps a list of payloads to a list of results of the same length.
+        max_batch_size (int): Largest batch passed to handler.
+        max_wait_ms (float): Longest time the first request of a batch waits for company.
+        logger: Logger instance for logging.
+    """
+
+    def __init__(self, name, handler, max_batch_size=8, max_wait_ms=10.0):
+        """
+        Initializes the DynamicBatcher class and starts its worker thread.
+
+        Args:
+            name (str): Model name.
+            handler (callable): Maps a list of payloads to a list of results.
+            max_batch_size (int): Largest batch passed to handler. Default is 8.
+            max_wait_ms (float): Latency bound for filling a batch. Default is 10.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._lanes = {lane: collections.deque() for lane in LANES}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._stats = {"requests": 0, "batches": 0, "errors": 0, "max_queue_depth": 0, "batch_sizes": {}}
+        self._lane_stats = {lane: {"requests": 0, "dropped": 0, "errors": 0, "latency_sum": 0.0,
+                                   "latency_histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)} for lane in LANES}
+        self._thread = threading.Thread(target=self._run, name=f"rkit-batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def _depth(self):
+        return sum(len(q) for q in self._lanes.values())
+
+    def submit(self, payload, lane="realtime", deadline_ms=None):
+        """
+        Queue one request.
+
+        Args:
+            payload: Model-specific request payload.
+            lane (str): Priority lane, 'realtime' or 'bulk'. Default is 'realtime'.
+            deadline_ms (float, optional): Drop the request if it has not started within this many milliseconds.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the handler's result for this payload.
+
+        Raises:
+            ValueError: If lane is unknown.
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {LANES}")
+        request = _Request(payload, lane, deadline_ms)
+        with self._cond:
+            self._lanes[lane].append(request)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._depth())
+            self._cond.notify()
+        return request.future
+
+    def __call__(self, payload, lane="realtime", deadline_ms=None, timeout=None):
+        """
+        Submit a request and wait for its result.
+        """
+        return self.submit(payload, lane, deadline_ms).result(timeout)
+
+    def _drop(self, request):
+        self._lane_stats[request.lane]["dropped"] += 1
+        request.future.set_exception(DeadlineExceeded(
+            f"Request for model '{self.name}' missed its deadline after {1000 * (time.perf_counter() - request.arrival):.1f} ms"))
+
+    def _take(self, batch):
+        """
+        Move the highest-priority live request into batch, dropping expired ones. Call with self._cond held.
+
+        Returns:
+            bool: False if all lanes are empty.
+        """
+        now = time.perf_counter()
+        for lane in LANES:
+            q = self._lanes[lane]
+            while q:
+                request = q.popleft()
+                if request.expired(now):
+                    self._drop(request)
+                    continue
+                batch.append(request)
+                return True
+        return False
+
+    def _collect(self):
+        """
+        Wait for the first request, then gather more until the batch is full or the wait bound expires.
+        """
+        batch = []
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._depth() > 0 or self._stop.is_set(), timeout=0.1):
+                return batch
+            while len(batch) < self.max_batch_size:
+                if self._take(batch):
+                    continue
+                if not batch:
+                    return batch
+                remaining = batch[0].arrival + self.max_wait_ms / 1000.0 - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            # deadlines are checked once more at the batch boundary, right before running
+            now = time.perf_counter()
+            expired = [r for r in batch if r.expired(now)]
+            if expired:
+                with self._cond:
+                    for r in expired:
+                        self._drop(r)
+                batch = [r for r in batch if not r.expired(now)]
+            if not batch:
+                continue
+
+            failed = False
+            try:
+                results = self.handler([r.payload for r in batch])
+                for r, result in zip(batch, results):
+                    r.future.set_result(result)
+            except Exception as e:
+                self.logger.error(f"Error in batch for model '{self.name}': {e}")
+                failed = True
+                for r in batch:
+                    r.future.set_exception(e)
+
+            now = time.perf_counter()
+            with self._cond:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["errors"] += len(batch) if failed else 0
+                sizes = self._stats["batch_sizes"]
+                sizes[len(batch)] = sizes.get(len(batch), 0) + 1
+                for r in batch:
+                    latency = now - r.arrival
+                    lane_stats = self._lane_stats[r.lane]
+                    lane_stats["requests"] += 1
+                    lane_stats["errors"] += 1 if failed else 0
+                    lane_stats["latency_sum"] += latency
+                    lane_stats["latency_histogram"][bisect.bisect_left(LATENCY_BUCKETS_MS, 1000.0 * latency)] += 1
+
+    def metrics(self):
+        """
+        Snapshot of the batcher statistics.
+
+        Returns:
+            dict: queue_depth, max_queue_depth, requests, batches, errors, mean_batch_size,
+                mean_latency_ms, the batch_size histogram, and per lane its queue_depth, requests,
+                dropped, errors, mean_latency_ms and latency_histogram_ms (count per upper bucket edge).
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            sizes = dict(stats.pop("batch_sizes"))
+            lanes = {lane: dict(s, latency_histogram=list(s["latency_histogram"]), queue_depth=len(self._lanes[lane]))
+                     for lane, s in self._lane_stats.items()}
+        stats["queue_depth"] = sum(s["queue_depth"] for s in lanes.values())
+        stats["mean_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        latency_sum = sum(s["latency_sum"] for s in lanes.values())
+        stats["mean_latency_ms"] = 1000.0 * latency_sum / stats["requests"] if stats["requests"] else 0.0
+        stats["batch_size_histogram"] = {str(k): v for k, v in sorted(sizes.items())}
+
+        edges = [str(edge) for edge in LATENCY_BUCKETS_MS] + ["inf"]
+        for lane_stats in lanes.values():
+            latency_sum = lane_stats.pop("latency_sum")
+            requests = lane_stats["requests"]
+            lane_stats["mean_latency_ms"] = 1000.0 * latency_sum / requests if requests else 0.0
+            lane_stats["latency_histogram_ms"] = dict(zip(edges, lane_stats.pop("latency_histogram")))
+        stats["lanes"] = lanes
+        return stats
+
+    def close(self):
+        """
+        Stop the worker thread after the batch in progress.
+        """
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join()
+
+
+def _group_by(payloads, key):
+    """
+    Group payload indices by key(payload), preserving order inside each group.
+    """
+    groups = {}
+    for i, payload in enumerate(payloads):
+        groups.setdefault(key(payload), []).append(i)
+    return groups.items()
+
+
+def _image_key(image_pil):
+    """
+    Content key of a PIL image, so requests carrying the same image can share one embedding.
+    """
+    return image_pil.size, hashlib.sha1(image_pil.tobytes()).digest()
+
+
+def gdino_handler(gdino):
+    """
+    Batch handler for GroundingDINOObjectPredictor. Payload: {'image', 'text_prompt'}.
+    Images sharing the same text prompt run as one forward pass.
+    """
+    def handle(payloads):
+        results = [None] * len(payloads)
+        for text_prompt, indices in _group_by(payloads, lambda p: p.get("text_prompt", "objects")):
+            predictions = gdino.predict_batch([payloads[i]["image"] for i in indices], text_prompt)
+            for i, (bboxes, phrases, conf) in zip(indices, predictions):
+                boxes = gdino.bbox_to_scaled_xyxy(bboxes, *payloads[i]["image"].size)
+                results[i] = {"boxes": boxes.tolist(), "scores": conf.tolist(), "phrases": list(phrases)}
+        return results
+    return handle
+
+
+def sam_handler(sam):
+    """
+    Batch handler for SegmentAnythingPredictor. Payload: {'image', 'boxes' ([N, 4] xyxy)}.
+    Requests are grouped by image: the image encoder runs once on all distinct images of the
+    batch, and the boxes of every request on the same image are decoded together.
+    """
+    def handle(payloads):
+        groups = list(_group_by(payloads, lambda p: _image_key(p["image"])))
+        images = [torch.from_numpy(np.array(payloads[indices[0]]["image"])).permute(2, 0, 1) for _, indices in groups]
+        boxes = [torch.tensor([box for i in indices for box in payloads[i]["boxes"]], dtype=torch.float32).reshape(-1, 4)
+                 for _, indices in groups]
+        results = [None] * len(payloads)
+        for (_, indices), masks in zip(groups, sam.predict_torch_batch(images, boxes)):
+            masks = masks[:, 0].cpu().numpy()
+            start = 0
+            for i in indices:
+                end = start + len(payloads[i]["boxes"])
+                results[i] = {"masks": encode_array(masks[start:end])}
+                start = end
+        return results
+    return handle
+
+
+def clip_handler(clip):
+    """
+    Batch handler for ZeroShotClipPredictor. Payload: {'image', 'text_prompts'}.
+    Images sharing the same prompts are encoded in one call.
+    """
+    def handle(payloads):
+        results = [None] * len(payloads)
+        for prompts, indices in _group_by(payloads, lambda p: json.dumps(p["text_prompts"])):
+            text_prompts = json.loads(prompts)
+            conf, idx = clip.predict([payloads[i]["image"] for i in indices], text_prompts)
+            for i, c, j in zip(indices, conf.tolist(), idx.tolist()):
+                results[i] = {"label": text_prompts[j], "index": j, "score": c}
+        return results
+    return handle
+
+
+def depth_handler(depth):
+    """
+    Batch handler for DepthAnythingPredictor. Payload: {'image', 'output_size' (optional)}.
+    Images of the same size are run as one batch; depth is returned as float16.
+    """
+    def handle(payloads):
+        results = [None] * len(payloads)
+        for (size, output_size), indices in _group_by(payloads, lambda p: (p["image"].size, tuple(p.get("output_size") or ()))):
+            batch = depth.predict_batch([payloads[i]["image"] for i in indices], output_size=output_size or None)
+            for i, d in zip(indices, batch.cpu().numpy().astype(np.float16)):
+                results[i] = {"depth": encode_array(d)}
+        return results
+    return handle
+
+
+def dhyolo_handler(dhyolo):
+    """
+    Batch handler for DHYOLODetector. Payload: {'image', 'conf_thres', 'iou_thres'} (thresholds optional).
+    Not batched: DH-YOLO reads one image from disk per call (through a temporary file here), so
+    a batch of N requests still runs N detections one after another.
+    """
+    def handle(payloads):
+        results = []
+        for payload in payloads:
+            with tempfile.NamedTemporaryFile(suffix=".png") as f:
+                payload["image"].save(f.name)
+                _, detections = dhyolo.predict(f.name, conf_thres=payload.get("conf_thres", 0.25),
+                                               iou_thres=payload.get("iou_thres", 0.45))
+            results.append(detections)
+        return results
+    return handle
+
+
+def build_batchers(models, max_batch_size=8, max_wait_ms=10.0, dhyolo_weights="ckpts/dhyolo/dh-yolo-exp-31-pl-1532.pt"):
+    """
+    Load the requested predictors and wrap each in a DynamicBatcher.
+
+    Args:
+        models (list): Any of 'gdino', 'sam', 'clip', 'depth', 'dhyolo'.
+        max_batch_size (int): Largest batch per model. Default is 8.
+        max_wait_ms (float): Latency bound for filling a batch. Default is 10.
+        dhyolo_weights (str): DH-YOLO checkpoint path.
+
+    Returns:
+        dict: Model name -> DynamicBatcher.
+    """
+    from rkit import perception  # lazy import: loads the model libraries
+
+    factories = {
+        "gdino": lambda: gdino_handler(perception.GroundingDINOObjectPredictor()),
+        "sam": lambda: sam_handler(perception.SegmentAnythingPredictor()),
+        "clip": lambda: clip_handler(perception.ZeroShotClipPredictor(max_batch_size=max_batch_size)),
+        "depth": lambda: depth_handler(perception.DepthAnythingPredictor()),
+        "dhyolo": lambda: dhyolo_handler(_load_dhyolo(dhyolo_weights)),
+    }
+    unknown = set(models) - set(factories)
+    if unknown:
+        raise ValueError(f"Unknown models {sorted(unknown)}, expected any of {sorted(factories)}")
+    return {name: DynamicBatcher(name, factories[name](), max_batch_size, max_wait_ms) for name in models}
+
+
+def _load_dhyolo(weights):
+    from iteach_toolkit.DHYOLO import DHYOLODetector  # lazy import: installed by setup.py
+    return DHYOLODetector(weights)
+
+
+def _make_handler(batchers):
+    """
+    HTTP request handler class bound to the given batchers.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self):
+            # client_address is a plain path string on unix sockets
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, format, *args):
+            logging.getLogger(__name__).debug(format % args)
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._reply(200, {name: b.metrics() for name, b in batchers.items()})
+            elif self.path == "/health":
+                self._reply(200, {"status": "ok", "models": sorted(batchers)})
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            model = self.path.rstrip("/").split("/")[-1]
+            if not self.path.startswith("/v1/") or model not in batchers:
+                self._reply(404, {"error": f"Unknown model endpoint {self.path}"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if not isinstance(payload, dict):
+                    raise TypeError(f"expected a JSON object, got {type(payload).__name__}")
+                payload["image"] = decode_image(payload["image"])
+                future = batchers[model].submit(payload, payload.pop("lane", "realtime"), payload.pop("deadline_ms", None))
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                self._reply(400, {"error": f"Bad request: {e}"})
+                return
+            try:
+                self._reply(200, future.result())
+            except DeadlineExceeded as e:
+                self._reply(504, {"status": "deadline_exceeded", "error": str(e)})
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class InferenceServer(object):
+    """
+    Serves DynamicBatchers over HTTP on a TCP port or a local unix socket.
+
+    Every connection is handled on its own thread, so concurrent clients land in the same batches.
+
+    Attributes:
+        batchers (dict): Model name -> DynamicBatcher.
+        logger: Logger instance for logging.
+    """
+
+    def __init__(self, batchers, host="127.0.0.1", port=8080, unix_socket=None):
+        """
+        Initializes the InferenceServer class and binds its socket.
+
+        Args:
+            batchers (dict): Model name -> DynamicBatcher.
+            host (str): Bind address for TCP. Default is "127.0.0.1".
+            port (int): TCP port; 0 picks a free port. Default is 8080.
+            unix_socket (str, optional): Serve on this unix socket path instead of TCP.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.batchers = batchers
+        handler = _make_handler(batchers)
+        if unix_socket is not None:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self.httpd = _UnixHTTPServer(unix_socket, handler)
+            self.address = unix_socket
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), handler)
+            self.address = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def serve_forever(self):
+        self.logger.info(f"Serving {sorted(self.batchers)} on {self.address}")
+        self.httpd.serve_forever()
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="rkit-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+class InferenceClient(object):
+    """
+    Minimal HTTP client for InferenceServer.
+    """
+
+    def __init__(self, url="http://127.0.0.1:8080", timeout=60.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        req = urlrequest.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urlrequest.urlopen(req, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def predict(self, model, image_pil, lane="realtime", deadline_ms=None, **params):
+        """
+        Run one request against a model, e.g. predict('clip', image, text_prompts=['mug', 'bowl']).
+
+        Raises:
+            DeadlineExceeded: If the server dropped the request at its deadline.
+        """
+        body = dict(params, image=encode_image(image_pil), lane=lane)
+        if deadline_ms is not None:
+            body["deadline_ms"] = deadline_ms
+        try:
+            return self._request(f"/v1/{model}", body)
+        except urlerror.HTTPError as e:
+            if e.code == 504:
+                raise DeadlineExceeded(json.loads(e.read())["error"]) from None
+            raise
+
+    def metrics(self):
+        return self._request("/metrics")
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='rkit dynamic-batching inference server')
+    parser.add_argument('--models', nargs='+', default=['gdino', 'sam', 'clip', 'depth'],
+                        help='models to host: gdino sam clip depth dhyolo')
+    parser.add_argument('--host', default='127.0.0.1', type=str, help='bind address')
+    parser.add_argument('--port', default=8080, type=int, help='port number')
+    parser.add_argument('--unix_socket', default=None, type=str, help='serve on a unix socket instead of TCP')
+    parser.add_argument('--max_batch_size', default=8, type=int, help='largest batch per model')
+    parser.add_argument('--max_wait_ms', default=10.0, type=float, help='latency bound for filling a batch')
+    parser.add_argument('--dhyolo_weights', default='ckpts/dhyolo/dh-yolo-exp-31-pl-1532.pt', type=str)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    batchers = build_batchers(args.models, args.max_batch_size, args.max_wait_ms, args.dhyolo_weights)
+    InferenceServer(batchers, args.host, args.port, args.unix_socket).serve_forever()
@@ -0,0 +1,304 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+"""
+Lightweight span tracing for rkit predictors and pipelines.
+
+Tracing is off by default; a disabled span costs one function call and a flag check. When enabled,
+every span records its wall-clock interval (with the current CUDA stream synchronized at both ends
+so asynchronous kernels are attributed to the right stage) and, optionally, its peak CPU memory
+(tracemalloc: Python and numpy allocations) and peak GPU memory (CUDA caching allocator).
+
+    from rkit import tracing
+    tracing.enable(memory=True)
+    pipeline.predict(image_pil)
+    print(tracing.report())
+    tracing.export_chrome_trace("trace.json")   # open in chrome://tracing or ui.perfetto.dev
+
+Instrument code with `with tracing.span("clip.encode_image"):` or the @tracing.traced decorator.
+"""
+
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+import contextlib
+import tracemalloc
+import numpy as np
+import torch
+
+# tracemalloc.reset_peak is Python 3.9+; without it, spans only see the traced memory at their
+# boundaries (and their children's), a lower bound on the true peak
+_RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+def _traced_peak():
+    """
+    Peak traced memory since the last reset_peak, or the current traced memory without reset_peak.
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    return peak if _RESET_PEAK else current
+
+
+HISTOGRAM_BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Frame(object):
+    """
+    An open span on a thread's stack; children raise its peak memory on exit.
+    """
+    __slots__ = ("name", "args", "start", "base_cpu", "base_gpu", "peak_cpu", "peak_gpu")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0.0
+        self.base_cpu = self.base_gpu = 0
+        self.peak_cpu = self.peak_gpu = 0
+
+
+class Tracer(object):
+    """
+    Collects spans from all threads.
+
+    Peak memory is reported as the high-water mark above the memory in use when the span started.
+    The tracemalloc and CUDA peak counters are process-wide, so per-span peaks are exact only when
+    one thread allocates at a time.
+
+    Attributes:
+        enabled (bool): Whether spans are recorded.
+        sync_cuda (bool): Synchronize the current CUDA stream at span boundaries.
+        memory (bool): Record peak CPU (tracemalloc) and GPU memory per span.
+        events (list): Finished spans as dicts with name, start_us, dur_us, tid, args, peak_cpu_mb, peak_gpu_mb.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sync_cuda = True
+        self.memory = False
+        self.events = []
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    def enable(self, sync_cuda=True, memory=False):
+        """
+        Start recording spans.
+
+        Args:
+            sync_cuda (bool): Synchronize the current CUDA stream at span boundaries. Default is True.
+            memory (bool): Record peak CPU and GPU memory per span (adds tracemalloc overhead). Default is False.
+                On Python 3.8 the CPU figure is the largest traced memory seen at span boundaries.
+        """
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop recording spans; recorded events are kept.
+        """
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def clear(self):
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _gpu_memory(self):
+        return self.memory and torch.cuda.is_available() and torch.cuda.is_initialized()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """
+        Record the enclosed block as a span named name; keyword arguments are stored with it.
+        """
+        stack = self._stack()
+        frame = _Frame(name, args)
+        gpu_memory = self._gpu_memory()
+        if self.memory:
+            # close the parent's measurement window before resetting the shared peak counters
+            if stack:
+                stack[-1].peak_cpu = max(stack[-1].peak_cpu, _traced_peak())
+                if gpu_memory:
+                    stack[-1].peak_gpu = max(stack[-1].peak_gpu, torch.cuda.max_memory_allocated())
+            if _RESET_PEAK:
+                tracemalloc.reset_peak()
+            frame.base_cpu = tracemalloc.get_traced_memory()[0]
+            if gpu_memory:
+                torch.cuda.reset_peak_memory_stats()
+                frame.base_gpu = torch.cuda.memory_allocated()
+        if self.sync_cuda:
+            torch.cuda.current_stream().synchronize()
+        stack.append(frame)
+        frame.start = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            if self.sync_cuda:
+                torch.cuda.current_stream().synchronize()
+            end = time.perf_counter()
+            stack.pop()
+            event = {
+                "name": name,
+                "start_us": (frame.start - self._origin) * 1e6,
+                "dur_us": (end - frame.start) * 1e6,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            if self.memory:
+                frame.peak_cpu = max(frame.peak_cpu, _traced_peak())
+                event["peak_cpu_mb"] = (frame.peak_cpu - frame.base_cpu) / 2**20
+                if gpu_memory:
+                    frame.peak_gpu = max(frame.peak_gpu, torch.cuda.max_memory_allocated())
+                    event["peak_gpu_mb"] = (frame.peak_gpu - frame.base_gpu) / 2**20
+                if stack:
+                    stack[-1].peak_cpu = max(stack[-1].peak_cpu, frame.peak_cpu)
+                    stack[-1].peak_gpu = max(stack[-1].peak_gpu, frame.peak_gpu)
+            self.events.append(event)
+
+    def summary(self):
+        """
+        Aggregate spans by name.
+
+        Returns:
+            dict: name -> count, total_ms, mean_ms, p50_ms, p90_ms, p99_ms, max_ms, histogram_ms
+                (count per upper bucket edge) and, when memory tracing was on, the largest
+                peak_cpu_mb / peak_gpu_mb above the memory in use at span start.
+        """
+        by_name = {}
+        for event in list(self.events):
+            by_name.setdefault(event["name"], []).append(event)
+
+        edges = [str(edge) for edge in HISTOGRAM_BUCKETS_MS] + ["inf"]
+        summary = {}
+        for name, events in by_name.items():
+            durations = np.array([e["dur_us"] for e in events]) / 1000.0
+            histogram = [0] * len(edges)
+            for d in durations:
+                histogram[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, d)] += 1
+            stats = {
+                "count": len(events),
+                "total_ms": float(durations.sum()),
+                "mean_ms": float(durations.mean()),
+                "p50_ms": float(np.percentile(durations, 50)),
+                "p90_ms": float(np.percentile(durations, 90)),
+                "p99_ms": float(np.percentile(durations, 99)),
+                "max_ms": float(durations.max()),
+                "histogram_ms": dict(zip(edges, histogram)),
+            }
+            for key in ("peak_cpu_mb", "peak_gpu_mb"):
+                peaks = [e[key] for e in events if key in e]
+                if peaks:
+                    stats[key] = max(peaks)
+            summary[name] = stats
+        return summary
+
+    def report(self):
+        """
+        Format the summary as one line per span name, sorted by total time.
+
+        Returns:
+            str: Table of count, total, mean, p50, p99 and peak memory per span name.
+        """
+        summary = self.summary()
+        lines = [f"{'span':>28s} {'count':>6s} {'total ms':>10s} {'mean ms':>9s} {'p50 ms':>9s} {'p99 ms':>9s} "
+                 f"{'cpu MB':>8s} {'gpu MB':>8s}"]
+        for name, s in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+            cpu = f"{s['peak_cpu_mb']:8.1f}" if "peak_cpu_mb" in s else f"{'-':>8s}"
+            gpu = f"{s['peak_gpu_mb']:8.1f}" if "peak_gpu_mb" in s else f"{'-':>8s}"
+            lines.append(f"{name:>28s} {s['count']:6d} {s['total_ms']:10.2f} {s['mean_ms']:9.3f} {s['p50_ms']:9.3f} "
+                         f"{s['p99_ms']:9.3f} {cpu} {gpu}")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        """
+        Write the spans in Chrome trace event format (chrome://tracing, ui.perfetto.dev).
+        """
+        pid = os.getpid()
+        trace_events = []
+        for event in list(self.events):
+            args = {k: v if isinstance(v, (int, float, str, bool)) or v is None else repr(v) for k, v in event["args"].items()}
+            for key in ("peak_cpu_mb", "peak_gpu_mb"):
+                if key in event:
+                    args[key] = round(event[key], 3)
+            trace_events.append({"name": event["name"], "cat": event["name"].split(".")[0], "ph": "X",
+                                 "ts": event["start_us"], "dur": event["dur_us"], "pid": pid, "tid": event["tid"],
+                                 "args": args})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def enable(sync_cuda=True, memory=False):
+    _tracer.enable(sync_cuda=sync_cuda, memory=memory)
+
+
+def disable():
+    _tracer.disable()
+
+
+def clear():
+    _tracer.clear()
+
+
+def is_enabled():
+    return _tracer.enabled
+
+
+def span(name, **args):
+    """
+    Context manager recording a span on the global tracer; a no-op while tracing is disabled.
+    """
+    if not _tracer.enabled:
+        return _NULL_SPAN
+    return _tracer.span(name, **args)
+
+
+def traced(name):
+    """
+    Decorator recording every call of the function as a span.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return fn(*args, **kwargs)
+            with _tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    return _tracer.summary()
+
+
+def report():
+    return _tracer.report()
+
+
+def export_chrome_trace(path):
+    _tracer.export_chrome_trace(path)
@@ -7,39 +7,28 @@ import random
 import logging
 import torch
 import numpy as np
-import supervision as sv
 import matplotlib.pyplot as plt
 from PIL import (Image as PILImg, ImageDraw)
+from torchvision.ops import roi_align
+
+from .colormap import colorize
 
 
 def apply_matplotlib_colormap(depth_pil, colormap_name='inferno'):
     """
     Apply a matplotlib colormap to the input depth image.
 
+    The depth is min-max normalized and colored through a cached lookup table (see rkit.colormap).
+
     Args:
         depth_pil (PIL.Image): Input depth map image.
         colormap_name (str): Name of the matplotlib colormap to use. Default is 'inferno'.
 
     Returns:
-        PIL.Image: Image object representing the depth map with colormap.
+        PIL.Image: RGBA image object representing the depth map with colormap.
     """
     try:
-        # Convert PIL image to numpy array
-        depth_array = np.array(depth_pil)
-
-        # Normalize depth values to range [0, 1]
-        depth_normalized = (depth_array - depth_array.min()) / (depth_array.max() - depth_array.min())
-
-        # Create colormap
-        cmap = plt.get_cmap(colormap_name)
-
-        # Apply the colormap to depth values
-        colored_depth = (cmap(depth_normalized) * 255).astype(np.uint8)
-
-        # Convert numpy array to PIL image
-        colored_depth_pil = PILImg.fromarray(colored_depth)
-
-        return colored_depth_pil
+        return PILImg.fromarray(colorize(np.asarray(depth_pil), colormap_name, channels=4))
 
     except Exception as e:
         # Log error
@@ -64,45 +53,116 @@ def file_exists(file_path):
         raise e
 
 
-def crop_images(original_image, bounding_boxes):
+def clip_boxes(boxes, width, height, min_size=1):
     """
-    Crop the input image using the provided bounding boxes.
+    Round boxes outwards to whole pixels, clip them to the image and flag the usable ones.
 
     Parameters:
-    - original_image (PIL.Image): Original input image.
-    - bounding_boxes (list): List of bounding boxes [x_min, y_min, x_max, y_max].
+    - boxes (numpy.ndarray or torch.Tensor): [N, 4] boxes [x_min, y_min, x_max, y_max] in pixels.
+    - width (int): Image width.
+    - height (int): Image height.
+    - min_size (int, optional): Minimum side of a valid clipped box. Default is 1.
 
     Returns:
-    - cropped_images (list): List of cropped images.
-
-    Raises:
-    - ValueError: If the bounding box dimensions are invalid.
+    - boxes: [N, 4] int64 clipped boxes, numpy or torch like the input.
+    - valid: [N] bool, True for finite boxes whose clipped sides are at least min_size.
     """
-    cropped_images = []
-
-    try:
-        for box in bounding_boxes:
-            if len(box) != 4:
-                raise ValueError("Bounding box should have 4 values: [x_min, y_min, x_max, y_max]")
+    if torch.is_tensor(boxes):
+        boxes = boxes.reshape(-1, 4).double()
+        finite = torch.isfinite(boxes).all(dim=1)
+        boxes = torch.cat([boxes[:, :2].floor(), boxes[:, 2:].ceil()], dim=1).nan_to_num(0, 0, 0)
+        limits = torch.tensor([width, height, width, height], dtype=boxes.dtype, device=boxes.device)
+        boxes = torch.minimum(boxes.clamp(min=0), limits).long()
+    else:
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        finite = np.isfinite(boxes).all(axis=1)
+        boxes = np.nan_to_num(np.concatenate([np.floor(boxes[:, :2]), np.ceil(boxes[:, 2:])], axis=1), posinf=0, neginf=0)
+        boxes = np.clip(boxes, 0, [width, height, width, height]).astype(np.int64)
+    valid = finite & (boxes[:, 2] - boxes[:, 0] >= min_size) & (boxes[:, 3] - boxes[:, 1] >= min_size)
+    return boxes, valid
+
+
+def crop_images(image, bounding_boxes, size=None, batched=False, min_size=1, pad_value=0):
+    """
+    Crop the input image using the provided bounding boxes.
 
-            x_min, y_min, x_max, y_max = box
+    Boxes are clipped and validated together (see clip_boxes); invalid boxes are dropped and
+    reported through the returned index. Three output forms:
+    - default: a list of zero-copy views, image[y0:y1, x0:x1] for arrays, image[:, y0:y1, x0:x1] for tensors
+    - batched=True: one [N, C, Hmax, Wmax] tensor on the image's device, padded with pad_value below
+      and right of each crop (channels-last strides for array images)
+    - size=(h, w) or int: one [N, C, h, w] float32 tensor with every crop bilinearly resized
+      (roi_align) to the fixed size, ready for a classifier batch
 
-            # Check if the bounding box dimensions are valid
-            if x_min < 0 or y_min < 0 or x_max <= x_min or y_max <= y_min:
-                raise ValueError("Invalid bounding box dimensions")
+    Parameters:
+    - image: [H, W, C] / [H, W] numpy array, [C, H, W] / [H, W] torch tensor, or PIL image (read as an array).
+    - bounding_boxes: [N, 4] array, tensor or list of boxes [x_min, y_min, x_max, y_max] in pixels.
+    - size (int or tuple, optional): Fixed output size (h, w) of every crop.
+    - batched (bool, optional): Return one padded tensor instead of views. Default is False.
+    - min_size (int, optional): Minimum side of a kept crop. Default is 1.
+    - pad_value (optional): Fill of the padded batch. Default is 0.
 
-            # Crop the image using the bounding box
-            cropped_image = original_image.crop((x_min, y_min, x_max, y_max))
-            cropped_images.append(cropped_image)
+    Returns:
+    - crops: List of views, or a [N, C, h, w] tensor (C is 1 for 2-D images).
+    - boxes: [N, 4] int64 clipped boxes of the kept crops, numpy or torch like bounding_boxes.
+    - index: [N_in] bool, which input boxes were kept.
+    """
+    try:
+        if isinstance(image, PILImg.Image):
+            image = np.asarray(image)
+        is_tensor = torch.is_tensor(image)
+        height, width = (image.shape[-2:] if is_tensor else image.shape[:2])
+
+        if not torch.is_tensor(bounding_boxes):
+            bounding_boxes = np.asarray(bounding_boxes, dtype=np.float64).reshape(-1, 4)
+        boxes, index = clip_boxes(bounding_boxes, width, height, min_size=min_size)
+        boxes = boxes[index]
+
+        if size is None and not batched:
+            if is_tensor:
+                return [image[..., y0:y1, x0:x1] for x0, y0, x1, y1 in boxes.tolist()], boxes, index
+            return [image[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes.tolist()], boxes, index
+
+        if size is not None:
+            # [C, H, W] tensor view of the image
+            chw = image if is_tensor else torch.from_numpy(np.ascontiguousarray(image))
+            if chw.dim() == 2:
+                chw = chw[None]
+            elif not is_tensor:
+                chw = chw.permute(2, 0, 1)
+            size = (size, size) if isinstance(size, int) else tuple(size)
+            rois = torch.as_tensor(boxes, device=chw.device, dtype=torch.float32)
+            rois = torch.cat([torch.zeros_like(rois[:, :1]), rois], dim=1)
+            return roi_align(chw[None].float(), rois, output_size=size, aligned=True), boxes, index
+
+        # copy every crop into one preallocated padded buffer (channels last for arrays)
+        coords = boxes.tolist()
+        max_w = max([x1 - x0 for x0, _, x1, _ in coords], default=0)
+        max_h = max([y1 - y0 for _, y0, _, y1 in coords], default=0)
+        if is_tensor:
+            chw = image if image.dim() == 3 else image[None]
+            crops = torch.full((len(coords), chw.shape[0], max_h, max_w), pad_value, dtype=chw.dtype, device=chw.device)
+            for crop, (x0, y0, x1, y1) in zip(crops, coords):
+                crop[:, :y1 - y0, :x1 - x0] = chw[:, y0:y1, x0:x1]
+            return crops, boxes, index
+
+        hwc = image if image.ndim == 3 else image[..., None]
+        crops = np.full((len(coords), max_h, max_w, hwc.shape[2]), pad_value, dtype=hwc.dtype)
+        for crop, (x0, y0, x1, y1) in zip(crops, coords):
+            crop[:y1 - y0, :x1 - x0] = hwc[y0:y1, x0:x1]
+        return torch.from_numpy(crops).permute(0, 3, 1, 2), boxes, index
 
-    except ValueError as e:
-        print(f"Error in crop_images: {e}")
+    except Exception as e:
+        logging.error(f"Error in crop_images: {e}")
+        raise e
 
 
 def annotate(image_source, boxes, logits, phrases):
     """
     Annotate image with bounding boxes, logits, and phrases.
 
+    Drawn by the calling thread's reusable rkit.renderer.AnnotationRenderer.
+
     Parameters:
     - image_source (PIL.Image): Input image source.
     - boxes (torch.tensor): Bounding boxes in xyxy format.
@@ -112,18 +172,17 @@ def annotate(image_source, boxes, logits, phrases):
     Returns:
     - PIL.Image: Annotated image.
     """
+    from .renderer import default_renderer  # the renderer module imports utils
+
     try:
         boxes = boxes if isinstance(boxes, np.ndarray) else boxes.cpu().numpy()
-        detections = sv.Detections(xyxy=boxes)
         labels = [
             f"{phrase} {logit:.2f}"
             for phrase, logit
             in zip(phrases, logits)
         ]
-        box_annotator = sv.BoxAnnotator()
-        img_pil = PILImg.fromarray(box_annotator.annotate(scene=np.array(image_source), detections=detections, labels=labels))
-        return img_pil
-    
+        return PILImg.fromarray(default_renderer().render(image_source, boxes, labels))
+
     except Exception as e:
         logging.error(f"Error during annotation: {e}")
         raise e
@@ -151,52 +210,190 @@ def draw_mask(mask, draw, random_color=False):
         else:
             color = (30, 144, 255, 153)
 
-        # Get the coordinates of non-zero elements in the mask
-        nonzero_coords = np.transpose(np.nonzero(mask))
-
-        # Draw each non-zero coordinate on the image
-        for coord in nonzero_coords:
-            draw.point(coord[::-1], fill=color)
+        # Paint every mask pixel with one bitmap draw instead of one point per pixel
+        bitmap = PILImg.fromarray(np.asarray(mask).astype(np.uint8) * 255)
+        draw.bitmap((0, 0), bitmap, fill=color)
 
     except Exception as e:
         logging.error(f"Error drawing mask: {e}")
         raise e
 
 
-def overlay_masks(image_pil: PILImg, masks):
+def mask_colors(num_colors, random_color=True, seed=None):
     """
-    Overlay segmentation masks on the input image.
+    Colors for num_colors masks.
 
     Parameters:
-    - image_pil (PIL.Image): The input image as a PIL image.
-    - masks (List[Tensor]): List of segmentation masks as torch Tensors.
+    - num_colors (int): Number of masks.
+    - random_color (bool, optional): Random colors (seeded by seed) or all the default blue. Default is True.
+    - seed (int, optional): Seed for random colors.
 
     Returns:
-    - PIL.Image: The image with overlayed segmentation masks.
+    - numpy.ndarray: [num_colors, 3] uint8 RGB colors.
     """
-    try:
-        mask_image = PILImg.new('RGBA', image_pil.size, color=(0, 0, 0, 0))
-        mask_draw = ImageDraw.Draw(mask_image)
+    if not random_color:
+        return np.tile(np.array([30, 144, 255], dtype=np.uint8), (num_colors, 1))
+    return np.random.default_rng(seed).integers(0, 256, (num_colors, 3), dtype=np.uint8)
+
 
-        for mask in masks:
-            mask = mask if isinstance(masks, np.ndarray) else mask[0].cpu().numpy()
-            draw_mask(mask, mask_draw, random_color=True)
+def _to_mask_stack(masks):
+    """
+    Stack masks given as [N, H, W], [N, 1, H, W] or a list of [H, W] / [1, H, W] arrays or tensors
+    into a [N, H, W] bool tensor on the masks' device. Returns None if there are no masks.
+    """
+    if isinstance(masks, (list, tuple)):
+        if len(masks) == 0:
+            return None
+        masks = [torch.as_tensor(m) for m in masks]
+        masks = torch.stack([m.reshape(m.shape[-2:]).to(masks[0].device) for m in masks])
+    masks = torch.as_tensor(masks)
+    if masks.numel() == 0:
+        return None
+    return masks.reshape(-1, *masks.shape[-2:]).bool()
+
+
+def _overlay_label_map(masks, height, width, boxes=None, device=None):
+    """
+    [H, W] int64 map of the last mask covering each pixel (1..N, 0 for none).
+
+    Dense masks are [N, H, W]; with boxes ([N, 4] xyxy pixels) each mask is a crop of its box's size
+    and is pasted at the box's top-left corner.
+    """
+    if boxes is None:
+        return masks_to_label_map(_to_mask_stack(masks))
+
+    label_map = torch.zeros((height, width), dtype=torch.long, device=device)
+    boxes = torch.as_tensor(boxes).reshape(-1, 4).round().long().tolist()
+    for k, (mask, (x0, y0, _, _)) in enumerate(zip(masks, boxes)):
+        mask = torch.as_tensor(mask).to(device)
+        mask = mask.reshape(mask.shape[-2:]).bool()
+        # clip the crop to the image
+        h, w = mask.shape
+        mx0, my0 = max(0, -x0), max(0, -y0)
+        x1, y1 = min(width, x0 + w), min(height, y0 + h)
+        x0, y0 = max(0, x0), max(0, y0)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        region = label_map[y0:y1, x0:x1]
+        region[mask[my0:my0 + y1 - y0, mx0:mx0 + x1 - x0]] = k + 1
+    return label_map
+
+
+def overlay_label_map(image, label_map, colors=None, alpha=0.6):
+    """
+    Color a label map through a lookup table and alpha-blend it over the image in one operation.
+
+    Parameters:
+    - image (PIL.Image, numpy.ndarray or torch.Tensor): RGB image as PIL, [H, W, 3] uint8 array,
+      or [3, H, W] uint8 tensor.
+    - label_map (numpy.ndarray or torch.Tensor): [H, W] integer labels, 0 for background. Computed on
+      its own device.
+    - colors (array-like, optional): [L, 3] uint8 colors for labels 1..L. Defaults to random colors.
+    - alpha (float, optional): Opacity of the colored labels. Default is 0.6.
+
+    Returns:
+    - The blended image, of the same type as image (tensors stay on the label map's device).
+    """
+    label_map = torch.as_tensor(label_map)
+    device = label_map.device
+    num_labels = int(label_map.max()) if label_map.numel() else 0
+
+    if isinstance(image, PILImg.Image):
+        frame = torch.from_numpy(np.array(image.convert('RGB')))
+    elif isinstance(image, np.ndarray):
+        frame = torch.from_numpy(image)
+    else:
+        frame = image.permute(1, 2, 0)
+    frame = frame.to(device)
+
+    if colors is None:
+        colors = mask_colors(num_labels)
+    lut = torch.zeros((max(num_labels, len(colors)) + 1, 4), dtype=torch.float32, device=device)
+    lut[1:len(colors) + 1, :3] = torch.as_tensor(np.asarray(colors)[:, :3], dtype=torch.float32, device=device)
+    lut[1:, 3] = alpha
+
+    color = lut[label_map.long()]
+    blended = frame.float() * (1 - color[..., 3:]) + color[..., :3] * color[..., 3:]
+    blended = blended.round_().clamp_(0, 255).to(torch.uint8)
+
+    if isinstance(image, PILImg.Image):
+        return PILImg.fromarray(blended.cpu().numpy())
+    if isinstance(image, np.ndarray):
+        return blended.cpu().numpy()
+    return blended.permute(2, 0, 1)
+
+
+def overlay_masks(image_pil: PILImg, masks, boxes=None, colors=None, alpha=0.6):
+    """
+    Overlay segmentation masks on the input image.
+
+    All masks are reduced to one label map (later masks on top), colored through a lookup table
+    and alpha-blended over the frame in a single operation, on the masks' device.
+
+    Parameters:
+    - image_pil (PIL.Image): The input image as a PIL image (a [H, W, 3] array or [3, H, W] tensor also works).
+    - masks: Segmentation masks as a [N, H, W] or [N, 1, H, W] tensor or array, or a list of [1, H, W]
+      / [H, W] masks. With boxes, each mask is a crop of its box's size.
+    - boxes (array-like, optional): [N, 4] xyxy boxes locating cropped masks.
+    - colors (array-like, optional): [N, 3] uint8 mask colors. Defaults to random colors.
+    - alpha (float, optional): Mask opacity. Default is 0.6.
 
-        image_pil = image_pil.convert('RGBA')
-        image_pil.alpha_composite(mask_image)
-        return image_pil.convert('RGB')
+    Returns:
+    - PIL.Image: The image with overlayed segmentation masks (same type as the input image).
+    """
+    try:
+        if len(masks) == 0:
+            return image_pil.convert('RGB') if isinstance(image_pil, PILImg.Image) else image_pil
+        if isinstance(image_pil, PILImg.Image):
+            width, height = image_pil.size
+        else:
+            height, width = image_pil.shape[:2] if isinstance(image_pil, np.ndarray) else image_pil.shape[-2:]
+        device = masks[0].device if torch.is_tensor(masks[0]) else None
+        label_map = _overlay_label_map(masks, height, width, boxes=boxes, device=device)
+        return overlay_label_map(image_pil, label_map, colors=colors, alpha=alpha)
 
     except Exception as e:
         logging.error(f"Error overlaying masks: {e}")
         raise e
 
 
+def masks_to_label_map(masks, scores=None):
+    """
+    Compose stacked bit masks into a label map in one operation.
+
+    Mask k gets label k + 1. Where masks overlap, the higher label wins, or with scores the
+    highest-scoring mask wins. Pixels covered by no mask are 0.
+
+    Args:
+        masks (torch.Tensor): Bit masks of shape [N, H, W], or [B, N, H, W] for a batch of frames.
+        scores (torch.Tensor, optional): Per-mask priorities of shape [N] or [B, N].
+
+    Returns:
+        torch.Tensor: int64 label map of shape [H, W] or [B, H, W], on the masks' device.
+    """
+    masks = torch.as_tensor(masks).bool()
+    num = masks.shape[-3]
+    if num == 0:
+        return torch.zeros(masks.shape[:-3] + masks.shape[-2:], dtype=torch.long, device=masks.device)
+
+    if scores is None:
+        ids = torch.arange(1, num + 1, dtype=torch.int32, device=masks.device).view(num, 1, 1)
+        return torch.where(masks, ids, torch.zeros_like(ids)).amax(dim=-3).long()
+
+    scores = torch.as_tensor(scores, device=masks.device).float()[..., None, None]
+    ranked = torch.where(masks, scores, torch.full_like(scores, float('-inf')))
+    label_map = ranked.argmax(dim=-3) + 1
+    return torch.where(masks.any(dim=-3), label_map, torch.zeros_like(label_map))
+
+
 def combine_masks(gt_masks):
     """
     Combine several bit masks [N, H, W] into a mask [H,W],
     e.g. 8*480*640 tensor becomes a numpy array of 480*640.
     [[1,0,0], [0,1,0]] = > [1,2,0].
 
+    Masks are labelled in reverse order (the last mask gets label 1) and the first mask wins overlaps.
+
     Args:
         gt_masks (torch.Tensor): Tensor of shape [N, H, W] representing multiple bit masks.
 
@@ -205,21 +402,83 @@ def combine_masks(gt_masks):
     """
     try:
         gt_masks = torch.flip(gt_masks, dims=(0,))
-        num, h, w = gt_masks.shape
-        bin_mask = torch.zeros((h, w), device=gt_masks.device)
-        num_instance = len(gt_masks)
+        return masks_to_label_map(gt_masks).to(torch.get_default_dtype())
+
+    except Exception as e:
+        logging.error(f"Error combining masks: {e}")
+        raise e
+
 
-        # if there is not any instance, just return a mask full of 0s.
-        if num_instance == 0:
-            return bin_mask
+def label_depth_ratio(labels, depth, num_labels=None):
+    """
+    Fraction of pixels with valid (positive) depth under every label, with one bincount per batch.
+
+    Args:
+        labels (torch.Tensor): Label map of shape [H, W] or [B, H, W] with non-negative integer labels.
+        depth (torch.Tensor): Depth of the same shape, or a point cloud [B, 3, H, W] / [3, H, W]
+            whose channel 2 is depth.
+        num_labels (int, optional): Largest label; defaults to labels.max().
 
-        for m, object_label in zip(gt_masks, range(1, 1 + num_instance)):
-            label_pos = torch.nonzero(m, as_tuple=True)
-            bin_mask[label_pos] = object_label
-        return bin_mask
+    Returns:
+        torch.Tensor: Ratios of shape [L + 1] or [B, L + 1] indexed by label; labels without pixels get 1.
+    """
+    labels = torch.as_tensor(labels)
+    depth = torch.as_tensor(depth, device=labels.device)
+    if depth.dim() == labels.dim() + 1:
+        depth = depth.select(-3, 2)
+    batched = labels.dim() == 3
+    labels = labels.reshape(-1, *labels.shape[-2:]).long()
+    depth = depth.reshape(labels.shape)
+
+    if num_labels is None:
+        num_labels = int(labels.max()) if labels.numel() else 0
+    bins = num_labels + 1
+    index = (labels + bins * torch.arange(len(labels), device=labels.device).view(-1, 1, 1)).flatten()
+    total = torch.bincount(index, minlength=len(labels) * bins)
+    valid = torch.bincount(index, weights=(depth > 0).flatten().float(), minlength=len(labels) * bins)
+
+    ratio = torch.where(total > 0, valid / total.clamp(min=1), torch.ones_like(valid)).view(len(labels), bins)
+    return ratio if batched else ratio[0]
+
+
+def remap_labels(labels, keep):
+    """
+    Set the labels not kept to 0 with a per-frame lookup table.
+
+    Args:
+        labels (torch.Tensor): Label map of shape [H, W] or [B, H, W] with non-negative integer labels.
+        keep (torch.Tensor): Boolean table of shape [L + 1] or [B, L + 1] indexed by label.
+
+    Returns:
+        torch.Tensor: Label map with the same shape and dtype as labels.
+    """
+    lut = torch.arange(keep.shape[-1], device=labels.device) * keep.to(labels.device)
+    if labels.dim() == 2:
+        return lut[labels.long()].to(labels.dtype)
+    lut = lut.expand(len(labels), -1)
+    flat = labels.long().reshape(len(labels), -1)
+    return torch.gather(lut, 1, flat).view(labels.shape).to(labels.dtype)
+
+
+def filter_labels_depth(labels, depth, threshold):
+    """
+    Remove labels whose fraction of pixels with valid depth is below threshold.
+
+    Args:
+        labels (torch.Tensor): Label map of shape [H, W] or [B, H, W].
+        depth (torch.Tensor): Depth of the same shape, or a point cloud [B, 3, H, W] whose channel 2 is depth.
+        threshold (float): Minimum fraction of pixels with positive depth.
+
+    Returns:
+        torch.Tensor: Filtered label map with the same shape and dtype as labels.
+    """
+    try:
+        keep = label_depth_ratio(labels, depth) >= threshold
+        keep[..., 0] = True
+        return remap_labels(labels, keep)
 
     except Exception as e:
-        logging.error(f"Error combining masks: {e}")
+        logging.error(f"Error filtering labels on depth: {e}")
         raise e
 
 
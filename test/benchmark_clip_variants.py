@@ -0,0 +1,133 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+"""
+Benchmark CLIP backbones for ZeroShotClipPredictor.
+
+For every (variant, precision) pair this records image-encoding latency, memory and top-1 agreement
+with the ViT-L/14 reference on a fixed, seeded set of crops taken from the images in --image_dir.
+
+    python benchmark_clip_variants.py --image_dir imgs/sam2-test/rgb --output clip_benchmark.json
+"""
+
+import os
+import json
+import time
+import random
+import numpy as np
+import torch
+from absl import app, flags, logging
+from PIL import Image as PILImg
+from rkit.perception import ZeroShotClipPredictor
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string("image_dir", "imgs/sam2-test/rgb", "Directory with images to crop from")
+flags.DEFINE_list("variants", ["RN50", "ViT-B/32", "ViT-B/16", "ViT-L/14"], "CLIP variants to benchmark")
+flags.DEFINE_list("precisions", ["fp32", "fp16"], "Precisions to benchmark (fp32, fp16, bf16)")
+flags.DEFINE_string("reference", "ViT-L/14", "Variant whose fp32 top-1 labels are the reference")
+flags.DEFINE_list("labels", ["mug", "bowl", "bottle", "box", "can", "cup", "toy", "tool", "fruit", "table"], "Label set")
+flags.DEFINE_integer("num_crops", 128, "Number of crops in the fixed crop set")
+flags.DEFINE_integer("batch_size", 32, "Image encoder batch size")
+flags.DEFINE_integer("repeats", 5, "Timed repetitions per configuration")
+flags.DEFINE_integer("seed", 0, "Seed for the crop set")
+flags.DEFINE_string("output", "clip_benchmark.json", "Where to write the JSON report")
+
+
+def make_crop_set(image_dir, num_crops, seed):
+    """
+    Build a deterministic list of PIL crops from the images in image_dir.
+    """
+    rng = random.Random(seed)
+    paths = sorted(os.path.join(image_dir, p) for p in os.listdir(image_dir)
+                   if os.path.splitext(p)[-1].lower() in (".jpg", ".jpeg", ".png"))
+    images = [PILImg.open(p).convert("RGB") for p in paths]
+    crops = []
+    for _ in range(num_crops):
+        image = rng.choice(images)
+        w, h = image.size
+        bw, bh = rng.randint(w // 10, w // 2), rng.randint(h // 10, h // 2)
+        x0, y0 = rng.randint(0, w - bw), rng.randint(0, h - bh)
+        crops.append(image.crop((x0, y0, x0 + bw, y0 + bh)))
+    return crops
+
+
+def synchronize(device):
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+def benchmark(variant, precision, crops, labels):
+    """
+    Time encode_images for one configuration and return its stats and top-1 predictions.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+
+    _clip = ZeroShotClipPredictor(max_batch_size=FLAGS.batch_size, variant=variant, precision=precision)
+    param_bytes = sum(p.numel() * p.element_size() for p in _clip.model.parameters())
+
+    # warm-up also fills the text cache, so timings cover the image path only
+    _, indices = _clip.predict(crops, labels)
+
+    latencies = []
+    for _ in range(FLAGS.repeats):
+        synchronize(device)
+        start = time.perf_counter()
+        _clip.predict(crops, labels)
+        synchronize(device)
+        latencies.append(time.perf_counter() - start)
+
+    latencies_ms = np.array(latencies) * 1000
+    stats = {
+        "variant": variant,
+        "precision": precision,
+        "device": device,
+        "num_crops": len(crops),
+        "latency_ms_mean": float(latencies_ms.mean()),
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)),
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)),
+        "latency_ms_per_crop": float(latencies_ms.mean() / len(crops)),
+        "param_mb": param_bytes / 2**20,
+        "peak_cuda_mb": torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else None,
+    }
+    del _clip
+    return stats, indices.cpu().numpy()
+
+
+def main(argv):
+    crops = make_crop_set(FLAGS.image_dir, FLAGS.num_crops, FLAGS.seed)
+    logging.info(f"Benchmarking on {len(crops)} crops from {FLAGS.image_dir}")
+
+    logging.info(f"Reference: {FLAGS.reference} fp32")
+    reference_stats, reference_top1 = benchmark(FLAGS.reference, "fp32", crops, FLAGS.labels)
+    reference_stats["top1_agreement"] = 1.0
+    results = [reference_stats]
+
+    for variant in FLAGS.variants:
+        for precision in FLAGS.precisions:
+            if variant == FLAGS.reference and precision == "fp32":
+                continue
+            logging.info(f"Benchmarking {variant} {precision}")
+            try:
+                stats, top1 = benchmark(variant, precision, crops, FLAGS.labels)
+            except RuntimeError as e:
+                # e.g. fp16 kernels missing on CPU
+                logging.warning(f"Skipping {variant} {precision}: {e}")
+                continue
+            stats["top1_agreement"] = float(np.mean(top1 == reference_top1))
+            results.append(stats)
+
+    for r in results:
+        logging.info("{variant:>16s} {precision:>5s}  {latency_ms_per_crop:7.2f} ms/crop  "
+                     "{param_mb:7.1f} MB params  agreement {top1_agreement:.3f}".format(**r))
+
+    with open(FLAGS.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Wrote {FLAGS.output}")
+
+
+if __name__ == "__main__":
+    app.run(main)
@@ -9,7 +9,8 @@ import numpy as np
 import message_filters
 from PIL import Image as PILImg
 from sensor_msgs.msg import Image, CameraInfo
-from rkit.utils import annotate, overlay_masks, combine_masks, filter_large_boxes
+from rkit.utils import annotate, overlay_masks, combine_masks
+from rkit.box_pruning import BoxPruner
 from rkit.perception import GroundingDINOObjectPredictor, SegmentAnythingPredictor
 lock = threading.Lock()
 
@@ -38,6 +39,8 @@ class ImageListener:
         self.text_prompt =  'objects'          
         self.gdino = GroundingDINOObjectPredictor()
         self.SAM = SegmentAnythingPredictor()     
+        # beyond the old area filter: cross-phrase NMS (IoU 0.7) and boxes with under half valid depth are dropped
+        self.pruner = BoxPruner(max_area=0.5, min_depth_valid=0.5)
 
         # initialize a node
         rospy.init_node("seg_rgb")
@@ -134,12 +137,11 @@ class ImageListener:
         h = im.shape[0]
         image_pil_bboxes = self.gdino.bbox_to_scaled_xyxy(bboxes, w, h)
 
+        # prune large, duplicate (NMS) and mostly depth-less boxes before decoding their masks
+        image_pil_bboxes, index = self.pruner(image_pil_bboxes, gdino_conf, w, h, depth=depth_img)
+
         # logging.info("SAM prediction")
         image_pil_bboxes, masks = self.SAM.predict(img_pil, image_pil_bboxes)
-
-        # filter large boxes
-        image_pil_bboxes, index = filter_large_boxes(image_pil_bboxes, w, h, threshold=0.5)
-        masks = masks[index]
         mask = combine_masks(masks[:, 0, :, :]).cpu().numpy()
         gdino_conf = gdino_conf[index]
         ind = np.where(index)[0]
@@ -183,6 +185,7 @@ class ImageListener:
 
         num_object = len(np.unique(label)) - 1
         print('%d objects' % (num_object))
+        print(self.pruner.report())
 
         # publish segmentation images
         rgb_msg = ros_numpy.msgify(Image, im_label, 'rgb8')
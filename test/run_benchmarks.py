@@ -0,0 +1,64 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+"""
+Run the rkit benchmark suite (synthetic inputs, stand-in networks; no checkpoints needed) and
+compare it against a stored baseline. Exits with status 1 if any benchmark regressed, or was
+measured in the baseline but now fails or is skipped.
+
+    python run_benchmarks.py --output bench.json --baseline bench_baseline.json
+    python run_benchmarks.py --groups utils,evaluation --update_baseline
+"""
+
+import os
+import sys
+from absl import app, flags, logging
+from rkit.benchmark import default_suite, compare, save_results, load_results
+
+FLAGS = flags.FLAGS
+flags.DEFINE_list("groups", [], "Groups to run (utils, evaluation, munkres, predictors, datasets); all if empty")
+flags.DEFINE_list("names", [], "Only run benchmarks whose name contains one of these strings")
+flags.DEFINE_string("device", "cpu", "Device for predictor benchmarks")
+flags.DEFINE_integer("repeat", 20, "Timed calls per benchmark")
+flags.DEFINE_integer("warmup", 2, "Untimed calls per benchmark")
+flags.DEFINE_integer("seed", 0, "Seed for the synthetic inputs")
+flags.DEFINE_string("output", "bench.json", "Where to write the results")
+flags.DEFINE_string("baseline", "bench_baseline.json", "Baseline results to compare against")
+flags.DEFINE_float("tolerance", 0.2, "Allowed relative p50 latency increase")
+flags.DEFINE_float("memory_tolerance", 0.2, "Allowed relative peak memory increase")
+flags.DEFINE_float("min_delta_ms", 0.1, "Latency increases below this are treated as noise")
+flags.DEFINE_bool("update_baseline", False, "Overwrite the baseline with these results")
+
+
+def main(argv):
+    suite = default_suite(device=FLAGS.device, seed=FLAGS.seed)
+    try:
+        results = suite.run(groups=FLAGS.groups, names=FLAGS.names, repeat=FLAGS.repeat, warmup=FLAGS.warmup)
+    finally:
+        suite.cleanup()
+    save_results(results, FLAGS.output)
+    logging.info(f"Wrote {FLAGS.output}")
+
+    if FLAGS.update_baseline or not os.path.exists(FLAGS.baseline):
+        save_results(results, FLAGS.baseline)
+        logging.info(f"Wrote baseline {FLAGS.baseline}")
+        return
+
+    report = compare(results, load_results(FLAGS.baseline), FLAGS.tolerance, FLAGS.memory_tolerance,
+                     FLAGS.min_delta_ms)
+    for row in report["rows"]:
+        logging.info("{flag} {name:>40s}: {baseline:9.3f} -> {current:9.3f} ms (x{ratio:.2f}, memory x{memory_ratio:.2f})".format(
+            flag="REGRESSED" if row["regressed"] else "         ", **row))
+    for name in report["failed"]:
+        stats = results["results"][name]
+        logging.error(f"REGRESSED {name:>40s}: measured in baseline, now {stats.get('error') or stats.get('skipped')}")
+    if report["missing"]:
+        logging.warning(f"Not run but in baseline: {report['missing']}")
+    if report["regressions"]:
+        logging.error(f"{len(report['regressions'])} regressions: {report['regressions']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    app.run(main)
@@ -12,37 +12,18 @@ from PIL import Image as PILImg
 from matplotlib import pyplot as plt
 
 from rkit.datasets.factory import get_dataset
-from rkit.perception import GroundingDINOObjectPredictor, SAM2Predictor
-from rkit.utils import annotate, overlay_masks, combine_masks, filter_large_boxes
-from rkit.evaluation import multilabel_metrics
-
-
-# filter labels on zero depths
-def filter_labels_depth(labels, depth, threshold):
-    labels_new = labels.clone()
-    for i in range(labels.shape[0]):
-        label = labels[i]
-        mask_ids = torch.unique(label)
-        if mask_ids[0] == 0:
-            mask_ids = mask_ids[1:]
-
-        for index, mask_id in enumerate(mask_ids):
-            mask = (label == mask_id).float()
-            roi_depth = depth[i, 2][label == mask_id]
-            depth_percentage = torch.sum(roi_depth > 0).float() / torch.sum(mask)
-            if depth_percentage < threshold:
-                labels_new[i][label == mask_id] = 0
-
-    return labels_new
+from rkit.utils import annotate, overlay_masks, combine_masks, filter_large_boxes, filter_labels_depth
+from rkit.evaluation_runner import EvaluationRunner, sequence_name
 
 
 # test a dataset
-def test_segnet(test_loader, gdino, SAM2, output_dir, vis=False):
+def test_segnet(test_loader, gdino, SAM2, output_dir, vis=False, eval_workers=None):
 
     text_prompt =  'objects'
     epoch_size = len(test_loader)
 
-    metrics_all = []
+    # metrics are computed in worker processes while inference continues here
+    runner = EvaluationRunner(num_workers=eval_workers, callback=lambda index, metrics: print(metrics))
     metrics_all_refined = []
     for i, sample in enumerate(test_loader):
 
@@ -85,9 +66,7 @@ def test_segnet(test_loader, gdino, SAM2, output_dir, vis=False):
         # evaluation
         gt = sample['label'].squeeze().numpy()
         prediction = out_label.squeeze().detach().cpu().numpy()
-        metrics = multilabel_metrics(prediction, gt)
-        metrics_all.append(metrics)
-        print(metrics)
+        runner.submit(prediction, gt, sequence=sequence_name(sample['filename']))
 
         if vis:
             gdino_conf = gdino_conf[index]
@@ -117,18 +96,14 @@ def test_segnet(test_loader, gdino, SAM2, output_dir, vis=False):
         batch_time = time.time() - end
         print('[%d/%d], batch time %.2f' % (i, epoch_size, batch_time))
 
-    # sum the values with same keys
+    # wait for the last frames; averages of the streamed per-frame metrics
     print('========================================================')
-    result = {}
-    num = len(metrics_all)
+    accumulator = runner.finish()
+    result = accumulator.mean()
+    num = accumulator.num
     print('%d images' % num)
     print('========================================================')
-    for metrics in metrics_all:
-        for k in metrics.keys():
-            result[k] = result.get(k, 0) + metrics[k]
-
     for k in sorted(result.keys()):
-        result[k] /= num
         print('%s: %f' % (k, result[k]))
 
     print('%.6f' % (result['Objects Precision']))
@@ -138,6 +113,7 @@ def test_segnet(test_loader, gdino, SAM2, output_dir, vis=False):
     print('%.6f' % (result['Boundary Recall']))
     print('%.6f' % (result['Boundary F-measure']))
     print('%.6f' % (result['obj_detected_075_percentage']))
+    print(accumulator.report())
 
     print('========================================================')
     print(result)
@@ -171,6 +147,9 @@ def parse_args():
         action="store_true",
         help="Whether to ask user for confirmation before important steps and VIZ things",
     )
+    parser.add_argument('--eval_workers', dest='eval_workers',
+                        help='processes computing metrics (default: cpu count - 1, 0: inline)',
+                        default=None, type=int)
     parser.add_argument(
         "--shuffle",
         action="store_true",
@@ -192,6 +171,9 @@ def parse_args():
 
 
 if __name__ == '__main__':
+    # imported here, not at module level: evaluation workers are spawned and re-import this module,
+    # and rkit.perception builds and installs dependencies on import
+    from rkit.perception import GroundingDINOObjectPredictor, SAM2Predictor
     args = parse_args()
 
     print('Called with args:')
@@ -216,4 +198,4 @@ if __name__ == '__main__':
         os.makedirs(output_dir)
 
     # test network
-    test_segnet(dataloader, gdino, SAM2, output_dir, args.vis)
+    test_segnet(dataloader, gdino, SAM2, output_dir, args.vis, args.eval_workers)
@@ -0,0 +1,40 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import os
+from absl import (app, logging)
+from PIL import Image as PILImg
+from rkit.perception import DepthAnythingPredictor
+
+
+def main(argv):
+    # Directory with the video frames
+    video_dir = argv[0]
+
+    try:
+        logging.info("Initialize depth predictor")
+        depth_any = DepthAnythingPredictor(precision='fp16')
+
+        frame_names = sorted(p for p in os.listdir(video_dir) if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+        frames = (PILImg.open(os.path.join(video_dir, p)).convert("RGB") for p in frame_names)
+
+        logging.info("Depth Anything sequence prediction")
+        depth, stats = depth_any.predict_sequence(
+            frames,
+            output_path="depth_sequence.npy",
+            num_frames=len(frame_names),
+            batch_size=8,
+            change_threshold=0.01,
+            output_dtype='float16',
+        )
+        logging.info(f"depth.shape: {depth.shape}, dtype: {depth.dtype}, stats: {stats}")
+
+    except Exception as e:
+        # Handle unexpected errors
+        print(f"An unexpected error occurred: {e}")
+
+
+if __name__ == "__main__":
+    # Run the main function with the frame directory
+    app.run(main, ['imgs/sam2-test/rgb'])
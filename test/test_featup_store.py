@@ -0,0 +1,39 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import os
+from absl import app, logging
+from PIL import Image as PILImg
+from rkit.perception import FeatUp
+from rkit.feature_store import FeatureStore
+
+
+def main(argv):
+    # Directory with the input images
+    image_dir = argv[0]
+
+    try:
+        logging.info("Initialize FeatUp and open the feature store")
+        pix_encoder = FeatUp(backbone_alias="dinov2", input_size=252)
+        store = FeatureStore("results/featup_store", pix_encoder.backbone_alias, pix_encoder.input_size)
+
+        image_names = sorted(p for p in os.listdir(image_dir) if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+        images = [PILImg.open(os.path.join(image_dir, p)).convert("RGB") for p in image_names]
+
+        logging.info("Extract features for images not in the store yet")
+        keys = store.populate(pix_encoder, images, batch_size=4)
+
+        logging.info("Read back features (zero-copy memory-mapped views)")
+        features = store.get(keys[0])
+        region = store.get(keys[0], region=(0, 64, 0, 64))
+        logging.info(f"{len(store)} images stored, features.shape: {features.shape}, region.shape: {region.shape}")
+
+    except Exception as e:
+        # Handle unexpected errors
+        print(f"An unexpected error occurred: {e}")
+
+
+if __name__ == "__main__":
+    # Run the main function with the image directory
+    app.run(main, ['imgs/sam2-test/rgb'])
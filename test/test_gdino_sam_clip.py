@@ -2,6 +2,7 @@
 # Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
 # Please check the licenses of the respective works utilized here before using this script.
 
+import torch
 import numpy as np
 from absl import app, logging
 from PIL import Image as PILImg
@@ -38,11 +39,9 @@ def main(argv):
 
         overlay_masks(image_pil,masks)
 
-        logging.info("Crop images based on bounding boxes")
-        cropped_bbox_imgs = list(map(lambda bbox: (image_pil.crop(bbox.int().numpy())), image_pil_bboxes))
-        
-        logging.info("CLIP: Predict labels for cropped images")
-        clip_conf, idx = _clip.predict(cropped_bbox_imgs, text_prompt.split(','))
+        logging.info("CLIP: Predict labels for boxes (batched device-side crops, background blanked by SAM masks)")
+        image_tensor = torch.from_numpy(np.array(image_pil)).permute(2, 0, 1)
+        clip_conf, idx = _clip.classify_boxes(image_tensor, image_pil_bboxes, text_prompt.split(','), masks=masks)
         
         logging.info("Scale the original image for visualization")
         scaled_image_pil = gdino.image_transform_for_vis(image_pil)
@@ -0,0 +1,42 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+from absl import app, logging
+from PIL import Image as PILImg
+from rkit.perception import GroundingDINOObjectPredictor, SegmentAnythingPredictor, ZeroShotClipPredictor
+from rkit.pipeline import GroundedSegmentationPipeline
+from rkit.utils import annotate, overlay_masks
+
+
+def main(argv):
+    # Path to the input image
+    image_path = argv[0]
+    text_prompt = 'objects'
+    clip_prompts = ['mug', 'bowl', 'bottle', 'box', 'can']
+
+    try:
+        logging.info("Initialize the grounded segmentation pipeline")
+        pipeline = GroundedSegmentationPipeline(
+            GroundingDINOObjectPredictor(), SegmentAnythingPredictor(), ZeroShotClipPredictor(variant='ViT-B/16')
+        )
+
+        logging.info("Open the image and convert to RGB format")
+        image_pil = PILImg.open(image_path).convert("RGB")
+
+        logging.info("Run detection, segmentation, label-map composition and CLIP relabelling")
+        result = pipeline.predict(image_pil, text_prompt, clip_prompts=clip_prompts, return_masks=True)
+        logging.info("Stage timings:\n" + pipeline.timing_report())
+
+        bbox_annotated_pil = annotate(overlay_masks(image_pil, result['masks']), result['boxes'],
+                                      result['label_scores'], result['labels'])
+        bbox_annotated_pil.show()
+
+    except Exception as e:
+        # Handle unexpected errors
+        print(f"An unexpected error occurred: {e}")
+
+
+if __name__ == "__main__":
+    # Run the main function with the input image path
+    app.run(main, ['imgs/irvl-clutter-test.png'])
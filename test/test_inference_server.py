@@ -0,0 +1,45 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+from concurrent.futures import ThreadPoolExecutor
+from absl import app, logging
+from PIL import Image as PILImg
+from rkit.server import InferenceClient, decode_array
+
+
+def main(argv):
+    # Path to the input image; expects `python -m rkit.server --models gdino sam clip depth` running
+    image_path = argv[0]
+    clip_prompts = ['mug', 'bowl', 'bottle', 'box', 'can']
+
+    try:
+        client = InferenceClient("http://127.0.0.1:8080")
+        image_pil = PILImg.open(image_path).convert("RGB")
+
+        logging.info("GroundingDINO -> SAM through the server")
+        detections = client.predict('gdino', image_pil, text_prompt='objects')
+        masks = decode_array(client.predict('sam', image_pil, boxes=detections['boxes'])['masks'])
+        logging.info(f"{len(detections['boxes'])} boxes, masks.shape: {masks.shape}")
+
+        logging.info("8 concurrent GroundingDINO and SAM requests: one detector forward, one SAM image embedding")
+        with ThreadPoolExecutor(8) as pool:
+            batched = list(pool.map(lambda _: client.predict('gdino', image_pil, text_prompt='objects'), range(8)))
+            list(pool.map(lambda _: client.predict('sam', image_pil, boxes=detections['boxes']), range(8)))
+        logging.info(f"{[len(d['boxes']) for d in batched]} boxes per request")
+
+        logging.info("16 concurrent CLIP and depth requests, merged into batches by the server")
+        with ThreadPoolExecutor(16) as pool:
+            labels = list(pool.map(lambda _: client.predict('clip', image_pil, text_prompts=clip_prompts), range(16)))
+            depths = list(pool.map(lambda _: client.predict('depth', image_pil), range(16)))
+        logging.info(f"CLIP: {labels[0]}, depth.shape: {decode_array(depths[0]['depth']).shape}")
+        logging.info(f"Server metrics: {client.metrics()}")
+
+    except Exception as e:
+        # Handle unexpected errors
+        print(f"An unexpected error occurred: {e}")
+
+
+if __name__ == "__main__":
+    # Run the main function with the input image path
+    app.run(main, ['imgs/irvl-clutter-test.png'])
@@ -0,0 +1,41 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import os
+import time
+from absl import app, logging
+from PIL import Image as PILImg
+from rkit.perception import GroundingDINOObjectPredictor, SegmentAnythingPredictor
+from rkit.pipeline import GroundedSegmentationPipeline, PipelinedExecutor
+
+
+def main(argv):
+    # Directory with the video frames
+    video_dir = argv[0]
+
+    try:
+        logging.info("Initialize the grounded segmentation pipeline")
+        pipeline = GroundedSegmentationPipeline(GroundingDINOObjectPredictor(), SegmentAnythingPredictor())
+
+        frame_names = sorted(p for p in os.listdir(video_dir) if p.lower().endswith(('.jpg', '.jpeg', '.png')))
+        frames = (PILImg.open(os.path.join(video_dir, p)).convert("RGB") for p in frame_names)
+
+        logging.info("Detect frame t+1 while frame t is segmented and frame t-1 post-processed")
+        executor = PipelinedExecutor(pipeline.stages(text_prompt='objects'), queue_size=2)
+        start = time.time()
+        for frame_name, result in zip(frame_names, executor.map(frames)):
+            logging.info(f"{frame_name}: {len(result['boxes'])} objects")
+        elapsed = time.time() - start
+
+        logging.info(f"{len(frame_names) / elapsed:.2f} frames/s")
+        logging.info("Stage busy time:\n" + executor.throughput_report())
+
+    except Exception as e:
+        # Handle unexpected errors
+        print(f"An unexpected error occurred: {e}")
+
+
+if __name__ == "__main__":
+    # Run the main function with the frame directory
+    app.run(main, ['imgs/sam2-test/rgb'])
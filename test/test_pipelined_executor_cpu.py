@@ -0,0 +1,108 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import time
+import random
+import threading
+from absl import app, logging
+from rkit.pipeline import PipelinedExecutor
+
+
+def jittered(fn, max_delay=0.005):
+    """
+    Stub stage: sleep a random time, then apply fn, so stages finish out of step.
+    """
+    def stage(item):
+        time.sleep(random.uniform(0, max_delay))
+        return fn(item)
+    return stage
+
+
+def run_with_timeout(fn, timeout=10.0):
+    """
+    Run fn in a thread; fail instead of hanging if it does not return in time.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome["value"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "executor hung"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def test_ordering():
+    executor = PipelinedExecutor([("add", jittered(lambda x: x + 1)), ("double", jittered(lambda x: 2 * x)),
+                                  ("str", jittered(str))], queue_size=2, use_cuda_streams=False)
+    outputs = run_with_timeout(lambda: list(executor.map(range(100))))
+    assert outputs == [str(2 * (x + 1)) for x in range(100)], outputs
+    assert set(executor.busy_time) == {"add", "double", "str"}
+
+
+def test_stage_error():
+    def fail_on_five(x):
+        if x == 5:
+            raise ValueError("bad item 5")
+        return x
+
+    executor = PipelinedExecutor([jittered(fail_on_five), jittered(lambda x: x)], use_cuda_streams=False)
+    outputs = []
+
+    def consume():
+        for y in executor.map(range(20)):
+            outputs.append(y)
+
+    try:
+        run_with_timeout(consume)
+        raise AssertionError("stage error was not raised")
+    except ValueError as e:
+        assert str(e) == "bad item 5"
+    assert outputs == [0, 1, 2, 3, 4], outputs
+
+
+def test_input_error():
+    def frames():
+        yield 0
+        yield 1
+        raise IOError("unreadable frame")
+
+    executor = PipelinedExecutor([jittered(lambda x: x)], use_cuda_streams=False)
+    outputs = []
+
+    def consume():
+        for y in executor.map(frames()):
+            outputs.append(y)
+
+    try:
+        run_with_timeout(consume)
+        raise AssertionError("input error was not raised")
+    except IOError as e:
+        assert str(e) == "unreadable frame"
+    assert outputs == [0, 1], outputs
+
+
+def test_early_stop():
+    executor = PipelinedExecutor([jittered(lambda x: x)], queue_size=1, use_cuda_streams=False)
+    outputs = run_with_timeout(lambda: [y for y, _ in zip(executor.map(iter(range(10 ** 6))), range(3))])
+    assert outputs == [0, 1, 2], outputs
+
+
+def main(argv):
+    random.seed(0)
+    for test in (test_ordering, test_stage_error, test_input_error, test_early_stop):
+        test()
+        logging.info(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    # CPU only: stub stages, no checkpoints needed
+    app.run(main)
@@ -0,0 +1,82 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import time
+import json
+import numpy as np
+from absl import app, flags, logging
+from rkit.server import DynamicBatcher, DeadlineExceeded
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('bulk_requests', 600, 'Bulk requests queued at once (a relabelling job).')
+flags.DEFINE_integer('realtime_requests', 40, 'Realtime requests issued while the bulk job runs.')
+flags.DEFINE_float('realtime_interval_ms', 25.0, 'Gap between realtime requests.')
+flags.DEFINE_float('realtime_deadline_ms', 100.0, 'Deadline attached to realtime requests.')
+flags.DEFINE_float('bulk_deadline_ms', 1500.0, 'Deadline attached to bulk requests.')
+flags.DEFINE_float('batch_overhead_ms', 10.0, 'Synthetic model cost per batch.')
+flags.DEFINE_float('item_cost_ms', 2.0, 'Synthetic model cost per item.')
+
+
+def synthetic_model(payloads):
+    """
+    Stand-in for a predictor: fixed per-batch cost plus a per-item cost. Every result carries the
+    time the batch finished, so client latencies do not depend on when futures are observed.
+    """
+    time.sleep((FLAGS.batch_overhead_ms + FLAGS.item_cost_ms * len(payloads)) / 1000.0)
+    finished_at = time.perf_counter()
+    return [{"id": payload["id"], "finished_at": finished_at} for payload in payloads]
+
+
+def summarize(futures, submitted):
+    """
+    Client-side latency percentiles and drop count of a list of (future, submit time) pairs.
+    """
+    latencies, dropped = [], 0
+    for future, start in zip(futures, submitted):
+        try:
+            latencies.append(future.result()["finished_at"] - start)
+        except DeadlineExceeded:
+            dropped += 1
+    latencies = 1000.0 * np.array(latencies)
+    p50, p95 = (np.percentile(latencies, [50, 95]) if len(latencies) else (0.0, 0.0))
+    return {"completed": len(latencies), "dropped": dropped, "p50_ms": round(p50, 2), "p95_ms": round(p95, 2)}
+
+
+def main(argv):
+    batcher = DynamicBatcher("synthetic", synthetic_model, max_batch_size=8, max_wait_ms=5.0)
+
+    def submit(payload, lane, deadline_ms):
+        start = time.perf_counter()
+        return batcher.submit(payload, lane, deadline_ms), start
+
+    logging.info(f"Queue {FLAGS.bulk_requests} bulk requests")
+    bulk = [submit({"id": i}, "bulk", FLAGS.bulk_deadline_ms) for i in range(FLAGS.bulk_requests)]
+
+    logging.info(f"Issue {FLAGS.realtime_requests} realtime requests every {FLAGS.realtime_interval_ms} ms")
+    realtime = []
+    for i in range(FLAGS.realtime_requests):
+        realtime.append(submit({"id": -i}, "realtime", FLAGS.realtime_deadline_ms))
+        time.sleep(FLAGS.realtime_interval_ms / 1000.0)
+    bulk_backlog = batcher.metrics()["lanes"]["bulk"]["queue_depth"]
+
+    report = {
+        "realtime": summarize(*zip(*realtime)),
+        "bulk": summarize(*zip(*bulk)),
+        "server": batcher.metrics(),
+    }
+    batcher.close()
+    print(json.dumps(report, indent=2))
+
+    assert bulk_backlog > 0, "bulk lane drained before the realtime requests ended; raise --bulk_requests"
+    assert report["realtime"]["p95_ms"] < FLAGS.realtime_deadline_ms, \
+        f"realtime p95 {report['realtime']['p95_ms']} ms over its {FLAGS.realtime_deadline_ms} ms deadline"
+    assert report["bulk"]["dropped"] > 0, "no bulk request expired; lower --bulk_deadline_ms"
+    for lane in ("realtime", "bulk"):
+        assert report["server"]["lanes"][lane]["dropped"] == report[lane]["dropped"], \
+            f"{lane}: {report[lane]['dropped']} requests expired, drop metric says {report['server']['lanes'][lane]['dropped']}"
+    logging.info("realtime p95 within its deadline under bulk load; expired bulk requests counted as dropped")
+
+
+if __name__ == "__main__":
+    app.run(main)
@@ -0,0 +1,53 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+import time
+import numpy as np
+from absl import app, logging
+from rkit.benchmark import synthetic_scene
+from rkit.evaluation import seg2bmap
+
+
+def reference_resample(b, width, height):
+    """
+    The per-pixel loop of the original MATLAB seg2bmap (0-indexed): boundary pixel (y, x) of an
+    [h, w] map is set at (floor(y * height / h), floor(x * width / w)).
+    """
+    h, w = b.shape
+    bmap = np.zeros((height, width), dtype=bool)
+    for x in range(w):
+        for y in range(h):
+            if b[y, x]:
+                bmap[int(np.floor(y * height / h)), int(np.floor(x * width / w))] = True
+    return bmap
+
+
+def main(argv):
+    rng = np.random.default_rng(0)
+    sizes = [(640, 480), (320, 240), (213, 160), (160, 120), (64, 48), (4, 3)]
+
+    # no try/except: a mismatch must fail the script
+    for num_objects in (1, 10, 30):
+        label = synthetic_scene(rng, 480, 640, num_objects)["label"]
+        masks = [label > 0, label == 1, rng.random(label.shape) < 0.3]
+        for mask in masks:
+            full = seg2bmap(mask)
+            for width, height in sizes:
+                expected = reference_resample(full, width, height)
+                assert np.array_equal(seg2bmap(mask, width, height), expected), (num_objects, width, height)
+    logging.info("seg2bmap resampling matches the reference loop")
+
+    mask = synthetic_scene(rng, 480, 640, 30)["label"] > 0
+    start = time.perf_counter()
+    reference_resample(seg2bmap(mask), 320, 240)
+    reference_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for _ in range(100):
+        seg2bmap(mask, 320, 240)
+    vectorized_ms = (time.perf_counter() - start) * 10
+    logging.info(f"640x480 -> 320x240: reference loop {reference_ms:.1f} ms, seg2bmap {vectorized_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    app.run(main)
@@ -0,0 +1,45 @@
+# (c) 2024 Jishnu Jaykumar Padalunkal.
+# Work done while being at the Intelligent Robotics and Vision Lab at the University of Texas, Dallas
+# Please check the licenses of the respective works utilized here before using this script.
+
+from absl import app, logging
+from PIL import Image as PILImg
+from rkit import tracing
+from rkit.perception import GroundingDINOObjectPredictor, SegmentAnythingPredictor, ZeroShotClipPredictor, DepthAnythingPredictor
+from rkit.pipeline import GroundedSegmentationPipeline
+
+
+def main(argv):
+    # Path to the input image
+    image_path = argv[0]
+    clip_prompts = ['mug', 'bowl', 'bottle', 'box', 'can']
+
+    try:
+        pipeline = GroundedSegmentationPipeline(
+            GroundingDINOObjectPredictor(), SegmentAnythingPredictor(), ZeroShotClipPredictor(variant='ViT-B/16')
+        )
+        depth_any = DepthAnythingPredictor()
+        image_pil = PILImg.open(image_path).convert("RGB")
+
+        # warm-up outside the trace
+        pipeline.predict(image_pil, clip_prompts=clip_prompts)
+
+        logging.info("Trace 10 frames of segmentation + depth")
+        tracing.enable(memory=True)
+        for _ in range(10):
+            pipeline.predict(image_pil, clip_prompts=clip_prompts)
+            depth_any.predict(image_pil, raw=True)
+        tracing.disable()
+
+        logging.info("Per-span summary:\n" + tracing.report())
+        tracing.export_chrome_trace("rkit_trace.json")
+        logging.info("Wrote rkit_trace.json (open in chrome://tracing or ui.perfetto.dev)")
+
+    except Exception as e:
+        # Handle unexpected errors
+        print(f"An unexpected error occurred: {e}")
+
+
+if __name__ == "__main__":
+    # Run the main function with the input image path
+    app.run(main, ['imgs/irvl-clutter-test.png'])